@@ -1,8 +1,76 @@
+import hashlib
+import json
+
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
+from django.utils.functional import cached_property
 
 # Register your models here.
 
-from .models import Mood, Intervention, Feedback, Tag
+from . import caching, search, signals
+from .models import Mood, MoodTag, Intervention, InterventionScore, Feedback, Tag
+
+EXACT_COUNT_BELOW = 10000  # estimates under this are replaced by a real count
+COUNT_TIMEOUT = 60
+
+
+def count_scope(model):
+    """Cache scope of a model's changelist counts"""
+    return f'admin_count:{model._meta.label_lower}'
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Changelist paginator that doesn't COUNT(*) millions of rows on every
+    page view. On PostgreSQL the count is the planner's estimate
+    (pg_class.reltuples for a whole table, EXPLAIN for a filtered list),
+    exact only when that is small. Elsewhere it is the exact count,
+    cached for COUNT_TIMEOUT seconds, so it may lag writes made outside
+    the admin; LargeTableAdmin retires the cached counts after its own
+    actions.
+    """
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql':
+            estimate = self.estimate(queryset, connection)
+            return estimate if estimate >= EXACT_COUNT_BELOW else queryset.count()
+        sql, params = queryset.query.sql_with_params()
+        key = caching.make_key(
+            'admin_count', hashlib.md5(f'{sql}{params}'.encode(), usedforsecurity=False).hexdigest(),
+            scope=count_scope(queryset.model),
+        )
+        return caching.get_or_set(key, queryset.count, timeout=COUNT_TIMEOUT)
+
+    @staticmethod
+    def estimate(queryset, connection):
+        with connection.cursor() as cursor:
+            if not queryset.query.where:
+                # -1 until the table is first analyzed.
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [queryset.model._meta.db_table])
+                return cursor.fetchone()[0]
+            sql, params = queryset.query.sql_with_params()
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return int(plan[0]['Plan']['Plan Rows'])
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Changelists that stay fast on tables with millions of rows"""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False  # skips a second, unfiltered COUNT(*)
+
+    def response_action(self, request, queryset):
+        # Bulk actions (delete_selected included) must not leave the old total on the next page.
+        response = super().response_action(request, queryset)
+        caching.bump(count_scope(self.model))
+        return response
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
@@ -10,27 +78,75 @@ class TagAdmin(admin.ModelAdmin):
     search_fields = ['name']
 
 @admin.register(Intervention)
-class InterventionAdmin(admin.ModelAdmin):
+class InterventionAdmin(LargeTableAdmin):
     list_display = ['title', 'submitted_by', 'is_active', 'created_at', 'success_score', 'total_votes']
     list_filter = ['is_active', 'created_at']
     search_fields = ['title', 'description']
-    
+    actions = ['activate', 'deactivate', 'recompute_scores']
+
+    def get_queryset(self, request):
+        # Scores come from the joined InterventionScore row; missing rows read as no votes.
+        return super().get_queryset(request).annotate(
+            success_score=Coalesce(F('score_summary__score'), Value(0.0)),
+            total_votes=Coalesce(F('score_summary__total_votes'), Value(0)),
+        )
+
     def success_score(self, obj):
-        return obj.get_success_score()
+        return obj.success_score
     success_score.short_description = 'Success Score'
-    
+    success_score.admin_order_field = 'success_score'
+
     def total_votes(self, obj):
-        return obj.get_total_votes()
+        return obj.total_votes
     total_votes.short_description = 'Total Votes'
+    total_votes.admin_order_field = 'total_votes'
+
+    @admin.action(description='Activate selected interventions')
+    def activate(self, request, queryset):
+        updated = queryset.update(is_active=True)
+        signals.interventions_changed()
+        self.message_user(request, f'Activated {updated} interventions.')
+
+    @admin.action(description='Deactivate selected interventions')
+    def deactivate(self, request, queryset):
+        updated = queryset.update(is_active=False)
+        signals.interventions_changed()
+        self.message_user(request, f'Deactivated {updated} interventions.')
+
+    @admin.action(description='Recompute scores from feedback')
+    def recompute_scores(self, request, queryset):
+        ids = list(queryset.values_list('id', flat=True))
+        # One grouped count over Feedback and one upsert, however many are selected.
+        rebuilt = InterventionScore.rebuild(intervention_ids=queryset.order_by().values('id'))
+        signals.scores_changed(ids)
+        self.message_user(request, f'Recomputed scores for {rebuilt} interventions.')
+
+class MoodTagInline(admin.TabularInline):
+    model = MoodTag
+    autocomplete_fields = ['tag']
+    extra = 1
 
 @admin.register(Mood)
-class MoodAdmin(admin.ModelAdmin):
-    list_display = ['emotion', 'intensity', 'timestamp', 'suggested_intervention']
+class MoodAdmin(LargeTableAdmin):
+    list_display = ['emotion', 'intensity', 'timestamp', 'user', 'suggested_intervention']
     list_filter = ['emotion', 'timestamp']
+    list_select_related = ['user', 'suggested_intervention']
+    date_hierarchy = 'timestamp'
     search_fields = ['note']
-    filter_horizontal = ['tags']
+    autocomplete_fields = ['user', 'suggested_intervention']
+    inlines = [MoodTagInline]
+
+    def get_search_results(self, request, queryset, search_term):
+        # Through the full-text index (core.search) rather than LIKE '%term%'.
+        if not search_term.strip():
+            return queryset, False
+        return search.matching(queryset, search_term), False
 
 @admin.register(Feedback)
-class FeedbackAdmin(admin.ModelAdmin):
+class FeedbackAdmin(LargeTableAdmin):
     list_display = ['intervention', 'result', 'created_at']
-    list_filter = ['result', 'created_at']
\ No newline at end of file
+    list_filter = ['result', 'created_at']
+    list_select_related = ['intervention']
+    date_hierarchy = 'created_at'
+    autocomplete_fields = ['intervention']
+    raw_id_fields = ['mood']
@@ -0,0 +1,172 @@
+"""
+Helpers for the JSON mood API: keyset pagination, field selection and
+conditional-request validators.
+
+Pages are keyed on (timestamp, id), newest first, or on (updated_at, id),
+oldest first, when a client syncs with `since`. Both orders are served by
+an index (see Mood.Meta.indexes), so page N costs the same as page 1.
+Deleted moods are synced from their MoodTombstone rows, keyed on
+(deleted_at, id) the same way.
+"""
+import base64
+import binascii
+import hashlib
+import json
+from functools import wraps
+
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date, quote_etag
+
+from .models import MoodTag, Profile
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+API_FIELDS = ['id', 'timestamp', 'updated_at', 'emotion', 'intensity', 'note', 'tags']
+DEFAULT_FIELDS = ['id', 'timestamp', 'emotion', 'intensity', 'tags']
+
+# key: (sort field, descending)
+ORDERINGS = {
+    'timestamp': ('timestamp', True),
+    'updated_at': ('updated_at', False),
+    'deleted_at': ('deleted_at', False),
+}
+MOOD_VALUES = ('id', 'timestamp', 'updated_at', 'emotion', 'intensity', 'note')
+
+
+class APIError(ValueError):
+    """Bad request parameters; the message is safe to show to the client"""
+
+
+def parse_limit(value):
+    if not value:
+        return DEFAULT_LIMIT
+    try:
+        limit = int(value)
+    except ValueError:
+        raise APIError('limit must be an integer')
+    if not 1 <= limit <= MAX_LIMIT:
+        raise APIError(f'limit must be between 1 and {MAX_LIMIT}')
+    return limit
+
+
+def parse_fields(value):
+    if not value:
+        return DEFAULT_FIELDS
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in API_FIELDS]
+    if unknown or not fields:
+        raise APIError(f"unknown field(s): {', '.join(unknown) or '(none)'}; choose from {', '.join(API_FIELDS)}")
+    return fields
+
+
+def parse_since(value):
+    if not value:
+        return None
+    try:
+        since = parse_datetime(value)
+    except ValueError:
+        since = None
+    if since is None:
+        raise APIError('since must be an ISO 8601 datetime')
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    return since
+
+
+def encode_cursor(key, value, pk):
+    raw = json.dumps([key, value.isoformat(), pk]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, key):
+    """(value, pk) of an opaque cursor issued for the same ordering key"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        cursor_key, value, pk = json.loads(raw)
+        value = parse_datetime(value)
+    except (binascii.Error, ValueError, TypeError):
+        raise APIError('invalid cursor')
+    if cursor_key != key or value is None or not isinstance(pk, int):
+        raise APIError('invalid cursor')
+    return value, pk
+
+
+async def apaginate(moods, key, cursor, limit, values=MOOD_VALUES):
+    """
+    One page of a Mood (or MoodTombstone) queryset ordered by (key, id).
+    Returns (rows as dicts with the `values` fields, next cursor or None).
+    """
+    field, descending = ORDERINGS[key]
+    if cursor:
+        value, pk = decode_cursor(cursor, key)
+        op = 'lt' if descending else 'gt'
+        moods = moods.filter(
+            Q(**{f'{field}__{op}': value}) | Q(**{field: value, f'id__{op}': pk})
+        )
+    prefix = '-' if descending else ''
+    rows = [
+        row async for row in moods.order_by(f'{prefix}{field}', f'{prefix}id').values(*values)[:limit + 1]
+    ]
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(key, rows[-1][field], rows[-1]['id'])
+
+
+async def aserialize(rows, fields):
+    """Project page rows onto the requested fields, fetching tags in one query"""
+    tags = {}
+    if 'tags' in fields and rows:
+        links = MoodTag.objects.filter(
+            mood_id__in=[row['id'] for row in rows]
+        ).order_by('tag__name').values_list('mood_id', 'tag__name')
+        async for mood_id, name in links:
+            tags.setdefault(mood_id, []).append(name)
+
+    data = []
+    for row in rows:
+        item = {}
+        for field in fields:
+            if field == 'tags':
+                item['tags'] = tags.get(row['id'], [])
+            elif field in ('timestamp', 'updated_at'):
+                item[field] = row[field].isoformat()
+            else:
+                item[field] = row[field]
+        data.append(item)
+    return data
+
+
+def moods_etag(user_id, changed, query):
+    """Changes whenever the user's moods do, or the query asks for something else"""
+    key = f"{user_id}:{changed.isoformat() if changed else '-'}:{query}"
+    return hashlib.md5(key.encode(), usedforsecurity=False).hexdigest()
+
+
+def moods_condition(view):
+    """
+    ETag/Last-Modified handling for the async mood API, as
+    django.views.decorators.http.condition() does for sync views (it calls
+    its validators synchronously, so they could not query the database).
+    Both validators come from Profile.moods_changed_at, read once.
+    """
+    @wraps(view)
+    async def wrapped(request, *args, **kwargs):
+        user = await request.auser()
+        changed = await Profile.objects.filter(user_id=user.pk).values_list(
+            'moods_changed_at', flat=True
+        ).afirst()
+        etag = quote_etag(moods_etag(user.pk, changed, request.GET.urlencode()))
+        last_modified = int(changed.timestamp()) if changed else None
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = await view(request, *args, **kwargs)
+        if request.method in ('GET', 'HEAD'):
+            if last_modified and not response.has_header('Last-Modified'):
+                response.headers['Last-Modified'] = http_date(last_modified)
+            response.headers.setdefault('ETag', etag)
+        return response
+    return wrapped
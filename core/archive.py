@@ -0,0 +1,124 @@
+"""
+Archival tier for moods older than the hot window.
+
+Mood keeps the current month and the settings.MOOD_HOT_MONTHS - 1 before
+it. `manage.py archive_moods` moves each older UTC calendar month into a
+gzipped NDJSON file in settings.MOOD_ARCHIVE_DIR (the NDJSON export
+format, with user_id), records it as a MoodArchive row and deletes the
+rows, so Mood and its indexes only grow with the hot window.
+
+Aggregates are left as they are: the archived days' rollups and the
+heatmap cells keep counting the moods, and rebuilds leave the archived
+part alone (see rollups.archived_through() and HeatmapCell.archived_count).
+Recent-window views such as the weekly report and comparison read the
+rollups of hot days only.
+
+Moods with feedback stay in Mood: votes point at them and community
+scores are built from the votes.
+
+This is an archive table scheme that behaves the same on SQLite and
+PostgreSQL. Native PostgreSQL partitioning would need the timestamp in
+Mood's primary key, which the foreign keys from MoodTag and Feedback
+can't reference.
+"""
+import datetime
+import gzip
+import hashlib
+import os
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from . import exports, heatmap, signals
+from .models import Mood, MoodArchive
+
+DELETE_BATCH = 2000
+
+
+def month_bounds(month):
+    """[start, end) of a UTC calendar month as aware datetimes"""
+    start = datetime.datetime.combine(month, datetime.time.min, tzinfo=datetime.timezone.utc)
+    end = datetime.datetime.combine(MoodArchive.month_start(month, 1), datetime.time.min, tzinfo=datetime.timezone.utc)
+    return start, end
+
+
+def archivable(moods):
+    return moods.filter(feedback__isnull=True)
+
+
+def cold_months(cutoff=None):
+    """{first day of month: moods to archive} for the months before the hot window"""
+    moods = archivable(Mood.objects.filter(timestamp__lt=cutoff or MoodArchive.hot_cutoff()))
+    rows = moods.order_by().annotate(
+        month=TruncMonth('timestamp', tzinfo=datetime.timezone.utc),
+    ).values('month').annotate(n=Count('id')).order_by('month')
+    return {row['month'].date(): row['n'] for row in rows}
+
+
+def _digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.file_digest(f, 'sha256').hexdigest()
+
+
+def archive_month(month, directory=None):
+    """
+    Move one month's archivable moods into a new archive file.
+    Returns the MoodArchive, or None when there was nothing to move.
+    """
+    directory = Path(directory or settings.MOOD_ARCHIVE_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    start, end = month_bounds(month)
+    moods = archivable(Mood.objects.filter(timestamp__gte=start, timestamp__lt=end)).order_by('id')
+
+    # Months can be archived more than once (e.g. after a backfill), one file per run.
+    path = directory / f'moods-{month:%Y-%m}-{timezone.now():%Y%m%d%H%M%S}.ndjson.gz'
+    partial = path.with_name(path.name + '.part')
+    ids = []
+    per_user = {}
+    with gzip.open(partial, 'wt', encoding='utf-8') as f:
+        for chunk in exports.iter_mood_chunks(moods):
+            f.write(''.join(exports.ndjson_line(mood, datetime.timezone.utc, include_user=True) for mood in chunk))
+            for mood in chunk:
+                ids.append(mood['id'])
+                if mood['user_id'] is not None:
+                    per_user.setdefault(mood['user_id'], []).append(
+                        (mood['timestamp'], mood['emotion'], mood['intensity'])
+                    )
+    if not ids:
+        partial.unlink()
+        return None
+    os.replace(partial, path)
+
+    try:
+        with transaction.atomic():
+            archive = MoodArchive.objects.create(
+                month=month, path=str(path), mood_count=len(ids),
+                size=path.stat().st_size, sha256=_digest(path),
+            )
+            for user_id, rows in per_user.items():
+                heatmap.archive_moods(user_id, rows)
+            with signals.archiving():
+                for i in range(0, len(ids), DELETE_BATCH):
+                    Mood.objects.filter(pk__in=ids[i:i + DELETE_BATCH]).delete()
+    except BaseException:
+        path.unlink(missing_ok=True)
+        raise
+
+    for user_id in per_user:
+        signals.moods_changed(user_id)
+    return archive
+
+
+def verify():
+    """(archive, problem) for every archive file that is missing or altered"""
+    problems = []
+    for archive in MoodArchive.objects.all():
+        if not os.path.exists(archive.path):
+            problems.append((archive, 'missing'))
+        elif _digest(archive.path) != archive.sha256:
+            problems.append((archive, 'checksum mismatch'))
+    return problems
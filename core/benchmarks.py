@@ -0,0 +1,360 @@
+"""
+Performance harness: synthetic data plus per-view query/latency/memory
+measurements for every route in core.urls.
+
+Used by the benchmark_views management command and by the budget tests in
+core/tests.py. Seeding bypasses model signals for speed and rebuilds the
+derived tables once at the end.
+"""
+import json
+import random
+import statistics
+import threading
+import time
+import tracemalloc
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import OperationalError, connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import caching, heatmap, insights, recommender, rollups, sampler, search
+from . import urls as core_urls
+from .models import Feedback, Intervention, InterventionScore, Mood, MoodTag, Tag
+
+SCALES = {
+    '1k': 1_000,
+    '100k': 100_000,
+    '10m': 10_000_000,
+}
+
+BATCH_SIZE = 5_000
+TAG_NAMES = [
+    'work', 'home', 'exercise', 'family', 'friends', 'commute', 'sleep', 'study',
+    'meeting', 'deadline', 'weekend', 'outdoors', 'music', 'reading', 'gaming',
+    'cooking', 'travel', 'therapy', 'meditation', 'shopping',
+]
+# Note vocabulary, most common first; words are drawn with Zipf weights so
+# searches hit a mix of very common and rare terms, as in real journals.
+NOTE_WORDS = (
+    'today feel tired work slept good long day bad morning better really talked friend walk '
+    'stress meeting family anxious evening headache coffee calm run lunch weekend rain deadline '
+    'call mother project dinner gym proud lonely argument presentation nap sunshine therapy '
+    'breathing journal promotion exam garden concert hike dentist insomnia migraine birthday '
+    'volunteer yoga podcast painting piano marathon museum sourdough kayak'
+).split()
+NOTE_WEIGHTS = [1 / rank for rank in range(1, len(NOTE_WORDS) + 1)]
+EMOTIONS = [value for value, label in Mood.EMOTION_CHOICES]
+RESULTS = [value for value, label in Feedback.RESULT_CHOICES]
+
+BENCHMARK_PASSWORD = 'benchmark-password'
+
+
+def seed(moods, users=10, interventions=50, days=730, seed_value=0, stdout=None):
+    """
+    Create `users` users sharing `moods` moods spread over the last `days`
+    days, 0-3 tags per mood and feedback on roughly one mood in five.
+    Returns the list of created users; the first one is the heaviest logger.
+    """
+    rng = random.Random(seed_value)
+    now = timezone.now()
+
+    created_users = [
+        User.objects.create_user(f'bench{i}', password=BENCHMARK_PASSWORD)
+        for i in range(users)
+    ]
+    Tag.objects.bulk_create([Tag(name=name) for name in TAG_NAMES], ignore_conflicts=True)
+    tag_ids = list(Tag.objects.filter(name__in=TAG_NAMES).values_list('id', flat=True))
+    intervention_ids = [
+        intervention.pk for intervention in Intervention.objects.bulk_create([
+            Intervention(title=f'Benchmark intervention {i}', description='Synthetic', submitted_by='Benchmark')
+            for i in range(interventions)
+        ])
+    ]
+
+    # The first user logs about half of everything so per-user views see real volume.
+    weights = [users] + [1] * (users - 1)
+    remaining = moods
+    while remaining > 0:
+        batch = min(BATCH_SIZE, remaining)
+        remaining -= batch
+        rows = []
+        for _ in range(batch):
+            rows.append(Mood(
+                user=rng.choices(created_users, weights)[0],
+                emotion=rng.choice(EMOTIONS),
+                intensity=rng.randint(1, 10),
+                note=' '.join(rng.choices(NOTE_WORDS, NOTE_WEIGHTS, k=rng.randint(4, 30))) if rng.random() < 0.3 else None,
+                timestamp=now - timedelta(seconds=rng.randint(0, days * 86400)),
+                suggested_intervention_id=rng.choice(intervention_ids),
+            ))
+        created = Mood.objects.bulk_create(rows)
+
+        links = []
+        feedback = []
+        for mood in created:
+            for tag_id in rng.sample(tag_ids, rng.randint(0, 3)):
+                links.append(MoodTag(mood_id=mood.pk, tag_id=tag_id))
+            if rng.random() < 0.2:
+                feedback.append(Feedback(
+                    mood_id=mood.pk,
+                    intervention_id=mood.suggested_intervention_id,
+                    result=rng.choice(RESULTS),
+                ))
+        MoodTag.objects.bulk_create(links, batch_size=BATCH_SIZE)
+        Feedback.objects.bulk_create(feedback, batch_size=BATCH_SIZE)
+        if stdout:
+            stdout.write(f'  seeded {moods - remaining}/{moods} moods')
+
+    for user in created_users:
+        heatmap.rebuild_cube(user.pk)
+        rollups.rebuild_user(user.pk)
+        insights.refresh_user(user.pk)
+        caching.bump_user(user.pk)
+    InterventionScore.rebuild()
+    caching.bump(caching.INTERVENTIONS)
+    sampler.invalidate()
+    recommender.invalidate()
+    return created_users
+
+
+def discover_routes(user):
+    """
+    (name, path) for every route in core.urls, with URL arguments filled
+    from the user's own data. delete_mood gets a fresh mood per request
+    and logout logs the client back in (see _request).
+    """
+    mood = Mood.objects.filter(user=user).order_by('-timestamp').first()
+    routes = []
+    for pattern in core_urls.urlpatterns:
+        kwargs = {}
+        if 'mood_id' in pattern.pattern.converters:
+            kwargs['mood_id'] = mood.pk if mood else 0
+        routes.append((pattern.name, reverse(pattern.name, kwargs=kwargs)))
+    return routes
+
+
+def _prepare(name, path, user):
+    """Path to request, creating a disposable mood for destructive routes"""
+    if name == 'delete_mood':
+        mood = Mood.objects.create(user=user, emotion='neutral', intensity=5)
+        return reverse(name, kwargs={'mood_id': mood.pk})
+    return path
+
+
+def _request(client, path):
+    response = client.get(path)
+    if response.streaming:
+        for chunk in response.streaming_content:
+            pass
+    return response
+
+
+def _finish(client, name, user):
+    if name == 'logout':
+        client.force_login(user)
+
+
+def measure(client, user, routes=None, repeat=20):
+    """
+    Per route: status, query count, p50/p95 latency in ms and peak
+    traced memory in KiB. Memory is taken in a separate pass because
+    tracemalloc distorts timings.
+    """
+    results = {}
+    for name, path in routes or discover_routes(user):
+        # Warm caches and lazy imports so the first request is not counted.
+        _request(client, _prepare(name, path, user))
+        _finish(client, name, user)
+
+        timings = []
+        queries = 0
+        status = None
+        for _ in range(repeat):
+            request_path = _prepare(name, path, user)
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                response = _request(client, request_path)
+                timings.append((time.perf_counter() - start) * 1000)
+            _finish(client, name, user)
+            status = response.status_code
+            queries = max(queries, len(ctx.captured_queries))
+
+        request_path = _prepare(name, path, user)
+        tracemalloc.start()
+        _request(client, request_path)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        _finish(client, name, user)
+
+        timings.sort()
+        results[name] = {
+            'path': path,
+            'status': status,
+            'queries': queries,
+            'p50_ms': round(statistics.median(timings), 2),
+            'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 2),
+            'peak_kib': round(peak / 1024, 1),
+        }
+    return results
+
+
+def _percentiles(timings):
+    timings = sorted(timings)
+    if not timings:
+        return {'p50_ms': None, 'p95_ms': None, 'p99_ms': None}
+    return {
+        'p50_ms': round(statistics.median(timings), 2),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 2),
+        'p99_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.99))], 2),
+    }
+
+
+def _write_mood(user_id, tag_ids, rng):
+    # Same shape as a logged mood: the row, its tags and every signal-maintained aggregate.
+    with transaction.atomic():
+        mood = Mood.objects.create(user_id=user_id, emotion=rng.choice(EMOTIONS), intensity=rng.randint(1, 10))
+        mood.tags.set(rng.sample(tag_ids, rng.randint(0, 3)))
+
+
+def _read_dashboard(user_id, today):
+    # The dashboard's per-user reads: recent moods and the 7-day trend.
+    list(Mood.objects.filter(user_id=user_id).order_by('-timestamp')[:10])
+    list(rollups.get_rollups(user_id, start=today - timedelta(days=6)))
+
+
+def measure_database(users, writers=8, readers=8, duration=10.0):
+    """
+    Concurrent load on the configured database: `writers` threads logging
+    moods and `readers` threads running the dashboard's reads, each on
+    its own connection, for `duration` seconds. Returns write throughput,
+    failed writes (e.g. "database is locked") and latency percentiles.
+    """
+    user_ids = [user.pk for user in users]
+    tag_ids = list(Tag.objects.filter(name__in=TAG_NAMES).values_list('id', flat=True))
+    today = timezone.localdate()
+    results = {'write': [], 'read': [], 'write_errors': 0, 'read_errors': 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker(kind, seed_value):
+        rng = random.Random(seed_value)
+        timings = []
+        errors = 0
+        try:
+            while time.monotonic() < deadline:
+                user_id = rng.choice(user_ids)
+                start = time.perf_counter()
+                try:
+                    if kind == 'write':
+                        _write_mood(user_id, tag_ids, rng)
+                    else:
+                        _read_dashboard(user_id, today)
+                except OperationalError:
+                    errors += 1
+                    continue
+                timings.append((time.perf_counter() - start) * 1000)
+        finally:
+            connection.close()
+        with lock:
+            results[kind].extend(timings)
+            results[f'{kind}_errors'] += errors
+
+    threads = [threading.Thread(target=worker, args=('write', i)) for i in range(writers)]
+    threads += [threading.Thread(target=worker, args=('read', writers + i)) for i in range(readers)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    return {
+        'vendor': connection.vendor,
+        'writes': len(results['write']),
+        'write_errors': results['write_errors'],
+        'writes_per_s': round(len(results['write']) / elapsed, 1),
+        'write': _percentiles(results['write']),
+        'reads': len(results['read']),
+        'read_errors': results['read_errors'],
+        'reads_per_s': round(len(results['read']) / elapsed, 1),
+        'read': _percentiles(results['read']),
+    }
+
+
+SEARCH_QUERIES = {
+    'common word': 'work',
+    'rare word': 'kayak',
+    'two words': 'tired headache',
+    'prefix': 'mig*',
+}
+
+
+def measure_search(user, repeat=20):
+    """
+    Per query in SEARCH_QUERIES: matches for the user and p50/p95 ms for
+    the first page from core.search, and for the LIKE scan the admin
+    search runs (icontains on every word: a count, then the newest page).
+    """
+    results = {}
+    for label, query in SEARCH_QUERIES.items():
+        def indexed():
+            return search.search(user.pk, query)
+
+        def scan():
+            moods = Mood.objects.filter(user=user)
+            for term, prefix in search.parse_query(query):
+                moods = moods.filter(note__icontains=term)
+            return moods.count(), list(moods.order_by('-pk')[:search.PAGE_SIZE])
+
+        row = {'query': query}
+        for kind, run in (('index', indexed), ('like', scan)):
+            run()  # warm up
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                run()
+                timings.append((time.perf_counter() - start) * 1000)
+            p = _percentiles(timings)
+            row[kind] = {'p50_ms': p['p50_ms'], 'p95_ms': p['p95_ms']}
+        moods = Mood.objects.filter(user=user)
+        for term, prefix in search.parse_query(query):
+            moods = moods.filter(note__icontains=term)
+        row['matches'] = moods.count()
+        results[label] = row
+    return results
+
+
+def load_baseline(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(path, results, meta):
+    with open(path, 'w') as f:
+        json.dump({'meta': meta, 'views': results}, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def compare(results, baseline, tolerance=0.5, metrics=('queries', 'p95_ms', 'peak_kib')):
+    """
+    Budget violations as human-readable strings. Query counts must not
+    grow at all; latency and memory may grow by `tolerance` (0.5 = 50%)
+    to absorb machine noise.
+    """
+    violations = []
+    for name, budget in baseline['views'].items():
+        current = results.get(name)
+        if current is None:
+            continue
+        if 'queries' in metrics and current['queries'] > budget['queries']:
+            violations.append(f"{name}: {current['queries']} queries (budget {budget['queries']})")
+        for metric in ('p95_ms', 'peak_kib'):
+            if metric not in metrics:
+                continue
+            limit = budget[metric] * (1 + tolerance)
+            if current[metric] > limit:
+                violations.append(f"{name}: {metric} {current[metric]} (budget {limit:.1f})")
+    return violations
@@ -0,0 +1,156 @@
+"""
+Versioned cache keys, a stampede guard and cached page fragments.
+
+Keys are built from a scope's version: every user has one, bumped on
+each mood write (see core.signals.moods_changed), and the community
+intervention rankings share one bumped on votes and intervention edits.
+Nothing is deleted on a write; stale entries are simply no longer read
+and expire on their own.
+
+On a miss, get_or_set() takes a lock with cache.add() (atomic on every
+backend), so when many requests miss together one computes the value
+and the rest wait briefly for it instead of all hitting the database.
+"""
+import asyncio
+import hashlib
+import time
+from functools import wraps
+
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.safestring import mark_safe
+
+FRAGMENT_TIMEOUT = 60 * 10
+PAGE_TIMEOUT = 60 * 5
+LOCK_TIMEOUT = 30  # a crashed computation stops blocking others after this long
+WAIT_TIMEOUT = 5  # how long a miss waits on another request's computation
+WAIT_INTERVAL = 0.05
+
+INTERVENTIONS = 'interventions'  # scope of the community intervention rankings
+TAGS = 'tags'  # scope of tag names, bumped when one is renamed or deleted (see core.tags)
+COMMUNITY = 'community'  # scope of the community aggregates, bumped after each merge (see core.community)
+
+_missing = object()
+
+
+def version_key(scope):
+    return f'version:{scope}'
+
+
+def get_version(scope):
+    """Current version of a scope, starting one if there is none"""
+    key = version_key(scope)
+    version = cache.get(key)
+    if version is None:
+        # Fresh versions are timestamps, so an evicted version never comes back.
+        version = time.time_ns()
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def bump(scope):
+    cache.set(version_key(scope), time.time_ns(), None)
+
+
+def user_scope(user_id):
+    return f'user:{user_id}'
+
+
+def bump_user(user_id):
+    """Retire everything cached for a user (called on every mood write)"""
+    bump(user_scope(user_id))
+
+
+def make_key(name, *parts, scope=None):
+    if scope is not None:
+        parts = (f'{scope}@{get_version(scope)}',) + parts
+    return ':'.join([name, *map(str, parts)])
+
+
+def user_key(name, user_id, *parts):
+    return make_key(name, *parts, scope=user_scope(user_id))
+
+
+def get_or_set(key, compute, timeout=FRAGMENT_TIMEOUT, should_cache=None):
+    """
+    Cached value of key, else compute() and cache it. Concurrent misses
+    wait up to WAIT_TIMEOUT for the first one's result rather than
+    computing it again. Values failing should_cache(value) are returned
+    but not stored.
+    """
+    value = cache.get(key, _missing)
+    if value is not _missing:
+        return value
+
+    lock = f'{key}:lock'
+    locked = cache.add(lock, 1, LOCK_TIMEOUT)
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    while not locked and time.monotonic() < deadline:
+        time.sleep(WAIT_INTERVAL)
+        value = cache.get(key, _missing)
+        if value is not _missing:
+            return value
+        locked = cache.add(lock, 1, LOCK_TIMEOUT)
+
+    try:
+        value = compute()
+        if should_cache is None or should_cache(value):
+            cache.set(key, value, timeout)
+    finally:
+        if locked:
+            cache.delete(lock)
+    return value
+
+
+async def aget_or_set(key, compute, timeout=FRAGMENT_TIMEOUT):
+    """get_or_set() for async callers; compute is a coroutine function"""
+    value = await cache.aget(key, _missing)
+    if value is not _missing:
+        return value
+
+    lock = f'{key}:lock'
+    locked = await cache.aadd(lock, 1, LOCK_TIMEOUT)
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    while not locked and time.monotonic() < deadline:
+        await asyncio.sleep(WAIT_INTERVAL)
+        value = await cache.aget(key, _missing)
+        if value is not _missing:
+            return value
+        locked = await cache.aadd(lock, 1, LOCK_TIMEOUT)
+
+    try:
+        value = await compute()
+        await cache.aset(key, value, timeout)
+    finally:
+        if locked:
+            await cache.adelete(lock)
+    return value
+
+
+def fragment(key, template_name, get_context, timeout=FRAGMENT_TIMEOUT):
+    """Rendered template_name cached under key; get_context() only runs on a miss"""
+    html = get_or_set(key, lambda: render_to_string(template_name, get_context()), timeout)
+    return mark_safe(html)
+
+
+def cache_public_page(scope=None, timeout=PAGE_TIMEOUT):
+    """
+    Serve anonymous GET requests for a view from the cache, keyed on the
+    full path, the active timezone and the scope's version. Logged-in
+    users see their own navigation, so they always get a fresh render.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+                return view(request, *args, **kwargs)
+            path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+            key = make_key('page', view.__name__, path, timezone.get_current_timezone_name(), scope=scope)
+            return get_or_set(
+                key, lambda: view(request, *args, **kwargs), timeout,
+                should_cache=lambda response: response.status_code == 200 and not response.cookies,
+            )
+        return wrapped
+    return decorator
@@ -0,0 +1,325 @@
+"""
+Anonymized community aggregates: day x hour x emotion cubes over every
+user's moods, one for all moods and one per tag.
+
+Every new mood queues a CommunityPending row in its own transaction
+(see queue()). `manage.py refresh_community`, run on a schedule, merges
+the queued moods into CommunityCell as per-cell deltas, a batch per
+transaction, and deletes their rows. A mood is queued exactly when it
+commits, however long after its created_at that is, so none are skipped.
+A run costs what was logged since the last one, not the size of Mood,
+and the public community page reads at most
+7 * 24 * len(EMOTION_CHOICES) cells of one cube.
+
+Cells hold counts and sums only. A cell, or a sum of cells, is shown
+once settings.COMMUNITY_MIN_USERS different users contributed to it;
+each cell tracks keyed hashes of just that many users, so a single
+heavy logger never makes a cell visible alone. Totals and averages
+only take in shown cells, so a hidden one can't be worked out by
+subtracting the shown ones from them.
+
+Merging only sees new moods: later edits, deletes, tag changes and
+timezone changes leave the merged counts as they were. Deleting a user
+takes their moods and hash back out (see forget_user()).
+`refresh_community --rebuild` recounts the moods still in Mood (archived
+moods are no longer there to count).
+"""
+import hashlib
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from . import caching, heatmap
+from .models import CommunityCell, CommunityCheckpoint, CommunityPending, Mood, MoodTag, Tag
+from .timezones import get_user_timezones
+
+# A batch rewrites every cell it touches, up to the whole of each cube, so big batches amortize that.
+BATCH_SIZE = 20000
+REBUILD_BATCH_SIZE = 200000
+TAG_LOOKUP_SIZE = 1000
+DELETE_BATCH = 2000
+POPULAR_TAGS = 20
+EMOTIONS = [value for value, label in Mood.EMOTION_CHOICES]
+
+
+def contributor(user_id):
+    """Keyed hash standing in for a user in CommunityCell.contributors"""
+    key = settings.SECRET_KEY.encode()[:64]
+    return hashlib.blake2b(str(user_id).encode(), key=key, digest_size=8).hexdigest()
+
+
+def _union(lists, limit):
+    seen = []
+    for contributors in lists:
+        for who in contributors:
+            if who not in seen:
+                seen.append(who)
+                if len(seen) >= limit:
+                    return seen
+    return seen
+
+
+def _mood_tags(mood_ids):
+    tags = {}
+    for i in range(0, len(mood_ids), TAG_LOOKUP_SIZE):
+        links = MoodTag.objects.filter(mood_id__in=mood_ids[i:i + TAG_LOOKUP_SIZE]).values_list('mood_id', 'tag_id')
+        for mood_id, tag_id in links:
+            tags.setdefault(mood_id, []).append(tag_id)
+    return tags
+
+
+def _apply(deltas, forget=None):
+    """
+    Add {(tag id or None, weekday, hour, emotion): [n, intensity, contributors]}
+    to the cells. With forget, that contributor hash is also dropped from
+    every cell, and cells left without moods are deleted.
+    """
+    k = settings.COMMUNITY_MIN_USERS
+    tag_ids = {key[0] for key in deltas}
+    scope = Q(tag_id__in=tag_ids - {None})
+    if None in tag_ids:
+        scope |= Q(tag__isnull=True)
+    if forget:
+        scope |= Q(contributors__icontains=forget)
+    current = {
+        (tag_id, weekday, hour, emotion): (pk, count, intensity_sum, seen)
+        for pk, tag_id, weekday, hour, emotion, count, intensity_sum, seen in CommunityCell.objects.filter(
+            scope
+        ).values_list('pk', 'tag_id', 'weekday', 'hour', 'emotion', 'count', 'intensity_sum', 'contributors')
+    }
+    if forget:
+        for key, (pk, count, intensity_sum, seen) in current.items():
+            if forget in seen:
+                deltas.setdefault(key, [0, 0, set()])
+    stale, cells = [], []
+    for key, (n, total, contributors) in deltas.items():
+        pk, count, intensity_sum, seen = current.get(key, (None, 0, 0, []))
+        if pk is not None:
+            stale.append(pk)
+        if forget:
+            seen = [who for who in seen if who != forget]
+        if count + n <= 0:
+            continue
+        cells.append(CommunityCell(
+            tag_id=key[0], weekday=key[1], hour=key[2], emotion=key[3],
+            count=count + n, intensity_sum=max(intensity_sum + total, 0),
+            contributors=seen if len(seen) >= k else _union([seen, contributors], k),
+        ))
+    # Replacing the changed rows is far cheaper than bulk_update()'s CASE per row and field.
+    for i in range(0, len(stale), DELETE_BATCH):
+        CommunityCell.objects.filter(pk__in=stale[i:i + DELETE_BATCH]).delete()
+    CommunityCell.objects.bulk_create(cells, batch_size=500)
+
+
+def _deltas(rows):
+    """Cell deltas of (mood id, user id, timestamp, emotion, intensity) rows"""
+    tags = _mood_tags([row[0] for row in rows])
+    zones = get_user_timezones({row[1] for row in rows if row[1] is not None})
+    contributors = {user_id: contributor(user_id) for user_id in zones}
+    deltas = {}
+    for mood_id, user_id, timestamp, emotion, intensity in rows:
+        if user_id is None:
+            continue  # no owner to count toward the anonymity threshold
+        weekday, hour = heatmap.bucket(timestamp, zones[user_id])
+        for tag_id in [None, *tags.get(mood_id, ())]:
+            delta = deltas.setdefault((tag_id, weekday, hour, emotion), [0, 0, set()])
+            delta[0] += 1
+            delta[1] += intensity
+            delta[2].add(contributors[user_id])
+    return deltas
+
+
+def _unqueue(mood_ids):
+    for i in range(0, len(mood_ids), DELETE_BATCH):
+        CommunityPending.objects.filter(mood_id__in=mood_ids[i:i + DELETE_BATCH]).delete()
+
+
+def _lock():
+    """Lock the checkpoint row; held until the transaction ends"""
+    return CommunityCheckpoint.objects.select_for_update().get_or_create(pk=1)[0]
+
+
+def queue(mood_ids):
+    """Queue new moods for the next merge (in the transaction creating them)"""
+    CommunityPending.objects.bulk_create(
+        [CommunityPending(mood_id=mood_id) for mood_id in mood_ids], batch_size=500, ignore_conflicts=True,
+    )
+
+
+def _read(mood_ids):
+    rows = []
+    for i in range(0, len(mood_ids), TAG_LOOKUP_SIZE):
+        rows += Mood.objects.filter(pk__in=mood_ids[i:i + TAG_LOOKUP_SIZE]).values_list(
+            'id', 'user_id', 'timestamp', 'emotion', 'intensity',
+        )
+    return rows
+
+
+def merge_batch(limit=BATCH_SIZE):
+    """Merge up to `limit` queued moods; returns how many were taken off the queue"""
+    with transaction.atomic():
+        # Locking the checkpoint keeps two concurrent runs from merging the same moods.
+        checkpoint = _lock()
+        pending = list(CommunityPending.objects.order_by('mood_id').values_list('mood_id', flat=True)[:limit])
+        if not pending:
+            return 0
+        # Moods deleted before their merge are simply not found.
+        _apply(_deltas(_read(pending)))
+        _unqueue(pending)
+        checkpoint.merged_at = timezone.now()
+        checkpoint.save()
+    return len(pending)
+
+
+def merge(max_batches=None, batch_size=BATCH_SIZE):
+    """Merge every new mood, batch by batch; returns how many were read"""
+    total = batches = 0
+    while max_batches is None or batches < max_batches:
+        n = merge_batch(batch_size)
+        if not n:
+            break
+        total += n
+        batches += 1
+    if total:
+        caching.bump(caching.COMMUNITY)
+        # Warm what the community page reads first, so the refresh pays for it rather than a visitor.
+        popular_tags()
+        summary()
+    return total
+
+
+def rebuild(batch_size=REBUILD_BATCH_SIZE):
+    """Drop the cubes and count every mood in Mood again; returns how many were read"""
+    with transaction.atomic():
+        _lock()
+        CommunityCell.objects.all().delete()
+        CommunityCheckpoint.objects.filter(pk=1).update(merged_at=None)
+    total, last = 0, 0
+    while True:
+        with transaction.atomic():
+            checkpoint = _lock()
+            rows = list(Mood.objects.filter(id__gt=last).order_by('id').values_list(
+                'id', 'user_id', 'timestamp', 'emotion', 'intensity',
+            )[:batch_size])
+            if not rows:
+                break
+            _apply(_deltas(rows))
+            # Counted here, so not again by a merge; moods committed later are still queued.
+            _unqueue([row[0] for row in rows])
+            checkpoint.merged_at = timezone.now()
+            checkpoint.save()
+        total += len(rows)
+        last = rows[-1][0]
+    caching.bump(caching.COMMUNITY)
+    return total + merge(batch_size=batch_size)
+
+
+def forget_user(user_id):
+    """
+    Take a user's merged moods and contributor hash out of the cubes, as
+    the user is deleted (see core.signals). Moods are taken back as they
+    are now: ones edited since their merge can leave a little drift, and
+    a cell is never left below zero; `--rebuild` recounts exactly.
+    Dropping the hash can hide a cell until other users fill its place.
+    """
+    with transaction.atomic():
+        _lock()
+        moods = Mood.objects.filter(user_id=user_id)
+        rows = list(moods.exclude(Exists(CommunityPending.objects.filter(mood_id=OuterRef('pk')))).values_list(
+            'id', 'user_id', 'timestamp', 'emotion', 'intensity',
+        ))
+        CommunityPending.objects.filter(mood_id__in=moods.values('pk')).delete()
+        deltas = _deltas(rows)
+        for delta in deltas.values():
+            delta[0], delta[1], delta[2] = -delta[0], -delta[1], set()
+        _apply(deltas, forget=contributor(user_id))
+    caching.bump(caching.COMMUNITY)
+
+
+def last_merged():
+    """When the cubes last took in new moods, or None before the first merge"""
+    return CommunityCheckpoint.objects.filter(pk=1).values_list('merged_at', flat=True).first()
+
+
+def popular_tags(limit=POPULAR_TAGS):
+    """
+    [(tag id, name)] of the most logged tags that enough users share to
+    be shown, most logged first. A rarely shared tag name could identify
+    its user, so it is left out.
+    """
+    def compute():
+        k = settings.COMMUNITY_MIN_USERS
+        totals = {}
+        for tag_id, count, contributors in CommunityCell.objects.filter(tag__isnull=False).values_list(
+            'tag_id', 'count', 'contributors',
+        ):
+            n, seen = totals.get(tag_id, (0, []))
+            totals[tag_id] = (n + count, seen if len(seen) >= k else _union([seen, contributors], k))
+        ranked = sorted(
+            ((n, tag_id) for tag_id, (n, seen) in totals.items() if len(seen) >= k), reverse=True,
+        )[:limit]
+        names = dict(Tag.objects.filter(pk__in=[tag_id for n, tag_id in ranked]).values_list('id', 'name'))
+        return [(tag_id, names[tag_id]) for n, tag_id in ranked if tag_id in names]
+    return caching.get_or_set(caching.make_key('community_tags', limit, scope=caching.COMMUNITY), compute)
+
+
+def summary(tag_id=None, emotion=None):
+    """
+    One cube, suppressed below COMMUNITY_MIN_USERS contributors:
+    'heatmap': average intensity per weekday/hour in heatmap_grid()'s
+    format, 0 where there is no data or too few users; 'hourly': {emotion:
+    [24 shares of the hour's moods in %, None where too few users]};
+    'moods': moods counted; 'suppressed': hidden heatmap cells.
+
+    Averages and shares are computed from shown cells alone: a slot
+    averages the emotions shown in it, an hour's shares add up to 100
+    over the emotions shown in that hour.
+    """
+    def compute():
+        k = settings.COMMUNITY_MIN_USERS
+        cells = list(CommunityCell.objects.filter(tag=tag_id).values_list(
+            'weekday', 'hour', 'emotion', 'count', 'intensity_sum', 'contributors',
+        ))
+
+        slots = {}
+        for weekday, hour, cell_emotion, count, total, contributors in cells:
+            if emotion and cell_emotion != emotion:
+                continue
+            slot = slots.setdefault((weekday, hour), [0, 0])
+            if len(contributors) >= k:
+                slot[0] += count
+                slot[1] += total
+        grid = [[0] * 24 for _ in heatmap.DAYS]
+        suppressed = 0
+        for (weekday, hour), (count, total) in slots.items():
+            if count:
+                grid[weekday][hour] = round(total / count, 1)
+            else:
+                suppressed += 1
+
+        by_emotion = {}
+        for weekday, hour, cell_emotion, count, total, contributors in cells:
+            slot = by_emotion.setdefault((cell_emotion, hour), [0, []])
+            slot[0] += count
+            slot[1].append(contributors)
+        shown = {key: count for key, (count, contributors) in by_emotion.items() if len(_union(contributors, k)) >= k}
+        hours = [0] * 24
+        for (cell_emotion, hour), count in shown.items():
+            hours[hour] += count
+        hourly = {
+            value: [
+                round(100 * shown[value, hour] / hours[hour], 1) if (value, hour) in shown else None
+                for hour in range(24)
+            ]
+            for value in EMOTIONS
+        }
+
+        return {
+            'heatmap': [{'day': day, 'data': grid[i]} for i, day in enumerate(heatmap.DAYS)],
+            'hourly': hourly,
+            'moods': sum(count for weekday, hour, cell_emotion, count, total, contributors in cells),
+            'suppressed': suppressed,
+        }
+    return caching.get_or_set(caching.make_key('community', tag_id, emotion, scope=caching.COMMUNITY), compute)
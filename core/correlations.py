@@ -0,0 +1,195 @@
+"""
+Tag correlation engine.
+
+Computes, for every tag a user has used, the mood count, mean intensity,
+modal emotion and the with/without-tag difference in one pass over the
+Mood-Tag through table, against totals from one aggregate over Mood.
+Both only see moods still in Mood: archived moods keep counting in the
+rollups, but their tags left with them. Each difference is tested with
+Welch's t-test and reported with an effect size, so insights only
+surface differences that have enough support to be trusted. Results are cached until the user's
+next mood write (see core.signals).
+"""
+import asyncio
+import math
+
+from django.core.cache import cache
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Coalesce
+
+from . import caching
+from .models import Mood
+
+CACHE_TIMEOUT = 60 * 60 * 24
+MIN_SUPPORT = 5  # moods needed on each side of the comparison
+ALPHA = 0.05
+MIN_EFFECT_SIZE = 0.3  # Cohen's d; below this a difference is too small to mention
+TOTALS = {
+    'count': Count('id'),
+    'intensity_sum': Coalesce(Sum('intensity'), 0),
+    'intensity_sq_sum': Coalesce(Sum(F('intensity') * F('intensity')), 0),
+}
+
+
+def cache_key(user_id):
+    return f'correlations:{user_id}'
+
+
+def invalidate(user_id):
+    cache.delete(cache_key(user_id))
+
+
+def get_correlations(user_id):
+    """Cached list of per-tag statistics, see compute_correlations()"""
+    return caching.get_or_set(cache_key(user_id), lambda: compute_correlations(user_id), CACHE_TIMEOUT)
+
+
+async def aget_correlations(user_id):
+    """get_correlations() for async views"""
+    return await caching.aget_or_set(cache_key(user_id), lambda: acompute_correlations(user_id), CACHE_TIMEOUT)
+
+
+def tag_pairs(user_id, named=False):
+    return Mood.tags.through.objects.filter(mood__user_id=user_id).values_list(
+        'tag__name', 'mood__intensity', 'mood__emotion', named=named
+    )
+
+
+def mood_totals(user_id):
+    """Count, intensity sum and sum of squares of the user's moods in Mood"""
+    return Mood.objects.filter(user_id=user_id).order_by().aggregate(**TOTALS)
+
+
+def add_pair(stats, name, intensity, emotion):
+    tag = stats.get(name)
+    if tag is None:
+        tag = stats[name] = {'n': 0, 'sum': 0, 'sq': 0, 'emotions': {}}
+    tag['n'] += 1
+    tag['sum'] += intensity
+    tag['sq'] += intensity * intensity
+    tag['emotions'][emotion] = tag['emotions'].get(emotion, 0) + 1
+
+
+def compute_correlations(user_id):
+    """
+    One row per tag:
+    tag, mood_count, avg_intensity, top_emotion, without_avg, diff_pct,
+    effect_size, t, p_value and significant.
+    """
+    totals = mood_totals(user_id)
+    stats = {}
+    for name, intensity, emotion in tag_pairs(user_id).iterator(chunk_size=2000):
+        add_pair(stats, name, intensity, emotion)
+    return build_correlations(totals, stats)
+
+
+async def acompute_correlations(user_id):
+    """compute_correlations() with the mood totals and the tag pairs read concurrently"""
+    async def totals():
+        return await Mood.objects.filter(user_id=user_id).order_by().aaggregate(**TOTALS)
+
+    async def stats():
+        result = {}
+        # Plain values_list() runs its query on the event loop under aiterator(); named rows do not.
+        async for name, intensity, emotion in tag_pairs(user_id, named=True).aiterator(chunk_size=2000):
+            add_pair(result, name, intensity, emotion)
+        return result
+
+    return build_correlations(*await asyncio.gather(totals(), stats()))
+
+
+def build_correlations(totals, stats):
+    """Correlation rows from mood_totals() and per-tag sums (see add_pair)"""
+    total_n = totals['count']
+    total_sum = totals['intensity_sum']
+    total_sq = totals['intensity_sq_sum']
+
+    correlations = []
+    for name, tag in stats.items():
+        n = tag['n']
+        mean = tag['sum'] / n
+        rest_n = total_n - n
+        rest_mean = (total_sum - tag['sum']) / rest_n if rest_n > 0 else None
+        test = welch_test(n, tag['sum'], tag['sq'], rest_n, total_sum - tag['sum'], total_sq - tag['sq'])
+
+        correlations.append({
+            'tag': name,
+            'mood_count': n,
+            'avg_intensity': round(mean, 1),
+            'top_emotion': max(tag['emotions'], key=tag['emotions'].get),
+            'without_avg': round(rest_mean, 1) if rest_mean is not None else None,
+            'diff_pct': (mean - rest_mean) / rest_mean * 100 if rest_mean else None,
+            **test,
+        })
+    return correlations
+
+
+def welch_test(n1, sum1, sq1, n2, sum2, sq2):
+    """
+    Welch's unequal-variance t-test from count/sum/sum-of-squares,
+    plus Cohen's d. `significant` requires MIN_SUPPORT on both sides,
+    p < ALPHA and |d| >= MIN_EFFECT_SIZE.
+    """
+    result = {'effect_size': None, 't': None, 'p_value': None, 'significant': False}
+    if n1 < 2 or n2 < 2:
+        return result
+
+    mean1, mean2 = sum1 / n1, sum2 / n2
+    var1 = max((sq1 - n1 * mean1 ** 2) / (n1 - 1), 0.0)
+    var2 = max((sq2 - n2 * mean2 ** 2) / (n2 - 1), 0.0)
+
+    pooled = math.sqrt(((n1 - 1) * var1 + (n2 - 1) * var2) / (n1 + n2 - 2))
+    if pooled:
+        result['effect_size'] = round((mean1 - mean2) / pooled, 2)
+
+    se2 = var1 / n1 + var2 / n2
+    if se2 == 0:
+        return result
+    t = (mean1 - mean2) / math.sqrt(se2)
+    df = se2 ** 2 / ((var1 / n1) ** 2 / (n1 - 1) + (var2 / n2) ** 2 / (n2 - 1))
+    p = student_t_sf(abs(t), df) * 2
+
+    result['t'] = round(t, 2)
+    result['p_value'] = round(p, 4)
+    result['significant'] = (
+        n1 >= MIN_SUPPORT and n2 >= MIN_SUPPORT and p < ALPHA
+        and result['effect_size'] is not None and abs(result['effect_size']) >= MIN_EFFECT_SIZE
+    )
+    return result
+
+
+def student_t_sf(t, df):
+    """P(T > t) for Student's t with df degrees of freedom, t >= 0"""
+    x = df / (df + t * t)
+    return 0.5 * _betainc(df / 2, 0.5, x)
+
+
+def _betainc(a, b, x):
+    """Regularized incomplete beta I_x(a, b) via Lentz's continued fraction"""
+    if x <= 0:
+        return 0.0
+    if x >= 1:
+        return 1.0
+    front = math.exp(
+        math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b) + a * math.log(x) + b * math.log(1 - x)
+    )
+    if x > (a + 1) / (a + b + 2):
+        return 1.0 - _betainc(b, a, 1 - x)
+
+    tiny = 1e-30
+    c, d = 1.0, 1.0 - (a + b) * x / (a + 1)
+    d = 1.0 / (d if abs(d) > tiny else tiny)
+    f = d
+    for m in range(1, 200):
+        for numerator in (
+            m * (b - m) * x / ((a + 2 * m - 1) * (a + 2 * m)),
+            -(a + m) * (a + b + m) * x / ((a + 2 * m) * (a + 2 * m + 1)),
+        ):
+            d = 1.0 + numerator * d
+            d = 1.0 / (d if abs(d) > tiny else tiny)
+            c = 1.0 + numerator / c
+            c = c if abs(c) > tiny else tiny
+            f *= c * d
+        if abs(c * d - 1.0) < 1e-12:
+            break
+    return front * f / a
@@ -0,0 +1,238 @@
+"""
+Live dashboard updates over server-sent events.
+
+Signal handlers publish small JSON deltas to channels: `user:<id>` for
+a user's own mood changes and `community` for intervention score changes.
+The /events/ stream (views.events_stream) subscribes an open dashboard
+to both, and static/js/dashboard.js patches the page in place.
+
+Subscribers are one asyncio.Queue each, so an idle dashboard costs a
+suspended coroutine rather than a thread, and one process holds
+thousands of them. Publishers run in worker threads and hand events to
+the event loop with call_soon_threadsafe(). A subscriber that falls
+MAX_QUEUE events behind is sent a single `refresh` instead of a backlog.
+
+The broker is settings.EVENTS_BACKEND: LocalBroker (default) delivers
+within the process, which is enough for a single ASGI worker.
+RedisBroker relays through Redis pub/sub, so every worker's subscribers
+get every event.
+"""
+import asyncio
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+from . import rollups
+from .models import InterventionScore, MoodTag
+
+COMMUNITY = 'community'
+MAX_QUEUE = 100  # events buffered per subscriber before it is told to refresh
+HEARTBEAT = 15  # seconds between keep-alive comments on an idle stream
+MAX_AGE = 60 * 30  # seconds before a stream closes and the browser reconnects
+RETRY_MS = 3000
+REFRESH = {'type': 'refresh'}
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+class Subscription:
+    """Events for one open stream, delivered to the event loop it was created on"""
+    def __init__(self, channels):
+        self.channels = channels
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(MAX_QUEUE)
+
+    def put(self, data):
+        """Queue serialized event data; safe to call from any thread"""
+        try:
+            self.loop.call_soon_threadsafe(self._put, data)
+        except RuntimeError:
+            pass  # the loop has closed; the stream is gone
+
+    def _put(self, data):
+        if self.queue.full():
+            # Too far behind to patch: drop the backlog, reload the blocks instead.
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            data = json.dumps(REFRESH)
+        self.queue.put_nowait(data)
+
+    async def get(self, timeout):
+        """Next event's data, or None after timeout seconds without one"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class LocalBroker:
+    """In-process pub/sub: events reach the subscribers of this process only"""
+    def __init__(self):
+        self.channels = {}
+        self.lock = threading.Lock()
+
+    def listening(self, channel):
+        """Whether an event on channel may reach anyone, so building it is worthwhile"""
+        return bool(self.channels.get(channel))
+
+    def publish(self, channel, data):
+        self.deliver(channel, data)
+
+    def deliver(self, channel, data):
+        with self.lock:
+            subscribers = list(self.channels.get(channel, ()))
+        for subscription in subscribers:
+            subscription.put(data)
+
+    def subscribe(self, channels):
+        """Subscribe to channels; must be called from the event loop that will read"""
+        subscription = Subscription(channels)
+        with self.lock:
+            for channel in channels:
+                self.channels.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            for channel in subscription.channels:
+                subscribers = self.channels.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self.channels[channel]
+
+
+class RedisBroker(LocalBroker):
+    """
+    Publishes through Redis (settings.EVENTS_REDIS_URL) and relays every
+    message to this process's subscribers from one listener task, so
+    each worker holds a single Redis connection however many streams it
+    serves. Needs the redis package.
+    """
+    PREFIX = 'emotion-map:events:'
+
+    def __init__(self):
+        super().__init__()
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured('RedisBroker requires the redis package')
+        self.url = settings.EVENTS_REDIS_URL
+        self.client = redis.Redis.from_url(self.url)
+        self.listener = None
+
+    def listening(self, channel):
+        # Subscribers may be in any process.
+        return True
+
+    def publish(self, channel, data):
+        self.client.publish(self.PREFIX + channel, data)
+
+    def subscribe(self, channels):
+        subscription = super().subscribe(channels)
+        if self.listener is None or self.listener.done():
+            self.listener = asyncio.get_running_loop().create_task(self.listen())
+        return subscription
+
+    async def listen(self):
+        import redis.asyncio
+
+        client = redis.asyncio.Redis.from_url(self.url)
+        pubsub = client.pubsub()
+        await pubsub.psubscribe(self.PREFIX + '*')
+        try:
+            async for message in pubsub.listen():
+                if message['type'] == 'pmessage':
+                    channel = message['channel'].decode()[len(self.PREFIX):]
+                    self.deliver(channel, message['data'].decode())
+        finally:
+            await pubsub.aclose()
+            await client.aclose()
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(settings.EVENTS_BACKEND)()
+    return _broker
+
+
+def publish(channel, event):
+    """
+    Publish an event dict, or a function building it, which is only
+    called when the broker may have listeners on the channel.
+    """
+    broker = get_broker()
+    if not broker.listening(channel):
+        return
+    if callable(event):
+        event = event()
+    broker.publish(channel, json.dumps(event, default=str))
+
+
+async def stream(user_id):
+    """Server-sent event lines for one dashboard, until MAX_AGE or disconnect"""
+    broker = get_broker()
+    subscription = broker.subscribe([user_channel(user_id), COMMUNITY])
+    try:
+        yield f'retry: {RETRY_MS}\n\n'
+        deadline = time.monotonic() + MAX_AGE
+        while time.monotonic() < deadline:
+            data = await subscription.get(HEARTBEAT)
+            yield ': ping\n\n' if data is None else f'data: {data}\n\n'
+    finally:
+        broker.unsubscribe(subscription)
+
+
+def mood_fields(mood):
+    """What a mood event carries about the mood, read without queries (so it survives a delete)"""
+    return {
+        'id': mood.pk,
+        'emotion': mood.emotion,
+        'emotion_label': mood.get_emotion_display(),
+        'intensity': mood.intensity,
+        'timestamp': mood.timestamp.isoformat(),
+    }
+
+
+def mood_event(action, fields, trend):
+    """Delta for a created/updated/deleted mood, with the trend days it changed"""
+    tags = []
+    if action == 'updated':
+        tags = list(MoodTag.objects.filter(mood_id=fields['id']).order_by('tag__name').values_list('tag__name', flat=True))
+    return {'type': 'mood', 'action': action, 'mood': {**fields, 'tags': tags}, 'trend': trend}
+
+
+def trend_points(user_id, zone, dates):
+    """[{'date', 'avg'}] for the dates inside the dashboard's 7-day trend; avg None once a day is empty"""
+    today = rollups.local_today(zone)
+    dates = sorted(d for d in dates if 0 <= (today - d).days < 7)
+    if not dates:
+        return []
+    days = {r.date: r for r in rollups.get_rollups(user_id).filter(date__in=dates)}
+    return [
+        {'date': str(d), 'avg': float(days[d].avg_intensity or 0) if d in days else None}
+        for d in dates
+    ]
+
+
+def score_event(intervention_id):
+    row = InterventionScore.objects.filter(intervention_id=intervention_id).values('score', 'total_votes').first()
+    return {
+        'type': 'score',
+        'intervention': intervention_id,
+        'score': row['score'] if row else 0.0,
+        'votes': row['total_votes'] if row else 0,
+    }
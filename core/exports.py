@@ -0,0 +1,275 @@
+"""
+Mood exports that stream in constant memory.
+
+Rows are read from the ORM as plain tuples in fixed-size chunks (a
+server-side cursor on PostgreSQL) and each chunk's tags are fetched with
+one query, so memory stays flat and there is no per-row N+1.
+
+Formats: CSV and NDJSON (text), Arrow IPC stream and Parquet (typed
+columns, built straight from the tuples as record batches). The columnar
+formats need the optional pyarrow package.
+
+Under ASGI, Django collects a plain generator into a list before sending
+it, so views hand out aexport_stream() there instead.
+"""
+import csv
+import json
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+
+from .models import Mood, MoodTag, Tag
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Arrow/Parquet exports are optional
+    pa = pq = None
+
+CHUNK_SIZE = 2000
+PARQUET_ROW_GROUP_SIZE = 65536
+EXPORT_FIELDS = ['id', 'user_id', 'timestamp', 'emotion', 'intensity', 'note']
+
+# format: (content type, file extension)
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+COLUMNAR_FORMATS = {'arrow', 'parquet'}
+
+
+def is_available(fmt):
+    return fmt in FORMATS and (fmt not in COLUMNAR_FORMATS or pa is not None)
+
+
+def iter_mood_chunks(moods, chunk_size=CHUNK_SIZE):
+    """
+    Yield lists of dicts (EXPORT_FIELDS plus 'tags', a list of names)
+    for the given Mood queryset, chunk_size rows at a time.
+    """
+    rows = moods.values_list(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        tags = {}
+        links = MoodTag.objects.filter(
+            mood_id__in=[row[0] for row in chunk]
+        ).order_by('tag__name').values_list('mood_id', 'tag__name')
+        for mood_id, name in links:
+            tags.setdefault(mood_id, []).append(name)
+        yield [
+            dict(zip(EXPORT_FIELDS, row), tags=tags.get(row[0], []))
+            for row in chunk
+        ]
+
+
+class Echo:
+    """File-like object whose write() hands the value back to the caller"""
+    def write(self, value):
+        return value
+
+
+def csv_stream(moods, zone=None, include_user=False):
+    """
+    Yield the CSV export, one string per chunk of rows. Dates and times
+    are shown in `zone` (default: the zone active when streaming starts).
+    """
+    writer = csv.writer(Echo())
+    labels = dict(Mood.EMOTION_CHOICES)
+    user_column = ['User ID'] if include_user else []
+    # The header goes out before the first query so the client sees bytes immediately.
+    yield writer.writerow(user_column + ['Date', 'Time', 'Emotion', 'Intensity', 'Tags', 'Note'])
+    zone = zone or timezone.get_current_timezone()
+    for chunk in iter_mood_chunks(moods):
+        lines = []
+        for mood in chunk:
+            local = timezone.localtime(mood['timestamp'], zone)
+            lines.append(writer.writerow(([mood['user_id']] if include_user else []) + [
+                local.date(),
+                local.time().strftime('%H:%M'),
+                labels.get(mood['emotion'], mood['emotion']),
+                mood['intensity'],
+                ', '.join(mood['tags']),
+                mood['note'] or '',
+            ]))
+        yield ''.join(lines)
+
+
+def ndjson_line(mood, zone, include_user=False):
+    """One iter_mood_chunks() dict as a line of NDJSON"""
+    record = {
+        'id': mood['id'],
+        'timestamp': timezone.localtime(mood['timestamp'], zone).isoformat(),
+        'emotion': mood['emotion'],
+        'intensity': mood['intensity'],
+        'tags': mood['tags'],
+        'note': mood['note'],
+    }
+    if include_user:
+        record['user_id'] = mood['user_id']
+    return json.dumps(record, ensure_ascii=False) + '\n'
+
+
+def ndjson_stream(moods, zone=None, include_user=False):
+    """Yield one JSON object per mood, newline-delimited, a chunk at a time"""
+    zone = zone or timezone.get_current_timezone()
+    for chunk in iter_mood_chunks(moods):
+        yield ''.join(ndjson_line(mood, zone, include_user) for mood in chunk)
+
+
+def arrow_schema(zone, include_user=False):
+    fields = [
+        pa.field('id', pa.int64(), nullable=False),
+        pa.field('timestamp', pa.timestamp('us', tz=str(zone)), nullable=False),
+        pa.field('emotion', pa.dictionary(pa.int8(), pa.string()), nullable=False),
+        pa.field('intensity', pa.int8(), nullable=False),
+        pa.field('note', pa.string()),
+        pa.field('tags', pa.list_(pa.dictionary(pa.int32(), pa.string()))),
+    ]
+    if include_user:
+        fields.insert(1, pa.field('user_id', pa.int64()))
+    return pa.schema(fields)
+
+
+def iter_record_batches(moods, zone=None, include_user=False, chunk_size=CHUNK_SIZE):
+    """
+    Yield pyarrow RecordBatches for a Mood queryset without building model
+    instances. Emotion and tag dictionaries are fixed up front, so every
+    batch shares them (required by the IPC stream format); a tag added to
+    an exported mood while the export runs is left out of it.
+    """
+    zone = zone or timezone.get_current_timezone()
+    schema = arrow_schema(zone, include_user)
+    emotions = [value for value, label in Mood.EMOTION_CHOICES]
+    emotion_codes = {value: i for i, value in enumerate(emotions)}
+    emotion_dictionary = pa.array(emotions, pa.string())
+
+    # Only tags used by the exported moods, so no other user's tags leak in.
+    tags = Tag.objects.filter(
+        moodtag__mood__in=moods.order_by().values('pk')
+    ).distinct().order_by('id').values_list('id', 'name')
+    tag_codes = {}
+    tag_names = []
+    for tag_id, name in tags:
+        tag_codes[tag_id] = len(tag_names)
+        tag_names.append(name)
+    tag_dictionary = pa.array(tag_names, pa.string())
+
+    rows = moods.values_list(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        links = {}
+        for mood_id, tag_id in MoodTag.objects.filter(
+            mood_id__in=[row[0] for row in chunk]
+        ).order_by('mood_id', 'tag_id').values_list('mood_id', 'tag_id'):
+            if tag_id in tag_codes:
+                links.setdefault(mood_id, []).append(tag_codes[tag_id])
+
+        ids, user_ids, timestamps, emotion_values, intensities, notes = zip(*chunk)
+        offsets = [0]
+        flat_tags = []
+        for mood_id in ids:
+            flat_tags.extend(links.get(mood_id, ()))
+            offsets.append(len(flat_tags))
+
+        columns = [
+            pa.array(ids, pa.int64()),
+            pa.array(timestamps, schema.field('timestamp').type),
+            pa.DictionaryArray.from_arrays(
+                pa.array([emotion_codes[e] for e in emotion_values], pa.int8()), emotion_dictionary
+            ),
+            pa.array(intensities, pa.int8()),
+            pa.array(notes, pa.string()),
+            pa.ListArray.from_arrays(
+                pa.array(offsets, pa.int32()),
+                pa.DictionaryArray.from_arrays(pa.array(flat_tags, pa.int32()), tag_dictionary),
+            ),
+        ]
+        if include_user:
+            columns.insert(1, pa.array(user_ids, pa.int64()))
+        yield pa.RecordBatch.from_arrays(columns, schema=schema)
+
+
+class _ByteSink:
+    """Write-only file that buffers bytes until the stream drains them"""
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def _columnar_stream(open_writer, moods, zone, include_user, chunk_size):
+    zone = zone or timezone.get_current_timezone()
+    sink = _ByteSink()
+    writer = open_writer(pa.PythonFile(sink, mode='w'), arrow_schema(zone, include_user))
+    for batch in iter_record_batches(moods, zone, include_user, chunk_size):
+        writer.write_batch(batch)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def arrow_stream(moods, zone=None, include_user=False):
+    """Yield an Arrow IPC stream, one record batch per chunk"""
+    return _columnar_stream(pa.ipc.new_stream, moods, zone, include_user, CHUNK_SIZE)
+
+
+def parquet_stream(moods, zone=None, include_user=False):
+    """Yield a zstd-compressed Parquet file, one row group per PARQUET_ROW_GROUP_SIZE rows"""
+    def open_writer(sink, schema):
+        return pq.ParquetWriter(sink, schema, compression='zstd')
+    return _columnar_stream(open_writer, moods, zone, include_user, PARQUET_ROW_GROUP_SIZE)
+
+
+STREAMS = {
+    'csv': csv_stream,
+    'ndjson': ndjson_stream,
+    'arrow': arrow_stream,
+    'parquet': parquet_stream,
+}
+
+
+def export_stream(fmt, moods, zone=None, include_user=False):
+    """Chunks (str for text formats, bytes for columnar ones) of an export"""
+    return STREAMS[fmt](moods, zone, include_user)
+
+
+async def aexport_stream(fmt, moods, zone=None, include_user=False):
+    """
+    export_stream() as an async iterator: each chunk is built in the sync
+    thread (which keeps the cursor on one connection) and sent before the
+    next one is read.
+    """
+    chunks = export_stream(fmt, moods, zone, include_user)
+    done = object()
+    next_chunk = sync_to_async(next)
+    try:
+        while (chunk := await next_chunk(chunks, done)) is not done:
+            yield chunk
+    finally:
+        await sync_to_async(chunks.close)()
@@ -1,5 +1,7 @@
 from django import forms
-from .models import Mood, Feedback, Intervention, Tag
+from django.urls import reverse_lazy
+from . import tags
+from .models import Mood, Feedback, Intervention, MoodTag
 
 class MoodForm(forms.ModelForm):
     """Form for logging a new mood entry"""
@@ -7,7 +9,12 @@ class MoodForm(forms.ModelForm):
         required=False,
         widget=forms.TextInput(attrs={
             'placeholder': 'Add tags (comma-separated, e.g., work, home, exercise)',
-            'class': 'form-input'
+            'class': 'form-input',
+            'autocomplete': 'off',
+            # Suggestions from the tag index (see core.tags.suggest)
+            'hx-get': reverse_lazy('tag_autocomplete'),
+            'hx-trigger': 'input changed delay:150ms, focus',
+            'hx-target': '#tag-suggestions',
         }),
         help_text="Optional: Add context tags"
     )
@@ -31,26 +38,31 @@ class MoodForm(forms.ModelForm):
             }),
         }
     
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._tag_ids = set()
+        if self.instance.pk:
+            # Editing: show the current tags so removing one from the field unlinks it.
+            current = list(MoodTag.objects.filter(mood=self.instance).order_by('tag__name').values_list('tag_id', 'tag__name'))
+            self._tag_ids = {tag_id for tag_id, name in current}
+            self.initial.setdefault('tags', ', '.join(name for tag_id, name in current))
+    
+    def clean_tags(self):
+        try:
+            return tags.parse(self.cleaned_data.get('tags', ''))
+        except ValueError as e:
+            raise forms.ValidationError(str(e))
+    
     def save(self, commit=True):
-        # 1. Get the instance but don't save to DB yet (to preserve commit=False behavior)
-        instance = super().save(commit=False)
-
-        # 2. Define a helper function to save the tags
+        instance = super().save(commit=commit)
+        
         def save_tags():
-            tags_input = self.cleaned_data.get('tags', '')
-            if tags_input:
-                tag_names = [t.strip() for t in tags_input.split(',') if t.strip()]
-                for tag_name in tag_names:
-                    tag, created = Tag.objects.get_or_create(name=tag_name)
-                    instance.tags.add(tag)
-
-        # 3. Logic to handle both commit=True and commit=False
+            tags.set_mood_tags(instance, self.cleaned_data.get('tags', []), current=self._tag_ids)
+        
+        # With commit=False the caller saves the mood, then calls save_m2m().
         if commit:
-            instance.save()
-            self.save_m2m() 
-            save_tags()     
+            save_tags()
         else:
-            
             old_save_m2m = self.save_m2m
             def new_save_m2m():
                 old_save_m2m()
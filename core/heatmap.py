@@ -0,0 +1,181 @@
+"""
+Heatmap engine: per-user day x hour x emotion cubes.
+
+The cube is built once with a single grouped query and then kept up to
+date by mood writes (see core.signals), so rendering the heatmap reads at
+most 7 * 24 * len(EMOTION_CHOICES) small rows instead of rescanning the
+user's history. Buckets use the user's own timezone.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import ExtractHour, ExtractIsoWeekDay
+
+from .models import HeatmapCell, Mood
+from .timezones import get_user_timezone
+
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+
+def bucket(timestamp, zone):
+    """(weekday, hour) of timestamp in zone, weekday 0=Monday"""
+    local = timestamp.astimezone(zone)
+    return local.weekday(), local.hour
+
+
+def rebuild_cube(user_id):
+    """
+    Recompute a user's whole cube with one grouped query. Archived moods
+    are no longer in Mood, so each cell keeps its archived part as it is.
+    """
+    zone = get_user_timezone(user_id)
+    archived = {
+        (cell.weekday, cell.hour, cell.emotion): cell
+        for cell in HeatmapCell.objects.filter(user_id=user_id, archived_count__gt=0)
+    }
+    rows = Mood.objects.filter(user_id=user_id).order_by().annotate(
+        iso_weekday=ExtractIsoWeekDay('timestamp', tzinfo=zone),
+        local_hour=ExtractHour('timestamp', tzinfo=zone),
+    ).values('iso_weekday', 'local_hour', 'emotion').annotate(
+        n=Count('id'),
+        total=Sum('intensity'),
+    )
+    cells = {}
+    for row in rows:
+        key = (row['iso_weekday'] - 1, row['local_hour'], row['emotion'])
+        cells[key] = HeatmapCell(
+            user_id=user_id, weekday=key[0], hour=key[1], emotion=key[2],
+            count=row['n'], intensity_sum=row['total'],
+        )
+    for key, old in archived.items():
+        cell = cells.get(key) or HeatmapCell(user_id=user_id, weekday=key[0], hour=key[1], emotion=key[2])
+        cell.count += old.archived_count
+        cell.intensity_sum += old.archived_intensity_sum
+        cell.archived_count = old.archived_count
+        cell.archived_intensity_sum = old.archived_intensity_sum
+        cells[key] = cell
+    cells = list(cells.values())
+    with transaction.atomic():
+        HeatmapCell.objects.filter(user_id=user_id).delete()
+        HeatmapCell.objects.bulk_create(cells, batch_size=500)
+    return len(cells)
+
+
+def apply_mood(user_id, timestamp, emotion, intensity, sign, zone=None):
+    """Add (sign=1) or remove (sign=-1) one mood from its cube cell"""
+    if user_id is None or timestamp is None:
+        return
+    weekday, hour = bucket(timestamp, zone or get_user_timezone(user_id))
+    cell = HeatmapCell.objects.filter(user_id=user_id, weekday=weekday, hour=hour, emotion=emotion)
+    changes = {'count': F('count') + sign, 'intensity_sum': F('intensity_sum') + sign * intensity}
+    if cell.update(**changes) or sign < 0:
+        return
+    try:
+        with transaction.atomic():
+            HeatmapCell.objects.create(
+                user_id=user_id, weekday=weekday, hour=hour, emotion=emotion,
+                count=1, intensity_sum=intensity,
+            )
+    except IntegrityError:
+        # Another writer created the cell first.
+        cell.update(**changes)
+
+
+def apply_moods(user_id, moods, zone=None):
+    """
+    Add many (timestamp, emotion, intensity) rows to a user's cube at once:
+    deltas are summed per cell and written with one upsert.
+    """
+    zone = zone or get_user_timezone(user_id)
+    deltas = {}
+    for timestamp, emotion, intensity in moods:
+        key = (*bucket(timestamp, zone), emotion)
+        n, total = deltas.get(key, (0, 0))
+        deltas[key] = (n + 1, total + intensity)
+    if not deltas:
+        return
+    with transaction.atomic():
+        cells = {
+            (cell.weekday, cell.hour, cell.emotion): cell
+            for cell in HeatmapCell.objects.select_for_update().filter(user_id=user_id)
+        }
+        changed = []
+        for (weekday, hour, emotion), (n, total) in deltas.items():
+            cell = cells.get((weekday, hour, emotion)) or HeatmapCell(
+                user_id=user_id, weekday=weekday, hour=hour, emotion=emotion
+            )
+            cell.count += n
+            cell.intensity_sum += total
+            changed.append(cell)
+        HeatmapCell.objects.bulk_create(
+            changed,
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=['user', 'weekday', 'hour', 'emotion'],
+            update_fields=['count', 'intensity_sum'],
+        )
+
+
+def archive_moods(user_id, moods, zone=None):
+    """
+    Record (timestamp, emotion, intensity) rows as archived in a user's
+    cube. Their counts are already in the cells; this only marks them so
+    rebuild_cube() keeps them once the rows leave Mood.
+    """
+    zone = zone or get_user_timezone(user_id)
+    deltas = {}
+    for timestamp, emotion, intensity in moods:
+        key = (*bucket(timestamp, zone), emotion)
+        n, total = deltas.get(key, (0, 0))
+        deltas[key] = (n + 1, total + intensity)
+    if not deltas:
+        return
+    with transaction.atomic():
+        cells = {
+            (cell.weekday, cell.hour, cell.emotion): cell
+            for cell in HeatmapCell.objects.select_for_update().filter(user_id=user_id)
+        }
+        changed = []
+        for (weekday, hour, emotion), (n, total) in deltas.items():
+            cell = cells.get((weekday, hour, emotion))
+            if cell is None:
+                # The cube had drifted; the moods must still count once archived.
+                cell = HeatmapCell(user_id=user_id, weekday=weekday, hour=hour, emotion=emotion,
+                                   count=n, intensity_sum=total)
+            cell.archived_count += n
+            cell.archived_intensity_sum += total
+            changed.append(cell)
+        HeatmapCell.objects.bulk_create(
+            changed,
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=['user', 'weekday', 'hour', 'emotion'],
+            update_fields=['count', 'intensity_sum', 'archived_count', 'archived_intensity_sum'],
+        )
+
+
+def _grid_rows(user_id, emotion=None):
+    cells = HeatmapCell.objects.filter(user_id=user_id, count__gt=0)
+    if emotion:
+        cells = cells.filter(emotion=emotion)
+    return cells.values('weekday', 'hour').annotate(n=Sum('count'), total=Sum('intensity_sum'))
+
+
+def _grid(rows):
+    grid = [[0] * 24 for _ in DAYS]
+    for row in rows:
+        if row['n']:
+            grid[row['weekday']][row['hour']] = round(row['total'] / row['n'], 1)
+    return [{'day': day, 'data': grid[i]} for i, day in enumerate(DAYS)]
+
+
+def heatmap_grid(user_id, emotion=None):
+    """
+    Average intensity per weekday/hour as
+    [{'day': 'Monday', 'data': [24 values]}, ...], 0 where there is no data.
+    """
+    return _grid(_grid_rows(user_id, emotion))
+
+
+async def aheatmap_grid(user_id, emotion=None):
+    """heatmap_grid() for async views"""
+    return _grid([row async for row in _grid_rows(user_id, emotion)])
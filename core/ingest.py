@@ -0,0 +1,154 @@
+"""
+Bulk mood ingest for imports from wearables and partner apps.
+
+A batch is validated field by field up front, then written with a fixed
+number of statements regardless of its size: at most one tag upsert and
+one tag lookup (see core.tags), one Mood insert and one Mood-Tag insert. Model signals do not
+fire for bulk writes, so the derived aggregates (heatmap cube, daily
+rollups, correlation cache, API change marker) are refreshed here, once
+per user per batch.
+"""
+import datetime
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import community, heatmap, rollups, tags
+from .models import Mood, MoodTag
+from .signals import moods_changed, publish_refresh
+from .timezones import get_user_timezone
+
+BATCH_SIZE = 5000
+MAX_REQUEST_MOODS = 5000  # per API call; the management command batches files of any size
+
+EMOTIONS = {value for value, label in Mood.EMOTION_CHOICES}
+INTENSITY_RANGE = range(1, 11)
+NOTE_MAX_LENGTH = Mood._meta.get_field('note').max_length
+
+
+class IngestError(ValueError):
+    """A batch failed validation; `errors` is a list of (index, message)"""
+    def __init__(self, errors):
+        super().__init__(f'{len(errors)} invalid mood(s)')
+        self.errors = errors
+
+
+def _parse_timestamp(value, now):
+    if value in (None, ''):
+        return now
+    if isinstance(value, datetime.datetime):
+        timestamp = value
+    elif isinstance(value, str):
+        try:
+            timestamp = parse_datetime(value)
+        except ValueError:
+            timestamp = None
+        if timestamp is None:
+            raise ValueError('timestamp must be an ISO 8601 datetime')
+    else:
+        raise ValueError('timestamp must be an ISO 8601 datetime')
+    return timezone.make_aware(timestamp) if timezone.is_naive(timestamp) else timestamp
+
+
+def validate(records, user_id=None):
+    """
+    Check a list of mood dicts and convert them to rows of
+    (user_id, timestamp, emotion, intensity, note, tag names).
+    Keys: emotion, intensity, and optionally timestamp, note, tags, and
+    user_id (required when no user_id is given for the whole batch, and
+    must match it when one is).
+    Returns (rows, errors) where errors is a list of (index, message).
+    """
+    now = timezone.now()
+    rows = []
+    errors = []
+
+    # Owners are checked for the whole batch with one query.
+    if user_id is None:
+        owner_ids = {r.get('user_id') for r in records if isinstance(r, dict)}
+        known_users = set(User.objects.filter(
+            pk__in=[pk for pk in owner_ids if isinstance(pk, int)]
+        ).values_list('pk', flat=True))
+    else:
+        known_users = {user_id}
+
+    for index, record in enumerate(records):
+        if not isinstance(record, dict):
+            errors.append((index, 'each mood must be an object'))
+            continue
+        owner = user_id if user_id is not None else record.get('user_id')
+        emotion = record.get('emotion')
+        intensity = record.get('intensity')
+        note = record.get('note') or None
+        problems = []
+        if user_id is not None and record.get('user_id', user_id) != user_id:
+            problems.append("user_id must be the batch's own user")
+        elif owner not in known_users:
+            problems.append('unknown user_id')
+        if emotion not in EMOTIONS:
+            problems.append(f'emotion must be one of {", ".join(sorted(EMOTIONS))}')
+        if isinstance(intensity, str) and intensity.isdigit():
+            intensity = int(intensity)
+        if isinstance(intensity, bool) or not isinstance(intensity, int) or intensity not in INTENSITY_RANGE:
+            problems.append('intensity must be an integer from 1 to 10')
+        if note is not None and not isinstance(note, str):
+            problems.append('note must be a string')
+        elif note is not None and len(note) > NOTE_MAX_LENGTH:
+            problems.append(f'note must be at most {NOTE_MAX_LENGTH} characters')
+        try:
+            timestamp = _parse_timestamp(record.get('timestamp'), now)
+            tag_names = tags.parse(record.get('tags'))
+        except ValueError as e:
+            problems.append(str(e))
+        if problems:
+            errors.append((index, '; '.join(problems)))
+            continue
+        rows.append((owner, timestamp, emotion, intensity, note, tag_names))
+    return rows, errors
+
+
+def insert_batch(rows):
+    """Write validated rows and refresh the affected users' aggregates. Returns moods created."""
+    if not rows:
+        return 0
+    with transaction.atomic():
+        tag_ids = tags.resolve(name for row in rows for name in row[5])
+        moods = Mood.objects.bulk_create([
+            Mood(user_id=owner, timestamp=timestamp, emotion=emotion, intensity=intensity, note=note)
+            for owner, timestamp, emotion, intensity, note, tag_names in rows
+        ])
+        MoodTag.objects.bulk_create([
+            MoodTag(mood_id=mood.pk, tag_id=tag_ids[name])
+            for mood, row in zip(moods, rows)
+            for name in row[5]
+        ])
+        community.queue([mood.pk for mood in moods])
+
+        per_user = {}
+        for owner, timestamp, emotion, intensity, note, tag_names in rows:
+            per_user.setdefault(owner, []).append((timestamp, emotion, intensity))
+        for owner, user_rows in per_user.items():
+            zone = get_user_timezone(owner)
+            heatmap.apply_moods(owner, user_rows, zone=zone)
+            rollups.apply_changes(owner, [((owner, *row), 1) for row in user_rows], zone=zone)
+            moods_changed(owner)
+            publish_refresh(owner)
+    return len(moods)
+
+
+def ingest(records, user_id=None, skip_invalid=False, batch_size=BATCH_SIZE):
+    """
+    Validate and store mood dicts (see validate()) in batches.
+    Raises IngestError if any record is invalid, unless skip_invalid, in
+    which case invalid records are left out and reported.
+    Returns {'created': n, 'errors': [(index, message), ...]}.
+    """
+    rows, errors = validate(records, user_id)
+    if errors and not skip_invalid:
+        raise IngestError(errors)
+    created = 0
+    for start in range(0, len(rows), batch_size):
+        created += insert_batch(rows[start:start + batch_size])
+    return {'created': created, 'errors': errors}
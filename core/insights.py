@@ -0,0 +1,69 @@
+"""
+Personal insights: day-of-week and time-of-day patterns from the daily
+rollups, plus significant tag correlations.
+
+Computed by a background job (see core.jobs) after the user's moods
+change and stored in the Insight table, so the insights page is a single
+primary-key read.
+"""
+from django.utils import timezone
+
+from . import correlations, heatmap, rollups
+from .models import Insight
+
+MAX_TAG_INSIGHTS = 3
+
+
+def compute_insights(user_id):
+    """List of {'kind', 'icon', 'text'} in display order"""
+    summary = rollups.summarize(rollups.get_rollups(user_id))
+    
+    insights = []
+    
+    # Insight 1: Day of week pattern
+    day_stats = summary['weekday_avg']
+    
+    if day_stats:
+        worst_day = max(day_stats, key=day_stats.get)
+        best_day = min(day_stats, key=day_stats.get)
+        days = heatmap.DAYS
+        insights.append({
+            'kind': 'weekday',
+            'icon': '📅',
+            'text': f"Your mood is typically better on {days[best_day]}s and harder on {days[worst_day]}s"
+        })
+    
+    # Insight 2: Time of day
+    morning = rollups.hour_range_avg(summary, 6, 12)
+    evening = rollups.hour_range_avg(summary, 18, 23)
+    
+    if morning and evening:
+        if evening < morning:
+            insights.append({
+                'kind': 'time_of_day',
+                'icon': '🌙',
+                'text': f"You're {((morning - evening) / morning * 100):.0f}% calmer in the evenings"
+            })
+    
+    # Insight 3: Tag correlations (Welch t-test, see core.correlations)
+    significant = sorted(
+        (c for c in correlations.get_correlations(user_id) if c['significant']),
+        key=lambda c: abs(c['effect_size']),
+        reverse=True
+    )
+    for correlation in significant[:MAX_TAG_INSIGHTS]:
+        diff = correlation['diff_pct']
+        insights.append({
+            'kind': 'tag',
+            'icon': '🏷️',
+            'text': f"#{correlation['tag']} is associated with {abs(diff):.0f}% {'higher' if diff > 0 else 'lower'} intensity"
+        })
+    
+    return insights
+
+
+def refresh_user(user_id):
+    """Recompute and store a user's insights"""
+    items = compute_insights(user_id)
+    Insight.objects.update_or_create(user_id=user_id, defaults={'items': items, 'computed_at': timezone.now()})
+    return items
@@ -0,0 +1,142 @@
+"""
+Database-backed job queue for background work, run by `manage.py run_jobs`.
+
+enqueue() is cheap enough to call on every write: it is a single
+insert-or-ignore against the one-pending-job-per-(kind, user) constraint,
+so a burst of writes collapses into one job. The job becomes due
+DEBOUNCE seconds after the first write of the burst, which bounds how
+stale results get while a user keeps logging.
+
+Workers claim due jobs with a conditional UPDATE, so several workers can
+share the table without an outside broker. When claiming, a worker
+respects a limit on jobs running across all workers and skips users who
+already have a job running.
+
+A failed job is retried up to MAX_ATTEMPTS times with exponential
+backoff, then kept as failed for FAILED_KEEP seconds for inspection.
+"""
+import datetime
+import logging
+import os
+import socket
+
+from django.db import IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+DEBOUNCE = 60  # seconds
+MAX_RUNNING = 4
+STALE_AFTER = 15 * 60  # a running job older than this is assumed to have died with its worker
+MAX_ATTEMPTS = 3
+RETRY_DELAY = 60  # seconds before the first retry, doubling after each failure
+FAILED_KEEP = 7 * 24 * 60 * 60  # seconds
+
+
+def handlers():
+    from . import insights, timezones
+    return {
+        'insights': insights.refresh_user,
+        'rebucket': timezones.rebucket_user,
+    }
+
+
+def enqueue(kind, user_id, delay=DEBOUNCE):
+    """Schedule kind for a user unless it is already pending"""
+    run_after = timezone.now() + datetime.timedelta(seconds=delay)
+    Job.objects.bulk_create([Job(kind=kind, user_id=user_id, run_after=run_after)], ignore_conflicts=True)
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def recover_stale(now=None):
+    """Fail jobs whose worker died, so they are retried like any other failure"""
+    now = now or timezone.now()
+    stale = list(Job.objects.filter(
+        status=Job.RUNNING, started_at__lt=now - datetime.timedelta(seconds=STALE_AFTER)
+    ))
+    for job in stale:
+        fail(job, 'worker stopped responding', now)
+    return len(stale)
+
+
+def claim(worker, limit=MAX_RUNNING):
+    """
+    Mark up to `limit` minus the jobs already running as running for
+    `worker` and return them, skipping users that already have a job running.
+    """
+    now = timezone.now()
+    running = Job.objects.filter(status=Job.RUNNING)
+    slots = limit - running.count()
+    if slots <= 0:
+        return []
+    busy_users = set(running.exclude(user__isnull=True).values_list('user_id', flat=True))
+    due = Job.objects.filter(status=Job.PENDING, run_after__lte=now).order_by('run_after')
+
+    claimed = []
+    while len(claimed) < slots:
+        # Busy users are filtered in SQL, so their jobs can't fill the window and starve the rest.
+        batch = list(due.exclude(user_id__in=busy_users)[:slots - len(claimed)])
+        if not batch:
+            break
+        for job in batch:
+            if job.user_id is not None and job.user_id in busy_users:
+                continue  # a second kind of the user claimed just before; the next query skips it
+            # Only one worker can win this UPDATE; a lost job is no longer pending either way.
+            if Job.objects.filter(pk=job.pk, status=Job.PENDING).update(
+                status=Job.RUNNING, started_at=now, worker=worker
+            ):
+                job.status, job.started_at, job.worker = Job.RUNNING, now, worker
+                if job.user_id is not None:
+                    busy_users.add(job.user_id)
+                claimed.append(job)
+    return claimed
+
+
+def fail(job, error, now=None):
+    """
+    Schedule a failed job's retry, or keep it as failed after MAX_ATTEMPTS.
+    A job already pending for the same kind and user stands in for the retry.
+    """
+    now = now or timezone.now()
+    attempts = job.attempts + 1
+    if attempts < MAX_ATTEMPTS:
+        retry_at = now + datetime.timedelta(seconds=RETRY_DELAY * 2 ** (attempts - 1))
+        try:
+            with transaction.atomic():
+                Job.objects.filter(pk=job.pk, status=Job.RUNNING).update(
+                    status=Job.PENDING, run_after=retry_at, attempts=attempts, error=error,
+                )
+        except IntegrityError:
+            Job.objects.filter(pk=job.pk, status=Job.RUNNING).delete()
+        return
+    Job.objects.filter(pk=job.pk, status=Job.RUNNING).update(status=Job.FAILED, attempts=attempts, error=error)
+
+
+def purge_failed(now=None):
+    """Delete jobs that failed for good more than FAILED_KEEP seconds ago"""
+    now = now or timezone.now()
+    deleted, _ = Job.objects.filter(
+        status=Job.FAILED, started_at__lt=now - datetime.timedelta(seconds=FAILED_KEEP)
+    ).delete()
+    return deleted
+
+
+def run(job):
+    """Run one claimed job: delete it on success, retry or keep it as failed otherwise"""
+    try:
+        handler = handlers()[job.kind]
+        handler(job.user_id)
+    except Exception as e:
+        logger.exception('Job %s (%s for user %s) failed', job.pk, job.kind, job.user_id)
+        fail(job, f'{type(e).__name__}: {e}')
+        return False
+    else:
+        Job.objects.filter(pk=job.pk).delete()
+        return True
+    finally:
+        close_old_connections()
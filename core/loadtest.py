@@ -0,0 +1,104 @@
+"""
+HTTP load generator for comparing deployments (e.g. WSGI vs ASGI).
+
+Simulates polling clients: each one requests the next path, waits
+`interval` seconds (jittered so clients do not move in lockstep) and
+repeats until the run ends. Requests are plain HTTP/1.1 with
+`Connection: close` over asyncio streams, so hundreds of clients need
+one thread and no extra packages.
+"""
+import asyncio
+import random
+import ssl
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.utils.module_loading import import_string
+
+
+def session_cookie(user):
+    """Cookie header value logging requests in as user (the servers must share the session store)"""
+    store = import_string(f'{settings.SESSION_ENGINE}.SessionStore')()
+    store[SESSION_KEY] = str(user.pk)
+    store[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    store[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    store.save()
+    return f'{settings.SESSION_COOKIE_NAME}={store.session_key}'
+
+
+async def fetch(url, path, cookie, timeout):
+    """Status code of one GET request"""
+    parts = urlsplit(url)
+    https = parts.scheme == 'https'
+    port = parts.port or (443 if https else 80)
+    reader, writer = await asyncio.wait_for(
+        asyncio.open_connection(parts.hostname, port, ssl=ssl.create_default_context() if https else None),
+        timeout,
+    )
+    try:
+        request = (
+            f'GET {parts.path.rstrip("/")}{path} HTTP/1.1\r\n'
+            f'Host: {parts.netloc}\r\n'
+            f'Cookie: {cookie}\r\n'
+            'Connection: close\r\n\r\n'
+        )
+        writer.write(request.encode())
+        await writer.drain()
+        status_line = await asyncio.wait_for(reader.readline(), timeout)
+        # Drain the rest so the server is not cut off mid-response.
+        while await asyncio.wait_for(reader.read(65536), timeout):
+            pass
+        return int(status_line.split()[1])
+    finally:
+        writer.close()
+
+
+async def _client(url, paths, cookie, interval, timeout, deadline, results):
+    # Spread the first requests over one interval instead of a thundering start.
+    await asyncio.sleep(random.random() * interval)
+    i = random.randrange(len(paths))
+    while time.monotonic() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            status = await fetch(url, path, cookie, timeout)
+        except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+            status = None
+        elapsed = (time.perf_counter() - start) * 1000
+        if status is not None and status < 400:
+            results['latencies'].append(elapsed)
+        else:
+            results['errors'] += 1
+        await asyncio.sleep(interval * random.uniform(0.5, 1.5))
+
+
+async def run(url, paths, cookie, clients=500, duration=30, interval=5.0, timeout=30.0):
+    """
+    Drive url with `clients` concurrent polling clients for `duration`
+    seconds. Returns requests, errors, throughput (ok requests/s) and
+    p50/p95/p99 latency in ms.
+    """
+    results = {'latencies': [], 'errors': 0}
+    started = time.monotonic()
+    deadline = started + duration
+    await asyncio.gather(*(
+        _client(url, paths, cookie, interval, timeout, deadline, results) for _ in range(clients)
+    ))
+    elapsed = time.monotonic() - started
+    latencies = sorted(results['latencies'])
+
+    def percentile(p):
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))], 1) if latencies else None
+
+    return {
+        'requests': len(latencies) + results['errors'],
+        'errors': results['errors'],
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(statistics.median(latencies), 1) if latencies else None,
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+    }
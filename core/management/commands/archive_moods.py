@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import archive
+
+
+class Command(BaseCommand):
+    help = (
+        'Moves moods older than MOOD_HOT_MONTHS out of the Mood table into compressed '
+        'monthly archive files; their rollups and heatmap cells stay live'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--directory', help=f'Where to write archives (default: {settings.MOOD_ARCHIVE_DIR})')
+        parser.add_argument('--limit', type=int, help='Archive at most this many months, oldest first')
+        parser.add_argument('--dry-run', action='store_true', help='List the months that would be archived')
+        parser.add_argument('--verify', action='store_true', help='Check existing archive files against their checksums')
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            problems = archive.verify()
+            for record, problem in problems:
+                self.stdout.write(self.style.ERROR(f'{record.path}: {problem}'))
+            if problems:
+                raise CommandError(f'{len(problems)} archive files failed verification')
+            self.stdout.write(self.style.SUCCESS('All archive files verified'))
+            return
+
+        months = archive.cold_months()
+        if options['limit'] is not None:
+            months = dict(list(months.items())[:options['limit']])
+        if not months:
+            self.stdout.write('Nothing to archive')
+            return
+
+        total = 0
+        for month, n in months.items():
+            if options['dry_run']:
+                self.stdout.write(f'{month:%Y-%m}: {n} moods')
+                continue
+            record = archive.archive_month(month, options['directory'])
+            if record is None:
+                continue
+            total += record.mood_count
+            self.stdout.write(
+                f'{month:%Y-%m}: {record.mood_count} moods -> {record.path} ({record.size / 1024:.1f} KiB)'
+            )
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'Archived {total} moods from {len(months)} months'))
@@ -0,0 +1,64 @@
+import os
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from core import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        'Seeds a throwaway copy of the configured database (DB_ENGINE) and measures write '
+        'throughput and read latency under concurrent writer and reader threads'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=sorted(benchmarks.SCALES), default='1k',
+                            help='Number of synthetic moods to seed (default: 1k)')
+        parser.add_argument('--users', type=int, default=10, help='Synthetic users to spread moods over')
+        parser.add_argument('--writers', type=int, default=8, help='Threads logging moods')
+        parser.add_argument('--readers', type=int, default=8, help='Threads reading the dashboard data')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds of load')
+        parser.add_argument('--untuned', action='store_true',
+                            help='Drop the DATABASES OPTIONS (SQLite pragmas, timeouts) to compare with the defaults')
+
+    def handle(self, *args, **options):
+        if options['untuned']:
+            connection.settings_dict['OPTIONS'] = {}
+        profile = f"{connection.vendor}{' (untuned)' if options['untuned'] else ''}"
+
+        setup_test_environment(debug=False)
+        old_name = connection.settings_dict['NAME']
+        with tempfile.TemporaryDirectory() as tmp:
+            if connection.vendor == 'sqlite':
+                # The default in-memory test database would hide file locking and journaling.
+                connection.settings_dict['TEST']['NAME'] = os.path.join(tmp, 'benchmark.sqlite3')
+            connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            try:
+                moods = benchmarks.SCALES[options['scale']]
+                self.stdout.write(f'Seeding {moods} moods...')
+                start = time.perf_counter()
+                users = benchmarks.seed(moods, users=options['users'], stdout=self.stdout)
+                self.stdout.write(f'Seeded in {time.perf_counter() - start:.1f}s')
+
+                self.stdout.write(
+                    f"{profile}: {options['writers']} writers, {options['readers']} readers "
+                    f"for {options['duration']}s..."
+                )
+                r = benchmarks.measure_database(
+                    users, writers=options['writers'], readers=options['readers'], duration=options['duration'],
+                )
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                teardown_test_environment()
+
+        self.stdout.write(f"{'':<6} {'ok':>7} {'errors':>7} {'per s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        for kind in ('write', 'read'):
+            p = r[kind]
+            self.stdout.write(
+                f"{kind:<6} {r[kind + 's']:>7} {r[kind + '_errors']:>7} {r[kind + 's_per_s']:>8} "
+                f"{p['p50_ms'] or '-':>8} {p['p95_ms'] or '-':>8} {p['p99_ms'] or '-':>8}"
+            )
@@ -0,0 +1,53 @@
+import os
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from core import benchmarks, search
+
+
+class Command(BaseCommand):
+    help = (
+        'Seeds a throwaway copy of the configured database with synthetic notes and compares '
+        'note search through the full-text index with a LIKE scan'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=sorted(benchmarks.SCALES), default='100k',
+                            help='Number of synthetic moods to seed, about 30%% with notes (default: 100k)')
+        parser.add_argument('--users', type=int, default=10, help='Synthetic users to spread moods over')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed runs per query')
+
+    def handle(self, *args, **options):
+        setup_test_environment(debug=False)
+        old_name = connection.settings_dict['NAME']
+        with tempfile.TemporaryDirectory() as tmp:
+            if connection.vendor == 'sqlite':
+                # On disk, as in production: an in-memory database flatters the LIKE scan.
+                connection.settings_dict['TEST']['NAME'] = os.path.join(tmp, 'benchmark.sqlite3')
+            connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            try:
+                moods = benchmarks.SCALES[options['scale']]
+                self.stdout.write(f'Seeding {moods} moods...')
+                start = time.perf_counter()
+                users = benchmarks.seed(moods, users=options['users'], stdout=self.stdout)
+                self.stdout.write(f'Seeded in {time.perf_counter() - start:.1f}s')
+                if not search.is_available():
+                    self.stdout.write(self.style.WARNING(f'No search index on {connection.vendor}'))
+
+                results = benchmarks.measure_search(users[0], repeat=options['repeat'])
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                teardown_test_environment()
+
+        self.stdout.write(
+            f"{'query':<14} {'matches':>8} {'index p50':>10} {'index p95':>10} {'like p50':>10} {'like p95':>10}"
+        )
+        for label, r in results.items():
+            self.stdout.write(
+                f"{label:<14} {r['matches']:>8} {r['index']['p50_ms']:>10} {r['index']['p95_ms']:>10} "
+                f"{r['like']['p50_ms']:>10} {r['like']['p95_ms']:>10}"
+            )
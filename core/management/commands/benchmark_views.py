@@ -0,0 +1,71 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from core import benchmarks
+
+class Command(BaseCommand):
+    help = (
+        'Seeds a throwaway test database with synthetic data and records query count, '
+        'p50/p95 latency and peak memory for every route in core.urls'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=sorted(benchmarks.SCALES), default='1k',
+                            help='Number of synthetic moods to seed (default: 1k)')
+        parser.add_argument('--users', type=int, default=10, help='Synthetic users to spread moods over')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed requests per route')
+        parser.add_argument('--output', help='Write results as a JSON baseline to this path')
+        parser.add_argument('--check', metavar='BASELINE',
+                            help='Fail if any route exceeds the budgets in this baseline file')
+        parser.add_argument('--tolerance', type=float, default=0.5,
+                            help='Allowed latency/memory growth over the baseline (default: 0.5 = 50%%)')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Reuse the benchmark database between runs (skips seeding if populated)')
+
+    def handle(self, *args, **options):
+        moods = benchmarks.SCALES[options['scale']]
+        setup_test_environment(debug=False)
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            results = self.run(moods, options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        for name, r in results.items():
+            self.stdout.write(
+                f"{name:<26} {r['status']:>3}  {r['queries']:>6} queries  "
+                f"p50 {r['p50_ms']:>8.1f} ms  p95 {r['p95_ms']:>8.1f} ms  peak {r['peak_kib']:>9.1f} KiB"
+            )
+
+        meta = {'scale': options['scale'], 'moods': moods, 'users': options['users'], 'repeat': options['repeat']}
+        if options['output']:
+            benchmarks.save_baseline(options['output'], results, meta)
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {options['output']}"))
+
+        if options['check']:
+            violations = benchmarks.compare(results, benchmarks.load_baseline(options['check']), options['tolerance'])
+            if violations:
+                for violation in violations:
+                    self.stdout.write(self.style.ERROR(violation))
+                raise CommandError(f'{len(violations)} budget violations')
+            self.stdout.write(self.style.SUCCESS('All routes within budget'))
+
+    def run(self, moods, options):
+        from django.contrib.auth.models import User
+
+        user = User.objects.filter(username='bench0').first()
+        if user is None:
+            self.stdout.write(f'Seeding {moods} moods...')
+            start = time.perf_counter()
+            user = benchmarks.seed(moods, users=options['users'], stdout=self.stdout)[0]
+            self.stdout.write(f'Seeded in {time.perf_counter() - start:.1f}s')
+
+        client = Client()
+        client.force_login(user)
+        return benchmarks.measure(client, user, repeat=options['repeat'])
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from core import rollups
+from core.models import DailyRollup, Mood
+
+class Command(BaseCommand):
+    help = 'Verifies daily rollups against Mood rows (optionally repairing them)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('user_ids', nargs='*', type=int, help='Only check these users (default: all)')
+        parser.add_argument('--repair', action='store_true', help='Rebuild users whose rollups are inconsistent')
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids'] or sorted(
+            set(Mood.objects.filter(user__isnull=False).order_by().values_list('user_id', flat=True).distinct())
+            | set(DailyRollup.objects.order_by().values_list('user_id', flat=True).distinct())
+        )
+
+        broken = 0
+        for user_id in user_ids:
+            problems = rollups.check_user(user_id)
+            if not problems:
+                continue
+            broken += 1
+            for date, problem in problems:
+                self.stdout.write(self.style.WARNING(f'User {user_id} {date}: {problem}'))
+            if options['repair']:
+                rollups.rebuild_user(user_id)
+                self.stdout.write(self.style.SUCCESS(f'Repaired user {user_id}'))
+
+        if broken and not options['repair']:
+            raise CommandError(f'{broken} users have inconsistent rollups (run with --repair)')
+        self.stdout.write(self.style.SUCCESS(f'Checked {len(user_ids)} users'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from core import recommender
+
+class Command(BaseCommand):
+    help = 'Folds new Feedback into the recommender checkpoint so processes load it without replaying'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Recompute the checkpoint from all Feedback (e.g. after moods were edited)')
+
+    def handle(self, *args, **options):
+        folded = recommender.checkpoint(rebuild=options['rebuild'])
+        if options['rebuild']:
+            recommender.invalidate()
+        self.stdout.write(self.style.SUCCESS(f'Checkpointed {folded} feedback events'))
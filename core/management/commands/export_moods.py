@@ -0,0 +1,62 @@
+import datetime
+import time
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core import exports
+from core.models import Mood
+from core.timezones import get_zone
+
+class Command(BaseCommand):
+    help = 'Exports mood history for all users (or some) to a file for offline analysis'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Output file, or a directory to create a dated file in')
+        parser.add_argument('--format', choices=sorted(exports.FORMATS), default='parquet')
+        parser.add_argument('--user', action='append', default=[],
+                            help='Username or id to export (repeatable; default: all users)')
+        parser.add_argument('--start', type=datetime.date.fromisoformat, help='First date to include (YYYY-MM-DD)')
+        parser.add_argument('--end', type=datetime.date.fromisoformat, help='Last date to include (YYYY-MM-DD)')
+        parser.add_argument('--timezone', default='UTC', help='Zone for --start/--end and exported timestamps')
+
+    def handle(self, *args, **options):
+        fmt = options['format']
+        if not exports.is_available(fmt):
+            raise CommandError(f'{fmt} export requires pyarrow to be installed')
+        zone = get_zone(options['timezone'])
+        if zone is None:
+            raise CommandError(f"Unknown timezone: {options['timezone']}")
+
+        moods = Mood.objects.filter(user__isnull=False)
+        if options['user']:
+            users = User.objects.filter(
+                id__in=[u for u in options['user'] if u.isdigit()]
+            ) | User.objects.filter(username__in=options['user'])
+            moods = moods.filter(user__in=users)
+        if options['start']:
+            moods = moods.filter(timestamp__gte=datetime.datetime.combine(options['start'], datetime.time.min, tzinfo=zone))
+        if options['end']:
+            end = options['end'] + datetime.timedelta(days=1)
+            moods = moods.filter(timestamp__lt=datetime.datetime.combine(end, datetime.time.min, tzinfo=zone))
+        moods = moods.order_by('user_id', 'timestamp')
+
+        path = Path(options['output'])
+        if path.is_dir():
+            path = path / f"moods_{timezone.now():%Y%m%d_%H%M%S}.{exports.FORMATS[fmt][1]}"
+
+        start = time.perf_counter()
+        written = 0
+        with open(path, 'wb') as f:
+            for chunk in exports.export_stream(fmt, moods, zone, include_user=True):
+                data = chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+                f.write(data)
+                written += len(data)
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {written / 1024 / 1024:.1f} MiB to {path} in {elapsed:.1f}s '
+            f'({written / 1024 / 1024 / max(elapsed, 1e-9):.1f} MiB/s)'
+        ))
@@ -0,0 +1,95 @@
+import csv
+import json
+import sys
+import time
+from itertools import islice
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from core import ingest
+
+FORMATS = ['ndjson', 'json', 'csv']
+
+
+def read_records(f, fmt):
+    """Yield mood dicts from an open text file"""
+    if fmt == 'json':
+        payload = json.load(f)
+        yield from payload.get('moods', []) if isinstance(payload, dict) else payload
+    elif fmt == 'ndjson':
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+    else:
+        for row in csv.DictReader(f):
+            record = {key: value for key, value in row.items() if value not in (None, '')}
+            if str(record.get('user_id', '')).isdigit():
+                record['user_id'] = int(record['user_id'])
+            yield record
+
+
+class Command(BaseCommand):
+    help = 'Bulk-imports moods from an NDJSON, JSON or CSV file (columns/keys as in the mood API)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help="File to import, or '-' for stdin")
+        parser.add_argument('--format', choices=FORMATS,
+                            help='Input format (default: from the file extension, else ndjson)')
+        parser.add_argument('--user', help='Username or id owning every mood (default: each record\'s user_id)')
+        parser.add_argument('--batch-size', type=int, default=ingest.BATCH_SIZE)
+        parser.add_argument('--skip-invalid', action='store_true',
+                            help='Leave out invalid records instead of stopping at the first bad batch')
+
+    def handle(self, *args, **options):
+        user_id = None
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None and options['user'].isdigit():
+                user = User.objects.filter(pk=int(options['user'])).first()
+            if user is None:
+                raise CommandError(f"Unknown user: {options['user']}")
+            user_id = user.pk
+
+        path = options['input']
+        suffix = Path(path).suffix.lstrip('.')
+        fmt = options['format'] or (suffix if suffix in FORMATS else 'ndjson')
+        f = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+
+        created = skipped = offset = 0
+        start = time.perf_counter()
+        try:
+            records = read_records(f, fmt)
+            while True:
+                batch = list(islice(records, options['batch_size']))
+                if not batch:
+                    break
+                try:
+                    result = ingest.ingest(
+                        batch, user_id=user_id, skip_invalid=options['skip_invalid'],
+                        batch_size=options['batch_size'],
+                    )
+                except ingest.IngestError as e:
+                    for index, message in e.errors[:10]:
+                        self.stderr.write(f'  record {offset + index}: {message}')
+                    raise CommandError(
+                        f'{len(e.errors)} invalid record(s) in the batch starting at record {offset}; '
+                        f'{created} moods were imported before it (use --skip-invalid to skip them)'
+                    )
+                created += result['created']
+                skipped += len(result['errors'])
+                offset += len(batch)
+                elapsed = time.perf_counter() - start
+                self.stdout.write(f'  {created} moods ({created / max(elapsed, 1e-9):.0f}/s)')
+        except (json.JSONDecodeError, csv.Error) as e:
+            raise CommandError(f'Could not parse record {offset}+: {e}')
+        finally:
+            if f is not sys.stdin:
+                f.close()
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Ingested {created} moods in {elapsed:.1f}s ({created / max(elapsed, 1e-9):.0f} moods/s)'
+            + (f', skipped {skipped} invalid' if skipped else '')
+        ))
@@ -0,0 +1,60 @@
+import asyncio
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from core import loadtest
+
+DEFAULT_TARGETS = ['wsgi=http://127.0.0.1:8000', 'asgi=http://127.0.0.1:8001']
+DEFAULT_ROUTES = ['api_moods', 'heatmap', 'correlations', 'weekly_report', 'comparison']
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-tests running servers with concurrent polling clients and compares their '
+        'throughput and latency, e.g. the same code served over WSGI and ASGI'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', action='append', metavar='NAME=URL',
+                            help=f'Server to test, repeatable (default: {" ".join(DEFAULT_TARGETS)})')
+        parser.add_argument('--user', required=True, help='Username the clients log in as')
+        parser.add_argument('--path', action='append',
+                            help='Path to poll, repeatable (default: the async analytics and API routes)')
+        parser.add_argument('--clients', type=int, default=500)
+        parser.add_argument('--duration', type=float, default=30, help='Seconds per target')
+        parser.add_argument('--interval', type=float, default=5,
+                            help='Average seconds a client idles between requests')
+        parser.add_argument('--timeout', type=float, default=30, help='Per-request timeout in seconds')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options['user']).first()
+        if user is None:
+            raise CommandError(f"Unknown user: {options['user']}")
+        targets = []
+        for target in options['target'] or DEFAULT_TARGETS:
+            name, sep, url = target.partition('=')
+            if not sep or not url.startswith(('http://', 'https://')):
+                raise CommandError(f'Expected NAME=URL, got {target!r}')
+            targets.append((name, url))
+        paths = options['path'] or [reverse(name) for name in DEFAULT_ROUTES]
+        cookie = loadtest.session_cookie(user)
+
+        results = {}
+        for name, url in targets:
+            self.stdout.write(
+                f"{name}: {options['clients']} clients polling {url} every ~{options['interval']}s "
+                f"for {options['duration']}s..."
+            )
+            results[name] = asyncio.run(loadtest.run(
+                url, paths, cookie, clients=options['clients'], duration=options['duration'],
+                interval=options['interval'], timeout=options['timeout'],
+            ))
+
+        self.stdout.write(f"{'target':<10} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        for name, r in results.items():
+            self.stdout.write(
+                f"{name:<10} {r['requests']:>9} {r['errors']:>7} {r['rps']:>8} "
+                f"{r['p50_ms'] or '-':>8} {r['p95_ms'] or '-':>8} {r['p99_ms'] or '-':>8}"
+            )
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from core import heatmap
+from core.models import Mood
+
+class Command(BaseCommand):
+    help = 'Rebuilds per-user heatmap cubes from Mood rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('user_ids', nargs='*', type=int, help='Only rebuild these users (default: all)')
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids'] or Mood.objects.filter(
+            user__isnull=False
+        ).order_by().values_list('user_id', flat=True).distinct()
+
+        users = cells = 0
+        for user_id in user_ids:
+            cells += heatmap.rebuild_cube(user_id)
+            users += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {users} heatmaps ({cells} cells)'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from core import caching
+from core.models import InterventionScore
+
+class Command(BaseCommand):
+    help = 'Backfills or repairs the denormalized intervention score table from Feedback'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'intervention_ids', nargs='*', type=int,
+            help='Only rebuild these interventions (default: all)'
+        )
+
+    def handle(self, *args, **options):
+        ids = options['intervention_ids'] or None
+        written = InterventionScore.rebuild(intervention_ids=ids)
+        caching.bump(caching.INTERVENTIONS)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt scores for {written} interventions'))
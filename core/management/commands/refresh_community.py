@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import community
+
+
+class Command(BaseCommand):
+    help = (
+        'Merges moods logged since the last run into the anonymized community aggregates; '
+        'run it from cron every few minutes'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Drop the aggregates and recount every mood still in Mood')
+        parser.add_argument('--batch-size', type=int,
+                            help=f'Moods merged per transaction (default: {community.BATCH_SIZE}, '
+                                 f'{community.REBUILD_BATCH_SIZE} with --rebuild)')
+        parser.add_argument('--max-batches', type=int, help='Stop after this many batches; the rest waits for the next run')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        if options['rebuild']:
+            merged = community.rebuild(batch_size=options['batch_size'] or community.REBUILD_BATCH_SIZE)
+        else:
+            merged = community.merge(
+                max_batches=options['max_batches'], batch_size=options['batch_size'] or community.BATCH_SIZE,
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Merged {merged} moods into the community aggregates in {time.perf_counter() - start:.1f}s'
+        ))
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from core import search
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuilds the mood note search index: the FTS5 table on SQLite (recreating it and '
+        'its triggers if missing), the GIN index on PostgreSQL'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Database alias (default: default)')
+        parser.add_argument('--no-optimize', action='store_true',
+                            help='Skip merging the FTS5 index segments after the rebuild (SQLite)')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        start = time.perf_counter()
+        search.rebuild(using, optimize=not options['no_optimize'])
+        if not search.is_available(using):
+            self.stdout.write(self.style.WARNING(
+                f'No search index on {connections[using].vendor}; searches fall back to a LIKE scan'
+            ))
+            return
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt the search index in {time.perf_counter() - start:.1f}s'))
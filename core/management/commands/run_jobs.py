@@ -0,0 +1,43 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from core import jobs, recommender
+
+
+class Command(BaseCommand):
+    help = 'Runs queued background jobs (e.g. insight refreshes); use --once from cron or run it as a service'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=jobs.MAX_RUNNING,
+                            help='Most jobs running at once across all workers')
+        parser.add_argument('--poll', type=float, default=5.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Exit once no job is due')
+
+    def handle(self, *args, **options):
+        worker = jobs.worker_name()
+        done = failed = 0
+        self.stdout.write(f"Worker {worker} running up to {options['concurrency']} jobs at a time")
+        try:
+            with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+                while True:
+                    recovered = jobs.recover_stale()
+                    if recovered:
+                        self.stderr.write(f'Requeued {recovered} stale job(s)')
+                    jobs.purge_failed()
+                    # Keeps the recommender's replay on load short, off the request path.
+                    recommender.checkpoint_if_behind()
+                    batch = jobs.claim(worker, limit=options['concurrency'])
+                    if batch:
+                        # A lone job runs inline rather than on a pool thread.
+                        for ok in (map if len(batch) == 1 else pool.map)(jobs.run, batch):
+                            done += ok
+                            failed += not ok
+                        continue
+                    if options['once']:
+                        break
+                    time.sleep(options['poll'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f'Ran {done} job(s), {failed} failed'))
@@ -0,0 +1,56 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.utils import timezone
+
+from .timezones import get_zone, set_user_timezone
+
+
+class TimezoneMiddleware:
+    """
+    Activates the browser's timezone (sent in the `tz` cookie by
+    static/js/timezone.js) and keeps the user's Profile in sync with it,
+    so dates render and heatmap buckets fall in the user's local time.
+    Rebucketing the user's aggregates is left to a background job, so a
+    timezone change costs the request a few queries.
+
+    Works in both sync and async stacks, so async views are not pushed
+    back onto a worker thread by this middleware under ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def activate(self, request):
+        tzname = request.COOKIES.get('tz')
+        zone = get_zone(tzname)
+        if zone:
+            timezone.activate(zone)
+        else:
+            timezone.deactivate()
+        return tzname if zone else None
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        tzname = self.activate(request)
+
+        # The session remembers the last synced value, so the profile is
+        # only touched when the browser's timezone actually changes.
+        if tzname and request.user.is_authenticated and request.session.get('timezone') != tzname:
+            set_user_timezone(request.user, tzname, defer=True)
+            request.session['timezone'] = tzname
+
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        tzname = self.activate(request)
+        if tzname and await request.session.aget('timezone') != tzname:
+            user = await request.auser()
+            if user.is_authenticated:
+                await sync_to_async(set_user_timezone)(user, tzname, defer=True)
+                await request.session.aset('timezone', tzname)
+
+        return await self.get_response(request)
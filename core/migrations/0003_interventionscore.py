@@ -0,0 +1,59 @@
+# Generated by Django 6.0 on 2026-10-17 18:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_scores(apps, schema_editor):
+    Intervention = apps.get_model('core', 'Intervention')
+    Feedback = apps.get_model('core', 'Feedback')
+    InterventionScore = apps.get_model('core', 'InterventionScore')
+
+    counts = {}
+    for row in Feedback.objects.order_by().values('intervention_id', 'result').annotate(
+        n=models.Count('id')
+    ):
+        counts.setdefault(row['intervention_id'], {})[row['result']] = row['n']
+
+    rows = []
+    for intervention_id in Intervention.objects.values_list('id', flat=True):
+        c = counts.get(intervention_id, {})
+        helped = c.get('helped', 0)
+        no_change = c.get('no_change', 0)
+        worse = c.get('worse', 0)
+        total = helped + no_change + worse
+        rows.append(InterventionScore(
+            intervention_id=intervention_id,
+            helped=helped,
+            no_change=no_change,
+            worse=worse,
+            total_votes=total,
+            score=round((helped - worse) / total, 2) if total else 0.0,
+        ))
+    InterventionScore.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_mood_user'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InterventionScore',
+            fields=[
+                ('intervention', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='score_summary', serialize=False, to='core.intervention')),
+                ('helped', models.PositiveIntegerField(default=0)),
+                ('no_change', models.PositiveIntegerField(default=0)),
+                ('worse', models.PositiveIntegerField(default=0)),
+                ('total_votes', models.PositiveIntegerField(default=0)),
+                ('score', models.FloatField(default=0.0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-score', '-total_votes'], name='core_score_rank_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_scores, migrations.RunPython.noop),
+    ]
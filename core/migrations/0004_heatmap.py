@@ -0,0 +1,68 @@
+# Generated by Django 6.0 on 2026-10-17 18:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_heatmaps(apps, schema_editor):
+    """One streaming pass over existing moods, bucketed in settings.TIME_ZONE"""
+    import zoneinfo
+
+    Mood = apps.get_model('core', 'Mood')
+    HeatmapCell = apps.get_model('core', 'HeatmapCell')
+    zone = zoneinfo.ZoneInfo(settings.TIME_ZONE)
+
+    cube = {}
+    moods = Mood.objects.filter(user__isnull=False).order_by().values_list(
+        'user_id', 'timestamp', 'emotion', 'intensity'
+    )
+    for user_id, timestamp, emotion, intensity in moods.iterator(chunk_size=2000):
+        local = timestamp.astimezone(zone)
+        key = (user_id, local.weekday(), local.hour, emotion)
+        count, total = cube.get(key, (0, 0))
+        cube[key] = (count + 1, total + intensity)
+
+    HeatmapCell.objects.bulk_create(
+        [
+            HeatmapCell(user_id=user_id, weekday=weekday, hour=hour, emotion=emotion,
+                        count=count, intensity_sum=total)
+            for (user_id, weekday, hour, emotion), (count, total) in cube.items()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_interventionscore'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Profile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timezone', models.CharField(default='UTC', max_length=64)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='profile', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='HeatmapCell',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekday', models.PositiveSmallIntegerField()),
+                ('hour', models.PositiveSmallIntegerField()),
+                ('emotion', models.CharField(choices=[('joy', 'Joy'), ('sadness', 'Sadness'), ('anxiety', 'Anxiety'), ('anger', 'Anger'), ('fear', 'Fear'), ('disgust', 'Disgust'), ('surprise', 'Surprise'), ('neutral', 'Neutral'), ('excited', 'Excited'), ('calm', 'Calm')], max_length=20)),
+                ('count', models.IntegerField(default=0)),
+                ('intensity_sum', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='heatmap_cells', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'weekday', 'hour', 'emotion'), name='core_heatmapcell_unique_bucket')],
+            },
+        ),
+        migrations.RunPython(backfill_heatmaps, migrations.RunPython.noop),
+    ]
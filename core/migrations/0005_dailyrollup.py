@@ -0,0 +1,78 @@
+# Generated by Django 6.0 on 2026-10-17 18:57
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_rollups(apps, schema_editor):
+    """One streaming pass over existing moods, bucketed by each user's timezone"""
+    import zoneinfo
+
+    Mood = apps.get_model('core', 'Mood')
+    Profile = apps.get_model('core', 'Profile')
+    DailyRollup = apps.get_model('core', 'DailyRollup')
+
+    default_zone = zoneinfo.ZoneInfo(settings.TIME_ZONE)
+    zones = {}
+    for user_id, tzname in Profile.objects.values_list('user_id', 'timezone'):
+        try:
+            zones[user_id] = zoneinfo.ZoneInfo(tzname)
+        except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+            pass
+
+    days = {}
+    moods = Mood.objects.filter(user__isnull=False).order_by().values_list(
+        'user_id', 'timestamp', 'emotion', 'intensity'
+    )
+    for user_id, timestamp, emotion, intensity in moods.iterator(chunk_size=2000):
+        local = timestamp.astimezone(zones.get(user_id, default_zone))
+        key = (user_id, local.date())
+        day = days.get(key)
+        if day is None:
+            day = days[key] = DailyRollup(
+                user_id=user_id, date=local.date(), count=0, intensity_sum=0, intensity_sq_sum=0,
+                emotion_counts={}, hour_counts=[0] * 24, hour_intensity=[0] * 24,
+            )
+        day.count += 1
+        day.intensity_sum += intensity
+        day.intensity_sq_sum += intensity * intensity
+        day.intensity_min = intensity if day.intensity_min is None else min(day.intensity_min, intensity)
+        day.intensity_max = intensity if day.intensity_max is None else max(day.intensity_max, intensity)
+        day.emotion_counts[emotion] = day.emotion_counts.get(emotion, 0) + 1
+        day.hour_counts[local.hour] += 1
+        day.hour_intensity[local.hour] += intensity
+
+    DailyRollup.objects.bulk_create(days.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_heatmap'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('count', models.IntegerField(default=0)),
+                ('intensity_sum', models.IntegerField(default=0)),
+                ('intensity_sq_sum', models.IntegerField(default=0)),
+                ('intensity_min', models.PositiveSmallIntegerField(null=True)),
+                ('intensity_max', models.PositiveSmallIntegerField(null=True)),
+                ('emotion_counts', models.JSONField(default=dict)),
+                ('hour_counts', models.JSONField(default=list)),
+                ('hour_intensity', models.JSONField(default=list)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['date'],
+                'constraints': [models.UniqueConstraint(fields=('user', 'date'), name='core_dailyrollup_unique_day')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
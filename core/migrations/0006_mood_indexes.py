@@ -0,0 +1,53 @@
+# Generated by Django 6.0 on 2026-10-17 19:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_dailyrollup'),
+    ]
+
+    operations = [
+        # Adopt the implicit core_mood_tags table as an explicit through model
+        # so it can carry its own indexes. No schema change.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='MoodTag',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('mood', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.mood')),
+                        ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.tag')),
+                    ],
+                    options={
+                        'db_table': 'core_mood_tags',
+                        'unique_together': {('mood', 'tag')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='mood',
+                    name='tags',
+                    field=models.ManyToManyField(blank=True, through='core.MoodTag', to='core.tag'),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='moodtag',
+            index=models.Index(fields=['tag', 'mood'], name='core_moodtag_tag_mood_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mood',
+            index=models.Index(fields=['user', '-timestamp'], name='core_mood_user_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mood',
+            index=models.Index(fields=['user', 'emotion', 'timestamp'], name='core_mood_user_emo_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(fields=['intervention', 'result'], name='core_feedback_interv_res_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 6.0 on 2026-10-17 19:04
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_sync_markers(apps, schema_editor):
+    """Existing moods count as last edited when created; owners get a change marker"""
+    from django.utils import timezone
+
+    Mood = apps.get_model('core', 'Mood')
+    Profile = apps.get_model('core', 'Profile')
+
+    Mood.objects.update(updated_at=F('created_at'))
+    now = timezone.now()
+    user_ids = set(Mood.objects.filter(user__isnull=False).values_list('user_id', flat=True).distinct())
+    Profile.objects.filter(user_id__in=user_ids).update(moods_changed_at=now)
+    missing = user_ids - set(Profile.objects.filter(user_id__in=user_ids).values_list('user_id', flat=True))
+    Profile.objects.bulk_create([Profile(user_id=user_id, timezone=settings.TIME_ZONE, moods_changed_at=now) for user_id in missing])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_mood_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mood',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='moods_changed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='mood',
+            index=models.Index(fields=['user', 'updated_at'], name='core_mood_user_updated_idx'),
+        ),
+        migrations.RunPython(backfill_sync_markers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 6.0 on 2026-10-17 19:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_mood_sync'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommenderCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_feedback_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RecommenderStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('context', models.CharField(max_length=100)),
+                ('reward', models.FloatField(default=0)),
+                ('trials', models.IntegerField(default=0)),
+                ('intervention', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.intervention')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('context', 'intervention'), name='core_recstat_unique_context')],
+            },
+        ),
+    ]
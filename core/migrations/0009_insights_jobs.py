@@ -0,0 +1,53 @@
+# Generated by Django 6.0 on 2026-10-17 19:16
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def queue_insights(apps, schema_editor):
+    """Existing users with moods get their insights computed by the first worker run"""
+    Mood = apps.get_model('core', 'Mood')
+    Job = apps.get_model('core', 'Job')
+    user_ids = Mood.objects.filter(user__isnull=False).order_by().values_list('user_id', flat=True).distinct()
+    Job.objects.bulk_create([Job(kind='insights', user_id=user_id) for user_id in user_ids], ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('core', '0008_recommender'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Insight',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='insights', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('items', models.JSONField(default=list)),
+                ('computed_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=50)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('worker', models.CharField(blank=True, max_length=100)),
+                ('error', models.TextField(blank=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'run_after'], name='core_job_due_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status', 'pending')), fields=('kind', 'user'), name='core_job_one_pending_per_user')],
+            },
+        ),
+        migrations.RunPython(queue_insights, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 6.0 on 2026-10-17 19:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_insights_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MoodArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('path', models.CharField(max_length=500, unique=True)),
+                ('mood_count', models.IntegerField()),
+                ('size', models.BigIntegerField()),
+                ('sha256', models.CharField(max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['month'],
+            },
+        ),
+        migrations.AddField(
+            model_name='heatmapcell',
+            name='archived_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='heatmapcell',
+            name='archived_intensity_sum',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 6.0 on 2026-10-17 20:05
+
+from django.db import migrations
+
+
+def normalize_tag_names(apps, schema_editor):
+    """
+    Rename tags to their core.tags.normalize() form, merging tags that only
+    differed in case or spacing into one (the links of the others move to it).
+    """
+    Tag = apps.get_model('core', 'Tag')
+    MoodTag = apps.get_model('core', 'MoodTag')
+
+    groups = {}
+    for tag in Tag.objects.order_by('id'):
+        groups.setdefault(' '.join(tag.name.split()).casefold(), []).append(tag)
+
+    for name, group in groups.items():
+        # Keep the tag already spelled the normalized way, else the oldest one.
+        keeper = next((tag for tag in group if tag.name == name), group[0])
+        for tag in group:
+            if tag.pk == keeper.pk:
+                continue
+            MoodTag.objects.filter(tag_id=tag.pk).exclude(
+                mood_id__in=MoodTag.objects.filter(tag_id=keeper.pk).values('mood_id')
+            ).update(tag_id=keeper.pk)
+            tag.delete()
+        if keeper.name != name:
+            keeper.name = name
+            keeper.save(update_fields=['name'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_mood_archive'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_tag_names, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 6.0 on 2026-10-17 20:40
+
+from django.db import migrations
+
+
+def install_search_index(apps, schema_editor):
+    from core import search
+
+    search.install(schema_editor.connection.alias)
+
+
+def uninstall_search_index(apps, schema_editor):
+    from core import search
+
+    search.uninstall(schema_editor.connection.alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_normalize_tag_names'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-17 21:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_mood_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(fields=['created_at'], name='core_feedback_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mood',
+            index=models.Index(fields=['timestamp'], name='core_mood_ts_idx'),
+        ),
+    ]
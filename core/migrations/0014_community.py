@@ -0,0 +1,50 @@
+# Generated by Django 6.0 on 2026-10-17 21:45
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_admin_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommunityCell',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekday', models.PositiveSmallIntegerField()),
+                ('hour', models.PositiveSmallIntegerField()),
+                ('emotion', models.CharField(choices=[('joy', 'Joy'), ('sadness', 'Sadness'), ('anxiety', 'Anxiety'), ('anger', 'Anger'), ('fear', 'Fear'), ('disgust', 'Disgust'), ('surprise', 'Surprise'), ('neutral', 'Neutral'), ('excited', 'Excited'), ('calm', 'Calm')], max_length=20)),
+                ('count', models.IntegerField(default=0)),
+                ('intensity_sum', models.IntegerField(default=0)),
+                ('contributors', models.JSONField(default=list)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CommunityCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(blank=True, null=True)),
+                ('mood_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='mood',
+            index=models.Index(fields=['created_at', 'id'], name='core_mood_created_idx'),
+        ),
+        migrations.AddField(
+            model_name='communitycell',
+            name='tag',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.tag'),
+        ),
+        migrations.AddConstraint(
+            model_name='communitycell',
+            constraint=models.UniqueConstraint(fields=('tag', 'weekday', 'hour', 'emotion'), name='core_communitycell_unique_bucket'),
+        ),
+    ]
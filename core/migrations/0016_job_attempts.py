@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-17 23:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_mood_tombstones'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
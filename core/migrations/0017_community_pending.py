@@ -0,0 +1,59 @@
+# Generated by Django 6.0 on 2026-10-17 23:55
+
+from django.db import migrations, models
+from django.db.models import F, Q
+
+
+def queue_unmerged(apps, schema_editor):
+    """Queue the moods the old high-water mark had not reached yet"""
+    Checkpoint = apps.get_model('core', 'CommunityCheckpoint')
+    Mood = apps.get_model('core', 'Mood')
+    Pending = apps.get_model('core', 'CommunityPending')
+
+    moods = Mood.objects.using(schema_editor.connection.alias)
+    checkpoint = Checkpoint.objects.filter(pk=1, created_at__isnull=False).first()
+    if checkpoint is not None:
+        moods = moods.filter(
+            Q(created_at__gt=checkpoint.created_at) | Q(created_at=checkpoint.created_at, id__gt=checkpoint.mood_id)
+        )
+        Checkpoint.objects.filter(pk=1).update(merged_at=F('updated_at'))
+    sql, params = moods.order_by().values('id').query.sql_with_params()
+    schema_editor.execute(f'INSERT INTO {Pending._meta.db_table} (mood_id) {sql}', params)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_job_attempts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommunityPending',
+            fields=[
+                ('mood_id', models.BigIntegerField(primary_key=True, serialize=False)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='communitycheckpoint',
+            name='merged_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(queue_unmerged, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='communitycheckpoint',
+            name='created_at',
+        ),
+        migrations.RemoveField(
+            model_name='communitycheckpoint',
+            name='mood_id',
+        ),
+        migrations.RemoveField(
+            model_name='communitycheckpoint',
+            name='updated_at',
+        ),
+        migrations.RemoveIndex(
+            model_name='mood',
+            name='core_mood_created_idx',
+        ),
+    ]
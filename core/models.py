@@ -1,4 +1,9 @@
-from django.db import models
+import datetime
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.functions import Cast, Round
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
@@ -30,30 +35,147 @@ class Intervention(models.Model):
         """
         Calculate community success score between -1.0 and 1.0
         Formula: (helped - worse) / total_votes
+
+        Reads the denormalized InterventionScore row, so callers that
+        select_related('score_summary') pay no extra queries.
         """
-        feedbacks = self.feedback_set.all()
-        if not feedbacks.exists():
-            return 0.0
-        
-        helped = feedbacks.filter(result='helped').count()
-        no_change = feedbacks.filter(result='no_change').count()
-        worse = feedbacks.filter(result='worse').count()
-        total = helped + no_change + worse
-        
-        if total == 0:
-            return 0.0
-        
-        score = (helped - worse) / total
-        return round(score, 2)
+        summary = self._get_score_summary()
+        return summary.score if summary else 0.0
     
     def get_total_votes(self):
         """Get total number of feedback votes"""
-        return self.feedback_set.count()
+        summary = self._get_score_summary()
+        return summary.total_votes if summary else 0
+    
+    def _get_score_summary(self):
+        try:
+            return self.score_summary
+        except InterventionScore.DoesNotExist:
+            return None
     
     class Meta:
         ordering = ['-created_at']
 
 
+class InterventionScore(models.Model):
+    """
+    Denormalized feedback aggregate for one intervention.
+
+    Kept in step with Feedback inside the same transaction (see
+    core.signals), so ranking is a single indexed ORDER BY instead of
+    four COUNT queries per intervention.
+    """
+    intervention = models.OneToOneField(
+        Intervention,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='score_summary'
+    )
+    helped = models.PositiveIntegerField(default=0)
+    no_change = models.PositiveIntegerField(default=0)
+    worse = models.PositiveIntegerField(default=0)
+    total_votes = models.PositiveIntegerField(default=0)
+    score = models.FloatField(default=0.0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    RESULT_FIELDS = ('helped', 'no_change', 'worse')
+    
+    def __str__(self):
+        return f"{self.intervention_id}: {self.score} ({self.total_votes} votes)"
+    
+    @classmethod
+    def apply_vote(cls, intervention_id, result, delta, rebuild_missing=True):
+        """
+        Add (delta=1) or remove (delta=-1) one vote in a single UPDATE.
+
+        The score is recomputed in the same statement from the post-update
+        counts, so concurrent writers never see a stale score.
+        """
+        if result not in cls.RESULT_FIELDS:
+            return
+        field = result
+        helped = F('helped') + (delta if field == 'helped' else 0)
+        worse = F('worse') + (delta if field == 'worse' else 0)
+        total = F('total_votes') + delta
+        updated = cls.objects.filter(intervention_id=intervention_id).update(**{
+            field: F(field) + delta,
+            'total_votes': total,
+            'score': Case(
+                When(**{'total_votes__lte': -delta}, then=Value(0.0)),
+                default=Round(
+                    Cast(helped - worse, FloatField()) / Cast(total, FloatField()),
+                    2
+                ),
+                output_field=FloatField(),
+            ),
+            'updated_at': timezone.now(),
+        })
+        if not updated and rebuild_missing:
+            # Row missing (e.g. created before this table existed) - rebuild it.
+            cls.rebuild(intervention_ids=[intervention_id])
+    
+    @classmethod
+    def rebuild(cls, intervention_ids=None):
+        """
+        Recompute rows from the Feedback table with one grouped query.
+        Returns the number of rows written.
+        """
+        interventions = Intervention.objects.all()
+        feedback = Feedback.objects.all()
+        if intervention_ids is not None:
+            interventions = interventions.filter(id__in=intervention_ids)
+            feedback = feedback.filter(intervention_id__in=intervention_ids)
+        
+        counts = {}
+        for row in feedback.order_by().values('intervention_id', 'result').annotate(
+            n=models.Count('id')
+        ):
+            counts.setdefault(row['intervention_id'], {})[row['result']] = row['n']
+        
+        rows = []
+        for intervention_id in interventions.values_list('id', flat=True):
+            c = counts.get(intervention_id, {})
+            helped = c.get('helped', 0)
+            no_change = c.get('no_change', 0)
+            worse = c.get('worse', 0)
+            total = helped + no_change + worse
+            rows.append(cls(
+                intervention_id=intervention_id,
+                helped=helped,
+                no_change=no_change,
+                worse=worse,
+                total_votes=total,
+                score=round((helped - worse) / total, 2) if total else 0.0,
+                updated_at=timezone.now(),
+            ))
+        
+        with transaction.atomic():
+            cls.objects.bulk_create(
+                rows,
+                batch_size=500,
+                update_conflicts=True,
+                unique_fields=['intervention'],
+                update_fields=['helped', 'no_change', 'worse', 'total_votes', 'score', 'updated_at'],
+            )
+        return len(rows)
+    
+    @classmethod
+    def top_interventions(cls, limit=5):
+        """
+        Active interventions ranked by score, then votes - one indexed query.
+        Each is annotated with its `score` and `votes`.
+        """
+        return list(Intervention.objects.filter(is_active=True).annotate(
+            score=F('score_summary__score'),
+            votes=F('score_summary__total_votes'),
+        ).filter(score__isnull=False).order_by('-score', '-votes')[:limit])
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['-score', '-total_votes'], name='core_score_rank_idx'),
+        ]
+
+
 class Mood(models.Model):
     """Individual mood log entries - NOW WITH USER"""
     EMOTION_CHOICES = [
@@ -76,9 +198,10 @@ class Mood(models.Model):
         help_text="Rate intensity from 1 (low) to 10 (high)"
     )
     note = models.TextField(blank=True, null=True, max_length=500)
-    tags = models.ManyToManyField(Tag, blank=True)
+    tags = models.ManyToManyField(Tag, blank=True, through='MoodTag')
     timestamp = models.DateTimeField(default=timezone.now)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     suggested_intervention = models.ForeignKey(
         Intervention, 
@@ -99,8 +222,70 @@ class Mood(models.Model):
         """Returns day of week (0=Monday, 6=Sunday)"""
         return self.timestamp.weekday()
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Snapshot of the aggregated fields so edits can be applied as deltas.
+        instance._loaded_values = instance.get_aggregate_values()
+        return instance
+    
+    def get_aggregate_values(self):
+        """Fields the derived per-user aggregates are built from"""
+        return (
+            self.__dict__.get('user_id'),
+            self.__dict__.get('timestamp'),
+            self.__dict__.get('emotion'),
+            self.__dict__.get('intensity'),
+        )
+    
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            # Per-user timelines: recent moods, date ranges, exports, API paging.
+            models.Index(fields=['user', '-timestamp'], name='core_mood_user_ts_idx'),
+            # Per-user emotion filters over a date range.
+            models.Index(fields=['user', 'emotion', 'timestamp'], name='core_mood_user_emo_ts_idx'),
+            # Incremental sync: what changed since X.
+            models.Index(fields=['user', 'updated_at'], name='core_mood_user_updated_idx'),
+            # Across users: the admin changelist and its date drill-down, archiving cutoffs.
+            models.Index(fields=['timestamp'], name='core_mood_ts_idx'),
+        ]
+
+
+class MoodTag(models.Model):
+    """Mood-Tag link table (the table Django used to create implicitly)"""
+    mood = models.ForeignKey(Mood, on_delete=models.CASCADE)
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE)
+    
+    def __str__(self):
+        return f"{self.mood_id} #{self.tag_id}"
+    
+    class Meta:
+        db_table = 'core_mood_tags'
+        unique_together = [['mood', 'tag']]
+        indexes = [
+            # Tag-first lookups ("moods with #work") without touching the unique index.
+            models.Index(fields=['tag', 'mood'], name='core_moodtag_tag_mood_idx'),
+        ]
+
+
+class MoodTombstone(models.Model):
+    """
+    A deleted mood, so API clients syncing with `since` learn to drop it
+    (see views.api_deleted_moods). Archived moods are not deleted as far
+    as sync is concerned and get none.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    mood_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+    
+    def __str__(self):
+        return f"{self.user_id}: mood {self.mood_id} deleted at {self.deleted_at}"
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'deleted_at'], name='core_tombstone_user_del_idx'),
+        ]
 
 
 class Feedback(models.Model):
@@ -119,5 +304,272 @@ class Feedback(models.Model):
     def __str__(self):
         return f"{self.intervention.title} - {self.result}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what was loaded so edits can move the vote between buckets.
+        # With either field deferred, the vote is read back when saving (see core.signals).
+        if 'intervention_id' in instance.__dict__ and 'result' in instance.__dict__:
+            instance._loaded_vote = (instance.intervention_id, instance.result)
+        return instance
+    
+    def save(self, *args, **kwargs):
+        # The score table is updated by signals; keep both writes in one transaction.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+    
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['intervention', 'result'], name='core_feedback_interv_res_idx'),
+            # Admin changelist order and its date drill-down.
+            models.Index(fields=['created_at'], name='core_feedback_created_idx'),
+        ]
+
+
+class Profile(models.Model):
+    """Per-user preferences and bookkeeping"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
+    timezone = models.CharField(max_length=64, default='UTC')
+    # Last time any of the user's moods (or their tags) changed; drives API ETags.
+    moods_changed_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.user} ({self.timezone})"
+    
+    @classmethod
+    def touch_moods(cls, user_id):
+        """Record that the user's moods just changed"""
+        now = timezone.now()
+        if not cls.objects.filter(user_id=user_id).update(moods_changed_at=now):
+            # Buckets stay in the zone get_user_timezone() assumed so far.
+            cls.objects.get_or_create(
+                user_id=user_id, defaults={'timezone': settings.TIME_ZONE, 'moods_changed_at': now}
+            )
+        return now
+
+
+class HeatmapCell(models.Model):
+    """
+    One cell of a user's day x hour x emotion heatmap cube.
+    Weekday and hour are bucketed in the user's Profile.timezone.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='heatmap_cells')
+    weekday = models.PositiveSmallIntegerField()  # 0=Monday, 6=Sunday
+    hour = models.PositiveSmallIntegerField()
+    emotion = models.CharField(max_length=20, choices=Mood.EMOTION_CHOICES)
+    count = models.IntegerField(default=0)
+    intensity_sum = models.IntegerField(default=0)
+    # Part of count/intensity_sum from archived moods, which rebuilds can't recount.
+    archived_count = models.IntegerField(default=0)
+    archived_intensity_sum = models.IntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.user_id} {self.weekday}/{self.hour} {self.emotion}: {self.count}"
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'weekday', 'hour', 'emotion'],
+                name='core_heatmapcell_unique_bucket'
+            ),
+        ]
+
+
+class DailyRollup(models.Model):
+    """
+    Per-user, per-local-date summary of Mood rows.
+    Analytics views read these O(days) rows instead of O(moods) raw rows.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_rollups')
+    date = models.DateField()
+    count = models.IntegerField(default=0)
+    intensity_sum = models.IntegerField(default=0)
+    intensity_sq_sum = models.IntegerField(default=0)
+    intensity_min = models.PositiveSmallIntegerField(null=True)
+    intensity_max = models.PositiveSmallIntegerField(null=True)
+    emotion_counts = models.JSONField(default=dict)  # {'joy': 3, ...}
+    hour_counts = models.JSONField(default=list)  # 24 counts
+    hour_intensity = models.JSONField(default=list)  # 24 intensity sums
+    
+    def __str__(self):
+        return f"{self.user_id} {self.date}: {self.count}"
+    
+    @property
+    def avg_intensity(self):
+        return self.intensity_sum / self.count if self.count else None
+    
+    class Meta:
+        ordering = ['date']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'date'], name='core_dailyrollup_unique_day'),
+        ]
+
+
+class MoodArchive(models.Model):
+    """
+    One compressed file of moods moved out of Mood by `manage.py
+    archive_moods` (see core.archive). Their rollups and heatmap cells
+    stay live, so archived history still counts everywhere.
+    """
+    month = models.DateField()  # first day of the UTC calendar month archived
+    path = models.CharField(max_length=500, unique=True)
+    mood_count = models.IntegerField()
+    size = models.BigIntegerField()  # compressed bytes
+    sha256 = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.month:%Y-%m}: {self.mood_count} moods"
+    
+    @staticmethod
+    def month_start(date, months=0):
+        """First day of date's month, shifted by `months` calendar months"""
+        index = date.year * 12 + date.month - 1 + months
+        return datetime.date(index // 12, index % 12 + 1, 1)
+    
+    @classmethod
+    def hot_cutoff(cls, now=None):
+        """First instant (UTC) of the oldest month kept in Mood, settings.MOOD_HOT_MONTHS back"""
+        today = (now or timezone.now()).astimezone(datetime.timezone.utc).date()
+        start = cls.month_start(today, -(settings.MOOD_HOT_MONTHS - 1))
+        return datetime.datetime.combine(start, datetime.time.min, tzinfo=datetime.timezone.utc)
+    
+    @classmethod
+    def horizon(cls):
+        """End (UTC) of the newest archived month, or None when nothing is archived"""
+        month = cls.objects.order_by('-month').values_list('month', flat=True).first()
+        if month is None:
+            return None
+        return datetime.datetime.combine(cls.month_start(month, 1), datetime.time.min, tzinfo=datetime.timezone.utc)
+    
+    class Meta:
+        ordering = ['month']
+
+
+class CommunityCell(models.Model):
+    """
+    One cell of the anonymized community day x hour x emotion cube, over
+    every user's moods (tag empty) or those with one tag. Weekday and hour
+    are each mood owner's local time. Maintained by core.community.
+    """
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    weekday = models.PositiveSmallIntegerField()  # 0=Monday, 6=Sunday
+    hour = models.PositiveSmallIntegerField()
+    emotion = models.CharField(max_length=20, choices=Mood.EMOTION_CHOICES)
+    count = models.IntegerField(default=0)
+    intensity_sum = models.IntegerField(default=0)
+    # Keyed hashes of the first settings.COMMUNITY_MIN_USERS users seen, for suppression.
+    contributors = models.JSONField(default=list)
+    
+    def __str__(self):
+        return f"{self.tag_id or 'all'} {self.weekday}/{self.hour} {self.emotion}: {self.count}"
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['tag', 'weekday', 'hour', 'emotion'],
+                name='core_communitycell_unique_bucket'
+            ),
+        ]
+
+
+class CommunityCheckpoint(models.Model):
+    """Single row, locked by each merge into CommunityCell so two runs never take the same moods"""
+    merged_at = models.DateTimeField(null=True, blank=True)  # when the cubes last took in moods
+    
+    def __str__(self):
+        return f"Community merged at {self.merged_at}"
+
+
+class CommunityPending(models.Model):
+    """
+    A mood not merged into CommunityCell yet. Written in the mood's own
+    transaction, so a merge sees it exactly when the mood is committed.
+    """
+    mood_id = models.BigIntegerField(primary_key=True)
+    
+    def __str__(self):
+        return f"Mood #{self.mood_id} pending"
+
+
+class RecommenderStat(models.Model):
+    """
+    Checkpointed reward totals of the contextual recommender (see
+    core.recommender), one row per context key and intervention.
+    """
+    context = models.CharField(max_length=100)  # e.g. "anxiety|high|#work"
+    intervention = models.ForeignKey(Intervention, on_delete=models.CASCADE, related_name='+')
+    reward = models.FloatField(default=0)  # helped = 1, no change = 0.5, worse = 0
+    trials = models.IntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.context} / {self.intervention_id}: {self.reward}/{self.trials}"
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['context', 'intervention'], name='core_recstat_unique_context'),
+        ]
+
+
+class RecommenderCheckpoint(models.Model):
+    """Single row: the last Feedback folded into RecommenderStat"""
+    last_feedback_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Checkpoint at feedback {self.last_feedback_id}"
+
+
+class Insight(models.Model):
+    """A user's precomputed insights (see core.insights), refreshed by a background job"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='insights')
+    items = models.JSONField(default=list)  # [{'kind', 'icon', 'text'}, ...] in display order
+    computed_at = models.DateTimeField()
+    
+    def __str__(self):
+        return f"Insights for {self.user_id} ({len(self.items)})"
+
+
+class Job(models.Model):
+    """
+    A unit of background work run by `manage.py run_jobs` (see core.jobs).
+    At most one pending job per kind and user, so bursts of writes collapse
+    into a single run.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (FAILED, 'Failed'),
+    ]
+    
+    kind = models.CharField(max_length=50)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    run_after = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)  # failed runs so far
+    error = models.TextField(blank=True)
+    
+    def __str__(self):
+        return f"{self.kind} for {self.user_id} ({self.status})"
+    
     class Meta:
-        ordering = ['-created_at']
\ No newline at end of file
+        constraints = [
+            models.UniqueConstraint(
+                fields=['kind', 'user'], condition=models.Q(status='pending'),
+                name='core_job_one_pending_per_user',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='core_job_due_idx'),
+        ]
@@ -0,0 +1,382 @@
+"""
+Contextual bandit recommender for intervention suggestions.
+
+Reward totals (helped = 1, no change = 0.5, worse = 0) are kept per
+intervention for a hierarchy of context keys:
+
+    *                       every mood
+    anxiety                 emotion
+    anxiety|high            emotion and intensity bucket
+    anxiety|high|#work      ... and one of the mood's tags
+    anxiety|high|@evening   ... and the local time of day
+
+Each level's estimate is shrunk towards its parent's, so sparse contexts
+fall back to broader ones; a mood's score is the mean of its tag and
+time-of-day estimates. Feedback updates the statistics as it arrives
+(see core.signals), there is no training step.
+
+Durable state is RecommenderStat plus every Feedback newer than
+RecommenderCheckpoint.last_feedback_id, which is replayed on load, so
+any process rebuilds the same statistics. `run_jobs` folds the replay
+into the checkpoint once it grows past CHECKPOINT_EVERY events, so no
+request pays for that. Candidates come from per-key shortlists plus one
+exploration pick from core.sampler, so serving costs a few dozen
+estimates however large the library gets.
+"""
+import heapq
+import math
+import random
+import threading
+import time
+import zoneinfo
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+from . import sampler
+from .models import Feedback, MoodTag, Profile, RecommenderCheckpoint, RecommenderStat
+from .timezones import get_zone
+
+PRIOR_STRENGTH = 4  # pseudo-trials of the parent context behind each estimate
+SHORTLIST_SIZE = 30
+MAX_AGE = 600  # seconds before a process reloads to pick up other processes' feedback
+CHECKPOINT_EVERY = 1000  # run_jobs folds into RecommenderStat once this many events wait to be replayed
+VERSION_KEY = 'recommender:version'
+
+REWARDS = {'helped': 1.0, 'no_change': 0.5, 'worse': 0.0}
+DAYPARTS = [(0, 'night'), (6, 'morning'), (12, 'afternoon'), (18, 'evening')]
+
+
+def intensity_bucket(intensity):
+    if intensity <= 3:
+        return 'low'
+    if intensity <= 7:
+        return 'mid'
+    return 'high'
+
+
+def daypart(hour):
+    return [name for start, name in DAYPARTS if hour >= start][-1]
+
+
+def context_keys(emotion, intensity, tags=(), hour=None):
+    """Keys from broadest to most specific: *, emotion, emotion|bucket, then one per feature"""
+    base = f'{emotion}|{intensity_bucket(intensity)}'
+    features = [f'{base}|#{tag}' for tag in sorted(set(tags))]
+    if hour is not None:
+        features.append(f'{base}|@{daypart(hour)}')
+    return ['*', emotion, base] + features
+
+
+class Recommender:
+    """In-memory reward totals: {context key: {intervention id: [reward, trials]}}"""
+    def __init__(self, stats=None, last_feedback_id=0, version=None):
+        self.stats = stats or {}
+        self.last_feedback_id = last_feedback_id
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.lock = threading.Lock()
+        self._shortlists = {}
+
+    def record(self, keys, intervention_id, result, delta=1):
+        reward = REWARDS.get(result)
+        if reward is None:
+            return
+        with self.lock:
+            for key in keys:
+                cell = self.stats.setdefault(key, {}).setdefault(intervention_id, [0.0, 0])
+                cell[0] += delta * reward
+                cell[1] += delta
+                self._shortlists.pop(key, None)
+
+    def _cell(self, key, intervention_id):
+        return self.stats.get(key, {}).get(intervention_id, (0.0, 0))
+
+    def estimate(self, intervention_id, keys):
+        """(posterior mean reward, effective trials) of an intervention in a context"""
+        reward, trials = self._cell('*', intervention_id)
+        mean = (reward + 1) / (trials + 2)
+        for key in keys[1:3]:
+            reward, trials = self._cell(key, intervention_id)
+            mean = (reward + PRIOR_STRENGTH * mean) / (trials + PRIOR_STRENGTH)
+        effective = trials + PRIOR_STRENGTH
+        features = keys[3:]
+        if features:
+            total = 0.0
+            for key in features:
+                reward, trials = self._cell(key, intervention_id)
+                total += (reward + PRIOR_STRENGTH * mean) / (trials + PRIOR_STRENGTH)
+            mean = total / len(features)
+        return mean, effective
+
+    def shortlist(self, key):
+        """Best SHORTLIST_SIZE intervention ids by their own mean under one key"""
+        ids = self._shortlists.get(key)
+        if ids is None:
+            cells = dict(self.stats.get(key, {}))
+            ids = heapq.nlargest(SHORTLIST_SIZE, cells, key=lambda pk: (cells[pk][0] + 1) / (cells[pk][1] + 2))
+            self._shortlists[key] = ids
+        return ids
+
+    def candidates(self, keys):
+        return set(self.shortlist('*')).union(*(self.shortlist(key) for key in keys[1:]))
+
+    def rank(self, keys, candidates, k=3, rng=None):
+        """Top-k candidate ids by posterior mean, or by one Thompson draw each when rng is given"""
+        scored = []
+        for pk in candidates:
+            mean, effective = self.estimate(pk, keys)
+            score = rng.betavariate(mean * effective, (1 - mean) * effective) if rng else mean
+            scored.append((score, pk))
+        return [pk for score, pk in heapq.nlargest(k, scored)]
+
+
+def iter_feedback_events(after_id=0, until_id=None, chunk_size=2000):
+    """(feedback id, intervention id, result, context keys) for Feedback in (after_id, until_id], in id order"""
+    default_zone = zoneinfo.ZoneInfo(settings.TIME_ZONE)
+    zones = {}
+    feedback = Feedback.objects.filter(id__gt=after_id)
+    if until_id is not None:
+        feedback = feedback.filter(id__lte=until_id)
+    rows = feedback.order_by('id').values_list(
+        'id', 'intervention_id', 'result', 'mood_id',
+        'mood__emotion', 'mood__intensity', 'mood__timestamp', 'mood__user_id',
+    ).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        tags = {}
+        for mood_id, name in MoodTag.objects.filter(
+            mood_id__in={row[3] for row in chunk}
+        ).values_list('mood_id', 'tag__name'):
+            tags.setdefault(mood_id, []).append(name)
+        missing = {row[7] for row in chunk} - set(zones)
+        for user_id, tzname in Profile.objects.filter(user_id__in=missing).values_list('user_id', 'timezone'):
+            zones[user_id] = get_zone(tzname)
+        for feedback_id, intervention_id, result, mood_id, emotion, intensity, timestamp, user_id in chunk:
+            hour = timestamp.astimezone(zones.get(user_id) or default_zone).hour
+            yield feedback_id, intervention_id, result, context_keys(emotion, intensity, tags.get(mood_id, ()), hour)
+
+
+def feedback_keys(feedback):
+    """Context keys of one saved Feedback's mood, or None if it is gone"""
+    for feedback_id, intervention_id, result, keys in iter_feedback_events(feedback.pk - 1, feedback.pk):
+        return keys
+    return None
+
+
+def load():
+    """Checkpointed statistics plus a replay of newer Feedback"""
+    last = RecommenderCheckpoint.objects.values_list('last_feedback_id', flat=True).first() or 0
+    stats = {}
+    for context, pk, reward, trials in RecommenderStat.objects.values_list(
+        'context', 'intervention_id', 'reward', 'trials'
+    ).iterator(chunk_size=5000):
+        stats.setdefault(context, {})[pk] = [reward, trials]
+    recommender = Recommender(stats, last, cache.get(VERSION_KEY))
+    for feedback_id, intervention_id, result, keys in iter_feedback_events(after_id=last):
+        recommender.record(keys, intervention_id, result)
+        recommender.last_feedback_id = feedback_id
+    return recommender
+
+
+def checkpoint_if_behind(threshold=CHECKPOINT_EVERY):
+    """checkpoint() once `threshold` Feedback wait to be replayed on load; returns the number folded"""
+    last = RecommenderCheckpoint.objects.values_list('last_feedback_id', flat=True).first() or 0
+    if Feedback.objects.filter(id__gt=last).count() < threshold:
+        return 0
+    return checkpoint()
+
+
+def checkpoint(rebuild=False):
+    """
+    Fold Feedback newer than the checkpoint into RecommenderStat (all of
+    it with rebuild=True). Returns the number of feedback events folded.
+    """
+    with transaction.atomic():
+        state, created = RecommenderCheckpoint.objects.select_for_update().get_or_create(pk=1)
+        if rebuild:
+            RecommenderStat.objects.all().delete()
+            state.last_feedback_id = 0
+
+        deltas = {}
+        folded = 0
+        for feedback_id, intervention_id, result, keys in iter_feedback_events(after_id=state.last_feedback_id):
+            for key in keys:
+                cell = deltas.setdefault((key, intervention_id), [0.0, 0])
+                cell[0] += REWARDS[result]
+                cell[1] += 1
+            state.last_feedback_id = feedback_id
+            folded += 1
+
+        contexts = sorted({key for key, pk in deltas})
+        for start in range(0, len(contexts), 500):
+            existing = RecommenderStat.objects.filter(context__in=contexts[start:start + 500])
+            for context, pk, reward, trials in existing.values_list('context', 'intervention_id', 'reward', 'trials'):
+                cell = deltas.get((context, pk))
+                if cell is not None:
+                    cell[0] += reward
+                    cell[1] += trials
+        RecommenderStat.objects.bulk_create(
+            [
+                RecommenderStat(context=key, intervention_id=pk, reward=reward, trials=trials)
+                for (key, pk), (reward, trials) in deltas.items()
+            ],
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=['context', 'intervention'],
+            update_fields=['reward', 'trials'],
+        )
+        state.save()
+    return folded
+
+
+def correct_checkpoint(feedback_id, keys, intervention_id, result, delta):
+    """Apply an edit or deletion of already-checkpointed feedback to RecommenderStat"""
+    last = RecommenderCheckpoint.objects.values_list('last_feedback_id', flat=True).first()
+    if not last or feedback_id > last or result not in REWARDS:
+        return
+    if delta > 0:
+        # A vote moved to another intervention may be its first in some of these contexts.
+        RecommenderStat.objects.bulk_create(
+            [RecommenderStat(context=key, intervention_id=intervention_id) for key in keys], ignore_conflicts=True,
+        )
+    RecommenderStat.objects.filter(context__in=keys, intervention_id=intervention_id).update(
+        reward=F('reward') + delta * REWARDS[result],
+        trials=F('trials') + delta,
+    )
+
+
+_recommender = None
+_load_lock = threading.Lock()
+
+
+def get_recommender():
+    """The process's recommender, reloaded when reset elsewhere or older than MAX_AGE"""
+    global _recommender
+    version = cache.get(VERSION_KEY)
+    current = _recommender
+    if current is None or current.version != version or time.monotonic() - current.loaded_at > MAX_AGE:
+        with _load_lock:
+            if _recommender is current:
+                _recommender = load()
+            current = _recommender
+    return current
+
+
+def is_loaded():
+    return _recommender is not None
+
+
+def record(keys, intervention_id, result, delta=1):
+    """Fold a vote into this process's statistics, if loaded"""
+    if _recommender is not None:
+        _recommender.record(keys, intervention_id, result, delta)
+
+
+def invalidate():
+    """Make every process reload on its next suggestion (e.g. after bulk-loading Feedback)"""
+    global _recommender
+    _recommender = None
+    cache.set(VERSION_KEY, time.time_ns(), None)
+
+
+def suggest(emotion, intensity, tags=(), hour=None, rng=random):
+    """
+    Id of the intervention to suggest for a mood, or None. Thompson
+    sampling over the context's shortlist plus one exploration pick.
+    """
+    recommender = get_recommender()
+    active = sampler.get_index()
+    keys = context_keys(emotion, intensity, tags, hour)
+    candidates = {pk for pk in recommender.candidates(keys) if pk in active.positions}
+    explore = active.sample(emotion, rng)
+    if explore is not None:
+        candidates.add(explore)
+    if not candidates:
+        return None
+    return recommender.rank(keys, candidates, k=1, rng=rng)[0]
+
+
+def recommend(emotion, intensity, tags=(), hour=None, k=3):
+    """Ids of the k active interventions with the best expected reward for a mood"""
+    recommender = get_recommender()
+    active = sampler.get_index()
+    keys = context_keys(emotion, intensity, tags, hour)
+    candidates = [pk for pk in recommender.candidates(keys) if pk in active.positions]
+    return recommender.rank(keys, candidates, k=k)
+
+
+# Offline evaluation
+
+def _random_policy(recommender, keys, candidates, rng):
+    return rng.choice(candidates)
+
+
+def _popular_policy(recommender, keys, candidates, rng):
+    return recommender.rank(keys[:1], candidates, k=1)[0]
+
+
+def _contextual_policy(recommender, keys, candidates, rng):
+    return recommender.rank(keys, candidates, k=1)[0]
+
+
+def _thompson_policy(recommender, keys, candidates, rng):
+    return recommender.rank(keys, candidates, k=1, rng=rng)[0]
+
+
+POLICIES = {
+    'random': _random_policy,
+    'popular': _popular_policy,
+    'contextual': _contextual_policy,
+    'contextual-thompson': _thompson_policy,
+}
+
+
+def replay(events, policies=None, seed=0):
+    """
+    Replay evaluation (Li et al., 2011): walk logged feedback in order; a
+    policy scores an event only when it would have picked the logged
+    intervention, and learns only from the events it scored. Unbiased when
+    the log was collected by uniform random suggestion, as log_mood did
+    before the sampler; later logs favour the policy that produced them.
+
+    Returns {policy: {'matched', 'events', 'mean_reward', 'stderr'}}.
+    """
+    rng = random.Random(seed)
+    names = policies or list(POLICIES)
+    learners = {name: Recommender() for name in names}
+    totals = {name: [0, 0.0, 0.0] for name in names}  # matched, sum, sum of squares
+    candidates = []
+    seen = set()
+    events_seen = 0
+    for feedback_id, intervention_id, result, keys in events:
+        events_seen += 1
+        if intervention_id not in seen:
+            seen.add(intervention_id)
+            candidates.append(intervention_id)
+        for name in names:
+            if POLICIES[name](learners[name], keys, candidates, rng) != intervention_id:
+                continue
+            reward = REWARDS[result]
+            total = totals[name]
+            total[0] += 1
+            total[1] += reward
+            total[2] += reward * reward
+            learners[name].record(keys, intervention_id, result)
+
+    results = {}
+    for name, (matched, reward_sum, reward_sq) in totals.items():
+        mean = reward_sum / matched if matched else None
+        variance = reward_sq / matched - mean * mean if matched else None
+        results[name] = {
+            'events': events_seen,
+            'matched': matched,
+            'mean_reward': mean,
+            'stderr': math.sqrt(max(variance, 0) / matched) if matched else None,
+        }
+    return results
@@ -0,0 +1,290 @@
+"""
+Daily rollups: one DailyRollup row per user per local date.
+
+Mood writes refresh the affected days (see core.signals), so dashboard,
+weekly report, comparison and insights aggregate a handful of rollup rows
+instead of scanning every Mood the user has logged.
+
+Days holding archived moods (see core.archive) can't be recomputed from
+Mood any more: rebuilds keep them as they are and writes to them are
+applied as deltas.
+"""
+import datetime
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import streaks
+from .models import DailyRollup, Mood, MoodArchive
+from .timezones import get_user_timezone
+
+UPDATE_FIELDS = [
+    'count', 'intensity_sum', 'intensity_sq_sum', 'intensity_min', 'intensity_max',
+    'emotion_counts', 'hour_counts', 'hour_intensity',
+]
+
+
+def local_date(timestamp, zone):
+    return timestamp.astimezone(zone).date()
+
+
+def local_today(zone):
+    return timezone.now().astimezone(zone).date()
+
+
+def day_bounds(date, zone):
+    """[start, end) of a local date as aware datetimes"""
+    start = datetime.datetime.combine(date, datetime.time.min, tzinfo=zone)
+    end = datetime.datetime.combine(date + datetime.timedelta(days=1), datetime.time.min, tzinfo=zone)
+    return start, end
+
+
+def _new_rollup(user_id, date):
+    return DailyRollup(
+        user_id=user_id, date=date, count=0, intensity_sum=0, intensity_sq_sum=0,
+        intensity_min=None, intensity_max=None, emotion_counts={},
+        hour_counts=[0] * 24, hour_intensity=[0] * 24,
+    )
+
+
+def build_rollups(user_id, moods, zone):
+    """Fold (timestamp, emotion, intensity) rows into {date: DailyRollup}"""
+    days = {}
+    for timestamp, emotion, intensity in moods:
+        local = timestamp.astimezone(zone)
+        day = days.get(local.date())
+        if day is None:
+            day = days[local.date()] = _new_rollup(user_id, local.date())
+        day.count += 1
+        day.intensity_sum += intensity
+        day.intensity_sq_sum += intensity * intensity
+        day.intensity_min = intensity if day.intensity_min is None else min(day.intensity_min, intensity)
+        day.intensity_max = intensity if day.intensity_max is None else max(day.intensity_max, intensity)
+        day.emotion_counts[emotion] = day.emotion_counts.get(emotion, 0) + 1
+        day.hour_counts[local.hour] += 1
+        day.hour_intensity[local.hour] += intensity
+    return days
+
+
+def _mood_rows(user_id, start=None, end=None, within=Q()):
+    moods = Mood.objects.filter(within, user_id=user_id)
+    if start is not None:
+        moods = moods.filter(timestamp__gte=start)
+    if end is not None:
+        moods = moods.filter(timestamp__lt=end)
+    return moods.order_by().values_list('timestamp', 'emotion', 'intensity').iterator(chunk_size=2000)
+
+
+def archived_through(zone, since=None):
+    """
+    Last local date whose rollup counts archived moods, or None. Pass the
+    oldest timestamp of interest as `since` to skip the lookup when its
+    local date is after every date the hot window's cutoff touches:
+    that cutoff's local day can hold archived moods on either side of it.
+    """
+    if since is not None:
+        cutoff = MoodArchive.hot_cutoff()
+        if local_date(since, zone) > local_date(cutoff - datetime.timedelta(microseconds=1), zone):
+            return None
+    horizon = MoodArchive.horizon()
+    return local_date(horizon - datetime.timedelta(microseconds=1), zone) if horizon else None
+
+
+def _hot_start(through, zone):
+    """Start of the days that can be rebuilt from Mood"""
+    return day_bounds(through + datetime.timedelta(days=1), zone)[0] if through else None
+
+
+def _save(user_id, days, dates=None, after=None):
+    """
+    Upsert the given rollups and drop days in `dates` that no longer have
+    moods; without `dates`, replace every day later than `after`.
+    """
+    with transaction.atomic():
+        if dates is None:
+            stale = DailyRollup.objects.filter(user_id=user_id)
+            if after is not None:
+                stale = stale.filter(date__gt=after)
+            stale.delete()
+        else:
+            empty = set(dates) - set(days)
+            if empty:
+                DailyRollup.objects.filter(user_id=user_id, date__in=empty).delete()
+        DailyRollup.objects.bulk_create(
+            list(days.values()),
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=['user', 'date'],
+            update_fields=UPDATE_FIELDS,
+        )
+    # Streaks are derived from which days have rollups. Dropping them before the
+    # commit would let a concurrent read cache the old days again.
+    transaction.on_commit(lambda: streaks.invalidate(user_id))
+
+
+def refresh_days(user_id, dates, zone=None):
+    """Recompute the rollups of the given local dates from their moods"""
+    if user_id is None or not dates:
+        return
+    zone = zone or get_user_timezone(user_id)
+    # Only the runs of consecutive dates are read: a mood moved across a
+    # year must not rescan the year in between.
+    within = Q()
+    for first, last in streaks.islands(sorted(dates)):
+        within |= Q(timestamp__gte=day_bounds(first, zone)[0], timestamp__lt=day_bounds(last, zone)[1])
+    days = {
+        date: rollup
+        for date, rollup in build_rollups(user_id, _mood_rows(user_id, within=within), zone).items()
+        if date in dates
+    }
+    _save(user_id, days, dates)
+
+
+def apply_changes(user_id, changes, zone=None):
+    """
+    Bring the rollups up to date with (Mood.get_aggregate_values(), sign)
+    changes: hot days are recomputed, archived ones get the change added
+    or subtracted (their min/max can only widen). Returns the local dates
+    touched.
+    """
+    zone = zone or get_user_timezone(user_id)
+    dates = {local_date(values[1], zone) for values, sign in changes}
+    through = archived_through(zone, since=min(values[1] for values, sign in changes))
+    cold = [(values, sign) for values, sign in changes if through and local_date(values[1], zone) <= through]
+    if cold:
+        _apply_deltas(user_id, cold, zone)
+    refresh_days(user_id, {date for date in dates if not through or date > through}, zone=zone)
+    return dates
+
+
+def _apply_deltas(user_id, changes, zone):
+    with transaction.atomic():
+        dates = {local_date(values[1], zone) for values, sign in changes}
+        days = {
+            r.date: r
+            for r in DailyRollup.objects.select_for_update().filter(user_id=user_id, date__in=dates)
+        }
+        for (_, timestamp, emotion, intensity), sign in changes:
+            local = timestamp.astimezone(zone)
+            day = days.get(local.date())
+            if day is None:
+                day = days[local.date()] = _new_rollup(user_id, local.date())
+            day.count += sign
+            day.intensity_sum += sign * intensity
+            day.intensity_sq_sum += sign * intensity * intensity
+            if sign > 0:
+                day.intensity_min = intensity if day.intensity_min is None else min(day.intensity_min, intensity)
+                day.intensity_max = intensity if day.intensity_max is None else max(day.intensity_max, intensity)
+            day.emotion_counts[emotion] = day.emotion_counts.get(emotion, 0) + sign
+            if day.emotion_counts[emotion] <= 0:
+                del day.emotion_counts[emotion]
+            day.hour_counts[local.hour] += sign
+            day.hour_intensity[local.hour] += sign * intensity
+        _save(user_id, {date: day for date, day in days.items() if day.count > 0}, dates)
+
+
+def rebuild_user(user_id):
+    """
+    Recompute every rollup of a user in one streaming pass, except the
+    days holding archived moods, which are kept
+    """
+    zone = get_user_timezone(user_id)
+    through = archived_through(zone)
+    days = build_rollups(user_id, _mood_rows(user_id, start=_hot_start(through, zone)), zone)
+    _save(user_id, days, after=through)
+    return len(days)
+
+
+def check_user(user_id):
+    """
+    Compare stored rollups with a fresh computation.
+    Returns a list of (date, problem) tuples; empty when consistent.
+    """
+    zone = get_user_timezone(user_id)
+    through = archived_through(zone)
+    expected = build_rollups(user_id, _mood_rows(user_id, start=_hot_start(through, zone)), zone)
+    stored = DailyRollup.objects.filter(user_id=user_id)
+    if through:
+        # Archived days can't be checked against Mood.
+        stored = stored.filter(date__gt=through)
+    stored = {r.date: r for r in stored}
+
+    problems = []
+    for date in sorted(set(expected) | set(stored)):
+        if date not in stored:
+            problems.append((date, 'missing'))
+        elif date not in expected:
+            problems.append((date, 'orphaned'))
+        else:
+            diff = [
+                field for field in UPDATE_FIELDS
+                if getattr(stored[date], field) != getattr(expected[date], field)
+            ]
+            if diff:
+                problems.append((date, 'mismatch: ' + ', '.join(diff)))
+    return problems
+
+
+def get_rollups(user_id, start=None, end=None):
+    """Rollups for local dates in [start, end]"""
+    rollups = DailyRollup.objects.filter(user_id=user_id)
+    if start is not None:
+        rollups = rollups.filter(date__gte=start)
+    if end is not None:
+        rollups = rollups.filter(date__lte=end)
+    return rollups
+
+
+def summarize(rollups):
+    """
+    Combine rollup rows into totals:
+    count, avg_intensity, std_intensity, min/max, emotion_counts,
+    top_emotion, weekday_avg {0=Monday: avg} and 24-slot hour totals.
+    """
+    summary = {
+        'count': 0,
+        'intensity_sum': 0,
+        'intensity_sq_sum': 0,
+        'intensity_min': None,
+        'intensity_max': None,
+        'emotion_counts': {},
+        'hour_counts': [0] * 24,
+        'hour_intensity': [0] * 24,
+    }
+    weekday_totals = {}
+    for r in rollups:
+        summary['count'] += r.count
+        summary['intensity_sum'] += r.intensity_sum
+        summary['intensity_sq_sum'] += r.intensity_sq_sum
+        if r.intensity_min is not None:
+            low, high = summary['intensity_min'], summary['intensity_max']
+            summary['intensity_min'] = r.intensity_min if low is None else min(low, r.intensity_min)
+            summary['intensity_max'] = r.intensity_max if high is None else max(high, r.intensity_max)
+        for emotion, n in r.emotion_counts.items():
+            summary['emotion_counts'][emotion] = summary['emotion_counts'].get(emotion, 0) + n
+        for hour in range(24):
+            summary['hour_counts'][hour] += r.hour_counts[hour]
+            summary['hour_intensity'][hour] += r.hour_intensity[hour]
+        n, total = weekday_totals.get(r.date.weekday(), (0, 0))
+        weekday_totals[r.date.weekday()] = (n + r.count, total + r.intensity_sum)
+
+    count = summary['count']
+    summary['avg_intensity'] = summary['intensity_sum'] / count if count else None
+    if count:
+        variance = summary['intensity_sq_sum'] / count - summary['avg_intensity'] ** 2
+        summary['std_intensity'] = max(variance, 0) ** 0.5
+    else:
+        summary['std_intensity'] = None
+    summary['top_emotion'] = max(
+        summary['emotion_counts'], key=summary['emotion_counts'].get
+    ) if summary['emotion_counts'] else None
+    summary['weekday_avg'] = {day: total / n for day, (n, total) in weekday_totals.items() if n}
+    return summary
+
+
+def hour_range_avg(summary, first_hour, last_hour):
+    """Average intensity of moods logged between two local hours, inclusive"""
+    hours = range(first_hour, last_hour + 1)
+    n = sum(summary['hour_counts'][h] for h in hours)
+    return sum(summary['hour_intensity'][h] for h in hours) / n if n else None
@@ -0,0 +1,228 @@
+"""
+Process-local weighted sampler for intervention suggestions.
+
+Active interventions and their vote counts are loaded once per process
+into Fenwick trees (one overall, one per emotion), so a suggestion costs
+O(log n) instead of loading the intervention table. Each intervention's
+weight is the posterior mean of its Beta(helped, worse) success rate,
+with "no change" counted half each way; per-emotion weights shrink the
+emotion's own votes towards the overall rate.
+
+Interventions with fewer than EXPLORE_VOTES votes are kept out of the
+trees and explored with Thompson sampling: each suggestion draws one
+established and one new candidate and suggests whichever wins a draw
+from its posterior, so promising new interventions get shown until
+their votes either confirm or bury them.
+
+Votes update the local trees in place (see core.signals). Saving or
+deleting an Intervention bumps a version in the shared cache so every
+process reloads on its next suggestion; MAX_AGE bounds how far one
+process can drift from votes recorded in others.
+"""
+import random
+import threading
+import time
+
+from django.core.cache import cache
+from django.db.models import Count
+
+from .models import Feedback, InterventionScore
+
+EXPLORE_VOTES = 10  # below this many votes an intervention is still being explored
+PRIOR_STRENGTH = 5  # pseudo-votes of the overall rate behind each per-emotion rate
+MAX_AGE = 600  # seconds
+VERSION_KEY = 'interventions:index_version'
+
+# result: (alpha, beta) contribution
+REWARDS = {'helped': (1.0, 0.0), 'no_change': (0.5, 0.5), 'worse': (0.0, 1.0)}
+
+
+class FenwickTree:
+    """Prefix sums over non-negative weights with O(log n) update and weighted search"""
+    def __init__(self, weights):
+        self.size = len(weights)
+        self.weights = list(weights)
+        self.tree = [0.0] * (self.size + 1)
+        for i, weight in enumerate(weights, 1):
+            self.tree[i] += weight
+            parent = i + (i & -i)
+            if parent <= self.size:
+                self.tree[parent] += self.tree[i]
+        self.total = sum(weights)
+
+    def set(self, index, weight):
+        delta = weight - self.weights[index]
+        self.weights[index] = weight
+        self.total += delta
+        i = index + 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def find(self, value):
+        """Index of the slot where the running sum first exceeds value (0 <= value < total)"""
+        position = 0
+        step = 1 << self.size.bit_length()
+        while step:
+            following = position + step
+            if following <= self.size and self.tree[following] <= value:
+                position = following
+                value -= self.tree[following]
+            step >>= 1
+        return min(position, self.size - 1)
+
+    def sample(self, rng):
+        if self.total <= 0:
+            return None
+        return self.find(rng.random() * self.total)
+
+
+class InterventionIndex:
+    """Vote counts and sampling trees for the active interventions"""
+    def __init__(self, votes, emotion_votes, version=None):
+        """
+        votes: {intervention_id: (helped, no_change, worse)}
+        emotion_votes: {(intervention_id, emotion): (helped, no_change, worse)}
+        """
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.lock = threading.Lock()
+        self.ids = sorted(votes)
+        self.positions = {pk: i for i, pk in enumerate(self.ids)}
+        self.counts = {None: [self._posterior(votes[pk]) for pk in self.ids]}
+        for (pk, emotion), counts in emotion_votes.items():
+            if pk in self.positions:
+                self._counts(emotion)[self.positions[pk]] = self._posterior(counts, prior=False)
+        self.votes = [sum(votes[pk]) for pk in self.ids]
+
+        self.new = [i for i, n in enumerate(self.votes) if n < EXPLORE_VOTES]
+        self.new_positions = {i: slot for slot, i in enumerate(self.new)}
+        self.trees = {key: FenwickTree([self.weight(i, key) for i in range(len(self.ids))]) for key in self.counts}
+
+    @staticmethod
+    def _posterior(counts, prior=True):
+        helped, no_change, worse = counts
+        alpha = helped + no_change / 2
+        beta = worse + no_change / 2
+        return [alpha + 1, beta + 1] if prior else [alpha, beta]
+
+    def _counts(self, emotion):
+        if emotion not in self.counts:
+            self.counts[emotion] = [[0.0, 0.0] for _ in self.ids]
+        return self.counts[emotion]
+
+    def params(self, i, emotion=None):
+        """Beta (alpha, beta) for slot i, blended towards the overall rate for an emotion"""
+        alpha, beta = self.counts[None][i]
+        if emotion is None or emotion not in self.counts:
+            return alpha, beta
+        own_alpha, own_beta = self.counts[emotion][i]
+        mean = alpha / (alpha + beta)
+        return own_alpha + PRIOR_STRENGTH * mean, own_beta + PRIOR_STRENGTH * (1 - mean)
+
+    def weight(self, i, emotion=None):
+        if i in self.new_positions:
+            return 0.0
+        alpha, beta = self.params(i, emotion)
+        return alpha / (alpha + beta)
+
+    def sample(self, emotion=None, rng=random):
+        """Id of a suggested intervention, or None if there are none"""
+        if not self.ids:
+            return None
+        tree = self.trees.get(emotion, self.trees[None])
+        with self.lock:
+            established = tree.sample(rng)
+            candidate = self.new[int(rng.random() * len(self.new))] if self.new else None
+        if candidate is None or established is None:
+            pick = established if candidate is None else candidate
+            return None if pick is None else self.ids[pick]
+        # Thompson step: one posterior draw each, highest wins.
+        if rng.betavariate(*self.params(candidate, emotion)) > rng.betavariate(*self.params(established, emotion)):
+            return self.ids[candidate]
+        return self.ids[established]
+
+    def record_vote(self, intervention_id, emotion, result, delta):
+        """Apply one vote (delta=1) or its removal (delta=-1) in O(log n)"""
+        i = self.positions.get(intervention_id)
+        if i is None or result not in REWARDS:
+            return
+        alpha, beta = REWARDS[result]
+        with self.lock:
+            keys = [None] + ([emotion] if emotion else [])
+            for key in keys:
+                params = self.counts[None][i] if key is None else self._counts(key)[i]
+                params[0] += delta * alpha
+                params[1] += delta * beta
+            self.votes[i] += delta
+
+            if i in self.new_positions and self.votes[i] >= EXPLORE_VOTES:
+                # Graduates into the weighted trees (swap-remove from the explore list).
+                slot = self.new_positions.pop(i)
+                last = self.new.pop()
+                if last != i:
+                    self.new[slot] = last
+                    self.new_positions[last] = slot
+            if emotion and emotion not in self.trees:
+                self.trees[emotion] = FenwickTree([self.weight(j, emotion) for j in range(len(self.ids))])
+            # Every emotion blends in the overall rate, so all trees move.
+            for key, tree in self.trees.items():
+                tree.set(i, self.weight(i, key))
+
+
+_index = None
+_load_lock = threading.Lock()
+
+
+def load_index(version=None):
+    votes = {
+        pk: (helped, no_change, worse)
+        for pk, helped, no_change, worse in InterventionScore.objects.filter(
+            intervention__is_active=True
+        ).values_list('intervention_id', 'helped', 'no_change', 'worse')
+    }
+    emotion_votes = {}
+    rows = Feedback.objects.filter(intervention__is_active=True).order_by().values(
+        'intervention_id', 'mood__emotion', 'result'
+    ).annotate(n=Count('id'))
+    for row in rows:
+        key = (row['intervention_id'], row['mood__emotion'])
+        counts = dict(zip(('helped', 'no_change', 'worse'), emotion_votes.get(key, (0, 0, 0))))
+        counts[row['result']] += row['n']
+        emotion_votes[key] = (counts['helped'], counts['no_change'], counts['worse'])
+    return InterventionIndex(votes, emotion_votes, version)
+
+
+def get_index():
+    """The process's index, reloaded when interventions changed or it is older than MAX_AGE"""
+    global _index
+    version = cache.get(VERSION_KEY)
+    index = _index
+    if index is None or index.version != version or time.monotonic() - index.loaded_at > MAX_AGE:
+        with _load_lock:
+            if _index is index:
+                _index = load_index(version)
+            index = _index
+    return index
+
+
+def invalidate():
+    """Make every process reload its index (called when an Intervention changes)"""
+    global _index
+    _index = None
+    cache.set(VERSION_KEY, time.time_ns(), None)
+
+
+def is_loaded():
+    return _index is not None
+
+
+def record_vote(intervention_id, result, emotion=None, delta=1):
+    """Fold a vote into this process's index, if loaded"""
+    if _index is not None:
+        _index.record_vote(intervention_id, emotion, result, delta)
+
+
+def suggest(emotion=None):
+    """Id of an active intervention to suggest for a mood, or None"""
+    return get_index().sample(emotion)
@@ -0,0 +1,334 @@
+"""
+Full-text search over a user's mood notes.
+
+The index is kept by the database itself, so every write path (forms,
+the API, bulk ingest, archiving, raw deletes) keeps it current:
+
+- SQLite: an FTS5 table over core_mood (external content, so the notes
+  are not stored twice) maintained by triggers. It indexes user_id next
+  to the note, so a search only walks the user's own postings. Its
+  porter stemmer also stems a typed prefix ("kay" becomes "kai"), so a
+  prefix additionally matches the indexed words starting with it, found
+  in the fts5vocab table.
+- PostgreSQL: a generated tsvector column with a GIN index.
+
+install() creates either one (migration 0012, and again after every
+migrate, because SQLite drops triggers when a migration remakes
+core_mood). Other backends, or SQLite built without FTS5, fall back to
+an unranked icontains scan.
+
+search() returns one page of matches, best first, keyed on (score, id)
+so page N costs the same as page 1, with a highlighted snippet of each
+note. Every term must match; a trailing * makes a term a prefix.
+Scoring is paid per match, so a search matching more than RANK_WINDOW
+notes ranks the newest RANK_WINDOW of them: a common word costs the same
+at ten million notes as at ten thousand. More words or a date filter
+reach older notes.
+
+matching() applies the same search to any Mood queryset, unranked, for
+the admin.
+"""
+import base64
+import binascii
+import json
+import re
+
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .api import APIError
+from .models import Mood
+
+FTS_TABLE = 'core_mood_fts'
+FTS_VOCAB = 'core_mood_fts_vocab'
+PG_COLUMN = 'note_search'
+PG_INDEX = 'core_mood_note_search_idx'
+PG_CONFIG = 'english'
+PAGE_SIZE = 20
+MAX_TERMS = 10
+MAX_PREFIX_WORDS = 50  # indexed words a prefix expands to (SQLite)
+RANK_WINDOW = 5000  # newest matches ranked per search
+SNIPPET_WORDS = 16
+FALLBACK_SNIPPET_CHARS = 160
+# Highlight markers that can't occur in escaped text; swapped for <mark> after escaping.
+START, STOP = '\x02', '\x03'
+
+SQLITE_TRIGGERS = {
+    f'{FTS_TABLE}_insert': f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON core_mood BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, note, user_id) VALUES (new.id, new.note, new.user_id);
+        END""",
+    f'{FTS_TABLE}_delete': f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON core_mood BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, note, user_id) VALUES ('delete', old.id, old.note, old.user_id);
+        END""",
+    f'{FTS_TABLE}_update': f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF note, user_id ON core_mood BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, note, user_id) VALUES ('delete', old.id, old.note, old.user_id);
+            INSERT INTO {FTS_TABLE}(rowid, note, user_id) VALUES (new.id, new.note, new.user_id);
+        END""",
+}
+
+_available = {}  # connection alias -> whether the index exists
+
+
+def _sqlite_objects(cursor, kind):
+    cursor.execute('SELECT name FROM sqlite_master WHERE type = %s', [kind])
+    return {name for name, in cursor.fetchall()}
+
+
+def install(using=DEFAULT_DB_ALIAS):
+    """Create the search index if it is missing, filling it from the notes; idempotent"""
+    connection = connections[using]
+    _available.pop(using, None)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            if FTS_TABLE in _sqlite_objects(cursor, 'table'):
+                missing = SQLITE_TRIGGERS.keys() - _sqlite_objects(cursor, 'trigger')
+            else:
+                try:
+                    cursor.execute(
+                        f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+                        f"note, user_id, content='core_mood', content_rowid='id', "
+                        f"tokenize='porter unicode61 remove_diacritics 2')"
+                    )
+                except OperationalError:
+                    return  # no FTS5 in this SQLite build
+                missing = SQLITE_TRIGGERS.keys()
+            if missing:
+                for sql in SQLITE_TRIGGERS.values():
+                    cursor.execute(sql)
+                # Writes made while the triggers were gone never reached the index.
+                cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+            cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_VOCAB} USING fts5vocab({FTS_TABLE}, 'row')")
+        elif connection.vendor == 'postgresql':
+            cursor.execute(
+                f"ALTER TABLE core_mood ADD COLUMN IF NOT EXISTS {PG_COLUMN} tsvector "
+                f"GENERATED ALWAYS AS (to_tsvector('{PG_CONFIG}', coalesce(note, ''))) STORED"
+            )
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {PG_INDEX} ON core_mood USING GIN ({PG_COLUMN})')
+
+
+def uninstall(using=DEFAULT_DB_ALIAS):
+    connection = connections[using]
+    _available.pop(using, None)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            for name in SQLITE_TRIGGERS:
+                cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+            cursor.execute(f'DROP TABLE IF EXISTS {FTS_VOCAB}')
+            cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+        elif connection.vendor == 'postgresql':
+            cursor.execute(f'ALTER TABLE core_mood DROP COLUMN IF EXISTS {PG_COLUMN}')
+
+
+def rebuild(using=DEFAULT_DB_ALIAS, optimize=True):
+    """Rebuild the index from the notes (SQLite) or its GIN index (PostgreSQL)"""
+    connection = connections[using]
+    install(using)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite' and is_available(using):
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+            if optimize:
+                cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+        elif connection.vendor == 'postgresql':
+            cursor.execute(f'REINDEX INDEX {PG_INDEX}')
+
+
+def is_available(using=DEFAULT_DB_ALIAS):
+    """Whether the database has the search index, checked once per process"""
+    if using not in _available:
+        connection = connections[using]
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                _available[using] = FTS_TABLE in _sqlite_objects(cursor, 'table')
+            elif connection.vendor == 'postgresql':
+                columns = connection.introspection.get_table_description(cursor, 'core_mood')
+                _available[using] = any(column.name == PG_COLUMN for column in columns)
+            else:
+                _available[using] = False
+    return _available[using]
+
+
+def parse_query(query):
+    """[(term, is prefix)] for the words in a search box; punctuation is ignored"""
+    terms = [(word.casefold(), bool(star)) for word, star in re.findall(r'(\w+)(\*?)', query or '')]
+    return list(dict.fromkeys(terms))[:MAX_TERMS]
+
+
+def encode_cursor(score, pk):
+    raw = json.dumps(['search', score, pk]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(score, pk) of a cursor issued by search()"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        key, score, pk = json.loads(raw)
+    except (binascii.Error, ValueError, TypeError):
+        raise APIError('invalid cursor')
+    if key != 'search' or not isinstance(score, (int, float)) or not isinstance(pk, int):
+        raise APIError('invalid cursor')
+    return float(score), pk
+
+
+def highlight(snippet):
+    """Escape a snippet and turn its START/STOP markers into <mark> tags"""
+    return mark_safe(escape(snippet).replace(START, '<mark>').replace(STOP, '</mark>'))
+
+
+def _fts_notes(connection, terms):
+    """FTS5 query for notes matching every term"""
+    parts = []
+    with connection.cursor() as c:
+        for term, prefix in terms:
+            if not prefix:
+                parts.append(f'"{term}"')
+                continue
+            c.execute(
+                f'SELECT term FROM {FTS_VOCAB} WHERE term >= %s AND term < %s LIMIT %s',
+                [term, term + '\uffff', MAX_PREFIX_WORDS],
+            )
+            parts.append('({})'.format(' OR '.join([f'"{term}" *', *(f'"{word}"' for word, in c.fetchall())])))
+    return 'note : ({})'.format(' AND '.join(parts))
+
+
+def _fts_match(user_id, notes):
+    return f'user_id : "{user_id}" AND {notes}'
+
+
+def _pg_query(terms):
+    return ' & '.join(f'{term}{":*" if prefix else ""}' for term, prefix in terms)
+
+
+def _ranked_page(connection, user_id, terms, notes, moods, cursor, limit):
+    """[(id, score)] of the next page of matches, best first; `notes` is _fts_notes() on SQLite"""
+    if connection.vendor == 'sqlite':
+        # bm25 is lower for better matches; weight 0 keeps the user_id column out of it.
+        key, score = 'rowid', f'-bm25({FTS_TABLE}, 1.0, 0.0)'
+        source = f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s'
+        params = [_fts_match(user_id, notes)]
+    else:
+        key, score = 'id', f'ts_rank({PG_COLUMN}, query)::float8'
+        source = f'FROM core_mood, to_tsquery(%s, %s) AS query WHERE user_id = %s AND {PG_COLUMN} @@ query'
+        params = [PG_CONFIG, _pg_query(terms), user_id]
+    if moods is not None:
+        # Emotion/tag/date filters: only the ids matching them.
+        sql, filter_params = moods.values('pk').query.get_compiler(connection=connection).as_sql()
+        source += f' AND {key} IN ({sql})'
+        params.extend(filter_params)
+
+    with connection.cursor() as c:
+        # Scoring costs per match, so only the newest RANK_WINDOW matches are ranked.
+        # Walking the matches newest first, unscored, stops after RANK_WINDOW of them.
+        c.execute(f'SELECT {key} {source} ORDER BY {key} DESC LIMIT 1 OFFSET %s', [*params, RANK_WINDOW - 1])
+        oldest = c.fetchone()
+        if oldest:
+            source += f' AND {key} >= %s'
+            params.append(oldest[0])
+
+        where = ''
+        if cursor:
+            after_score, pk = decode_cursor(cursor)
+            where = 'WHERE score < %s OR (score = %s AND id < %s)'
+            params.extend([after_score, after_score, pk])
+        c.execute(
+            f'SELECT id, score FROM (SELECT {key} AS id, {score} AS score {source}) AS hits '
+            f'{where} ORDER BY score DESC, id DESC LIMIT %s',
+            [*params, limit + 1],
+        )
+        return c.fetchall()
+
+
+def _snippets(connection, user_id, terms, notes, ids):
+    """{id: note excerpt with START/STOP around the matched words}"""
+    placeholders = ', '.join(['%s'] * len(ids))
+    if connection.vendor == 'sqlite':
+        sql = (
+            f"SELECT rowid, snippet({FTS_TABLE}, 0, %s, %s, '…', %s) FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH %s AND rowid IN ({placeholders})"
+        )
+        params = [START, STOP, SNIPPET_WORDS, _fts_match(user_id, notes), *ids]
+    else:
+        sql = (
+            f"SELECT id, ts_headline(%s, coalesce(note, ''), to_tsquery(%s, %s), %s) "
+            f"FROM core_mood WHERE id IN ({placeholders})"
+        )
+        options = f'StartSel={START}, StopSel={STOP}, MaxWords={SNIPPET_WORDS}, MinWords={SNIPPET_WORDS // 2}'
+        params = [PG_CONFIG, PG_CONFIG, _pg_query(terms), options, *ids]
+    with connection.cursor() as c:
+        c.execute(sql, params)
+        return dict(c.fetchall())
+
+
+def _scan(user_id, terms, moods, cursor, limit):
+    """Fallback without an index: icontains on every term, newest first"""
+    matches = (moods if moods is not None else Mood.objects.filter(user_id=user_id))
+    for term, prefix in terms:
+        matches = matches.filter(note__icontains=term)
+    if cursor:
+        matches = matches.filter(pk__lt=decode_cursor(cursor)[1])
+    return [(pk, 0.0) for pk in matches.order_by('-pk').values_list('pk', flat=True)[:limit + 1]]
+
+
+def matching(moods, query, using=DEFAULT_DB_ALIAS):
+    """
+    A Mood queryset narrowed to notes matching query, for any user, as
+    an indexed subquery (the admin's note search). Unranked.
+    """
+    terms = parse_query(query)
+    if not terms:
+        return moods.none()
+    if not is_available(using):
+        for term, prefix in terms:
+            moods = moods.filter(note__icontains=term)
+        return moods
+    connection = connections[using]
+    if connection.vendor == 'sqlite':
+        ids = RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [_fts_notes(connection, terms)])
+    else:
+        ids = RawSQL(f'SELECT id FROM core_mood WHERE {PG_COLUMN} @@ to_tsquery(%s, %s)', [PG_CONFIG, _pg_query(terms)])
+    return moods.filter(pk__in=ids)
+
+
+def search(user_id, query, moods=None, cursor=None, limit=PAGE_SIZE, using=DEFAULT_DB_ALIAS):
+    """
+    One page of the user's moods whose notes match query, best first.
+    `moods` narrows the search to a filtered queryset of the user's moods
+    (see views.filter_moods). Returns (moods with `score` and `snippet`
+    attributes, next cursor or None). Raises APIError on a bad cursor.
+    """
+    terms = parse_query(query)
+    if not terms:
+        return [], None
+    connection = connections[using]
+    indexed = is_available(using)
+    if indexed:
+        notes = _fts_notes(connection, terms) if connection.vendor == 'sqlite' else None
+        rows = _ranked_page(connection, user_id, terms, notes, moods, cursor, limit)
+    else:
+        rows = _scan(user_id, terms, moods, cursor, limit)
+    next_cursor = encode_cursor(*rows[limit - 1][::-1]) if len(rows) > limit else None
+    rows = rows[:limit]
+    if not rows:
+        return [], None
+
+    scores = dict(rows)
+    snippets = _snippets(connection, user_id, terms, notes, list(scores)) if indexed else {}
+    by_id = Mood.objects.using(using).filter(pk__in=scores).prefetch_related('tags').in_bulk()
+    results = []
+    for pk, score in rows:
+        mood = by_id.get(pk)
+        if mood is None:
+            continue  # deleted since the page was ranked
+        mood.score = round(score, 4)
+        if pk in snippets:
+            mood.snippet = highlight(snippets[pk])
+        else:
+            note = mood.note or ''
+            mood.snippet = escape(note[:FALLBACK_SNIPPET_CHARS] + ('…' if len(note) > FALLBACK_SNIPPET_CHARS else ''))
+        results.append(mood)
+    return results, next_cursor
@@ -0,0 +1,266 @@
+"""
+Keeps denormalized tables in step with the rows they summarize.
+
+Receivers are connected in CoreConfig.ready().
+"""
+import threading
+from contextlib import contextmanager
+
+from django.contrib.auth.models import User
+from django.db import connections, transaction
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import caching, community, correlations, events, heatmap, jobs, recommender, rollups, sampler, search
+from .models import Feedback, Intervention, InterventionScore, Mood, MoodTombstone, Profile, Tag
+from .timezones import get_user_timezone
+
+
+@receiver(post_save, sender=Intervention)
+def create_intervention_score(sender, instance, created, raw=False, **kwargs):
+    """Every intervention gets a score row so ranking never needs a LEFT JOIN"""
+    if created and not raw:
+        InterventionScore.objects.get_or_create(intervention=instance)
+
+
+@receiver(post_save, sender=Intervention)
+@receiver(post_delete, sender=Intervention)
+def intervention_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        interventions_changed()
+
+
+def interventions_changed():
+    """Retire what reads the intervention list; also for bulk updates, which send no signals"""
+    sampler.invalidate()
+    caching.bump(caching.INTERVENTIONS)
+
+
+def update_suggesters(feedback, votes, checkpointed=True):
+    """
+    Apply ((intervention_id, result), delta) votes of one Feedback to this
+    process's suggestion sampler and recommender and, when it edits or
+    removes feedback already checkpointed, to the recommender checkpoint.
+    """
+    if not (checkpointed or sampler.is_loaded() or recommender.is_loaded()):
+        return
+    keys = recommender.feedback_keys(feedback)
+    if keys is None:
+        return
+    for (intervention_id, result), delta in votes:
+        sampler.record_vote(intervention_id, result, emotion=keys[1], delta=delta)
+        recommender.record(keys, intervention_id, result, delta)
+        if checkpointed:
+            recommender.correct_checkpoint(feedback.pk, keys, intervention_id, result, delta)
+
+
+@receiver(pre_save, sender=Feedback)
+def feedback_saving(sender, instance, raw=False, **kwargs):
+    # Saved through an instance we did not load: read the vote it replaces.
+    if not raw and instance.pk is not None and not hasattr(instance, '_loaded_vote'):
+        previous = Feedback.objects.filter(pk=instance.pk).values_list('intervention_id', 'result').first()
+        if previous is not None:
+            instance._loaded_vote = previous
+
+
+@receiver(post_save, sender=Feedback)
+def feedback_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    current = (instance.intervention_id, instance.result)
+    previous = getattr(instance, '_loaded_vote', None)
+    
+    if created or previous is None:
+        InterventionScore.apply_vote(*current, 1)
+        update_suggesters(instance, [(current, 1)], checkpointed=False)
+    elif previous != current:
+        InterventionScore.apply_vote(*previous, -1)
+        InterventionScore.apply_vote(*current, 1)
+        update_suggesters(instance, [(previous, -1), (current, 1)])
+    if previous != current:
+        scores_changed({instance.intervention_id, previous[0] if previous else None} - {None})
+    instance._loaded_vote = current
+
+
+@receiver(pre_delete, sender=Feedback)
+def feedback_deleting(sender, instance, **kwargs):
+    # Before the delete, while the mood and its tags can still be read.
+    vote = getattr(instance, '_loaded_vote', None) or (instance.intervention_id, instance.result)
+    update_suggesters(instance, [(vote, -1)])
+
+
+@receiver(post_delete, sender=Feedback)
+def feedback_deleted(sender, instance, **kwargs):
+    vote = getattr(instance, '_loaded_vote', None) or (instance.intervention_id, instance.result)
+    # The score row may already be gone when the intervention itself is deleted.
+    InterventionScore.apply_vote(*vote, -1, rebuild_missing=False)
+    scores_changed([vote[0]])
+
+
+def scores_changed(intervention_ids):
+    """Retire cached rankings and push the new scores to open dashboards"""
+    caching.bump(caching.INTERVENTIONS)
+    for intervention_id in intervention_ids:
+        transaction.on_commit(
+            lambda pk=intervention_id: events.publish(events.COMMUNITY, lambda: events.score_event(pk))
+        )
+
+
+def moods_changed(user_id):
+    """Invalidate what depends on a user's moods but is not an aggregate, and queue insights"""
+    caching.bump_user(user_id)
+    correlations.invalidate(user_id)
+    Profile.touch_moods(user_id)
+    jobs.enqueue('insights', user_id)
+
+
+def publish_mood(action, mood, days=None):
+    """Push a mood delta to its owner's open dashboards once the write commits"""
+    user_id = mood.user_id
+    if user_id is None:
+        return
+    zone, dates = (days or {}).get(user_id, (None, ()))
+    fields = events.mood_fields(mood)
+
+    def build():
+        return events.mood_event(action, fields, events.trend_points(user_id, zone, dates) if zone else [])
+    transaction.on_commit(lambda: events.publish(events.user_channel(user_id), build))
+
+
+def publish_refresh(user_id):
+    """Tell a user's open dashboards to reload their blocks, for changes too broad for a delta"""
+    transaction.on_commit(lambda: events.publish(events.user_channel(user_id), events.REFRESH))
+
+
+def update_mood_aggregates(previous, current):
+    """
+    Apply one mood change to the per-user aggregates.
+    previous/current are Mood.get_aggregate_values() tuples, or None for
+    an insert/delete. Returns {user_id: (zone, local dates refreshed)}.
+    """
+    for user_id in {values[0] for values in (previous, current) if values and values[0] is not None}:
+        moods_changed(user_id)
+    if previous == current:
+        return {}
+    changes = {}
+    for values, sign in ((previous, -1), (current, 1)):
+        if values and values[0] is not None:
+            changes.setdefault(values[0], []).append((values, sign))
+
+    days = {}
+    for user_id, user_changes in changes.items():
+        zone = get_user_timezone(user_id)
+        for values, sign in user_changes:
+            heatmap.apply_mood(*values, sign, zone=zone)
+        days[user_id] = (zone, rollups.apply_changes(user_id, user_changes, zone=zone))
+    return days
+
+
+def rebuild_mood_aggregates(user_id):
+    heatmap.rebuild_cube(user_id)
+    rollups.rebuild_user(user_id)
+    correlations.invalidate(user_id)
+
+
+@receiver(post_save, sender=Mood)
+def mood_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    current = instance.get_aggregate_values()
+    previous = getattr(instance, '_loaded_values', None)
+    
+    if created:
+        community.queue([instance.pk])
+        publish_mood('created', instance, update_mood_aggregates(None, current))
+    elif previous is None:
+        # Saved through an instance we did not load, so the old values are unknown.
+        if instance.user_id:
+            rebuild_mood_aggregates(instance.user_id)
+            moods_changed(instance.user_id)
+            publish_refresh(instance.user_id)
+    else:
+        publish_mood('updated', instance, update_mood_aggregates(previous, current))
+    instance._loaded_values = current
+
+
+@receiver(pre_delete, sender=User)
+def user_deleting(sender, instance, **kwargs):
+    # Before the cascade, while the user's moods and timezone can still be read.
+    community.forget_user(instance.pk)
+
+
+_archiving = threading.local()
+
+
+@contextmanager
+def archiving():
+    """
+    Mood deletes inside this block leave the aggregates alone: the moods
+    are being archived (see core.archive) and keep counting.
+    """
+    _archiving.active = True
+    try:
+        yield
+    finally:
+        _archiving.active = False
+
+
+@receiver(post_delete, sender=Mood)
+def mood_deleted(sender, instance, origin=None, **kwargs):
+    if getattr(_archiving, 'active', False):
+        return
+    if getattr(origin, 'model', type(origin)) is User:
+        # Deleting the user takes its aggregates and profile too; rows written for it now would break the cascade.
+        return
+    if instance.user_id:
+        MoodTombstone.objects.create(user_id=instance.user_id, mood_id=instance.pk)
+    values = getattr(instance, '_loaded_values', None) or instance.get_aggregate_values()
+    publish_mood('deleted', instance, update_mood_aggregates(values, None))
+
+
+def mood_tags_updated(mood):
+    """A tag change is an edit of the mood as far as API sync is concerned"""
+    Mood.objects.filter(pk=mood.pk).update(updated_at=timezone.now())
+    if mood.user_id:
+        moods_changed(mood.user_id)
+        publish_mood('updated', mood)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tag_changed(sender, instance, created=False, **kwargs):
+    """Renamed or deleted tags must not be resolved from cached ids (see core.tags)"""
+    if not created:
+        caching.bump(caching.TAGS)
+
+
+@receiver(m2m_changed, sender=Mood.tags.through)
+def mood_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # A cleared Tag no longer knows its moods after the clear, so the reverse side acts before it.
+    if action not in ('post_add', 'post_remove', 'pre_clear' if reverse else 'post_clear'):
+        return
+    if not reverse:
+        mood_tags_updated(instance)
+        return
+    # Changed from the Tag side: invalidate every affected mood owner.
+    moods = Mood.objects.filter(tags=instance) if action == 'pre_clear' else Mood.objects.filter(pk__in=pk_set or [])
+    user_ids = set(moods.exclude(user__isnull=True).values_list('user_id', flat=True).distinct())
+    moods.update(updated_at=timezone.now())
+    for user_id in user_ids:
+        moods_changed(user_id)
+        publish_refresh(user_id)
+
+
+@receiver(post_migrate)
+def ensure_search_index(sender, using, **kwargs):
+    """
+    SQLite drops triggers along with the table when a migration remakes
+    core_mood; put the search index's back (see core.search.install).
+    """
+    if sender.name != 'core':
+        return
+    applied = MigrationRecorder(connections[using]).applied_migrations()
+    if ('core', '0012_mood_search') in applied:
+        search.install(using)
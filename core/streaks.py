@@ -0,0 +1,103 @@
+"""
+Logging streaks and consistency.
+
+Works from the user's distinct local logging dates, read from the daily
+rollups (one row per day with moods), folded into islands of consecutive
+days. The islands are cached per user and dropped whenever a rollup
+write commits (see rollups._save), so a dashboard request reads one cache
+entry instead of walking the user's history. Everything that depends on
+today's date is derived from the islands at read time.
+"""
+import datetime
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from . import caching
+from .models import DailyRollup
+from .timezones import get_user_timezone
+
+CACHE_TIMEOUT = 60 * 60 * 24
+RECENT_GAPS = 5
+
+
+def cache_key(user_id):
+    return f'streaks:{user_id}'
+
+
+def invalidate(user_id):
+    cache.delete(cache_key(user_id))
+
+
+def islands(dates):
+    """Fold ascending distinct dates into [(first, last), ...] runs of consecutive days"""
+    runs = []
+    for date in dates:
+        if runs and (date - runs[-1][1]).days == 1:
+            runs[-1] = (runs[-1][0], date)
+        else:
+            runs.append((date, date))
+    return runs
+
+
+def get_islands(user_id):
+    """Cached logging runs of a user"""
+    def compute():
+        dates = DailyRollup.objects.filter(user_id=user_id, count__gt=0).values_list('date', flat=True)
+        return islands(dates.order_by('date').iterator(chunk_size=2000))
+    return caching.get_or_set(cache_key(user_id), compute, CACHE_TIMEOUT)
+
+
+def summarize(runs, today):
+    """
+    current_streak (a streak survives until a full day is missed),
+    longest_streak with its dates, days_logged, first/last logging date,
+    cadence (share of days since the first log with a log), missed_days
+    and the most recent gaps as (first missed, last missed, days).
+    """
+    result = {
+        'current_streak': 0,
+        'longest_streak': 0,
+        'longest_streak_start': None,
+        'longest_streak_end': None,
+        'days_logged': 0,
+        'first_date': None,
+        'last_date': None,
+        'cadence': None,
+        'missed_days': 0,
+        'recent_gaps': [],
+    }
+    if not runs:
+        return result
+
+    one_day = datetime.timedelta(days=1)
+    gaps = []
+    for (start, end), (next_start, next_end) in zip(runs, runs[1:]):
+        gaps.append((end + one_day, next_start - one_day, (next_start - end).days - 1))
+    last_start, last_end = runs[-1]
+    if (today - last_end).days > 1:
+        # Days missed since the last log count as an open gap.
+        gaps.append((last_end + one_day, today - one_day, (today - last_end).days - 1))
+    longest = max(runs, key=lambda run: (run[1] - run[0], run[1]))
+
+    days_logged = sum((end - start).days + 1 for start, end in runs)
+    span = (max(today, last_end) - runs[0][0]).days + 1
+    result.update({
+        'current_streak': (last_end - last_start).days + 1 if (today - last_end).days <= 1 else 0,
+        'longest_streak': (longest[1] - longest[0]).days + 1,
+        'longest_streak_start': longest[0],
+        'longest_streak_end': longest[1],
+        'days_logged': days_logged,
+        'first_date': runs[0][0],
+        'last_date': last_end,
+        'cadence': days_logged / span,
+        'missed_days': sum(gap[2] for gap in gaps),
+        'recent_gaps': gaps[::-1][:RECENT_GAPS],
+    })
+    return result
+
+
+def get_streaks(user_id, zone=None):
+    """Streak summary for a user, with "today" in their timezone"""
+    zone = zone or get_user_timezone(user_id)
+    return summarize(get_islands(user_id), timezone.now().astimezone(zone).date())
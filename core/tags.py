@@ -0,0 +1,206 @@
+"""
+Tag names: normalization, batched name -> id resolution and tag diffs.
+
+Names are compared after normalize(): whitespace collapsed and case
+folded, so "Work", " work" and "WORK" are one tag. resolve() turns any
+number of names into ids with at most two statements (a bulk insert of
+the unknown names and one IN lookup) and remembers the ids in a
+process-local dict. The dict is dropped whenever the TAGS cache scope is
+bumped, i.e. when a tag is renamed or deleted (see core.signals).
+
+set_mood_tags() writes only the difference between a mood's current and
+wanted tags: at most one delete and one insert on the through table.
+
+suggest() autocompletes the tag field from TagIndex, every tag name in
+a sorted list searched with bisect, so a keystroke costs a binary search
+rather than a LIKE scan. The index loads once per process, picks up new
+tags incrementally (by id, at most every REFRESH_INTERVAL seconds) and
+reloads when a tag is renamed or deleted.
+"""
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.db import transaction
+from django.db.models import Count
+
+from . import caching
+from .models import MoodTag, Tag
+from .signals import mood_tags_updated
+
+MAX_LENGTH = Tag._meta.get_field('name').max_length
+CACHE_SIZE = 10000
+SUGGESTIONS = 8
+REFRESH_INTERVAL = 1.0  # seconds between checks for tags created by other processes
+
+_ids = {}
+_version = None
+_lock = threading.Lock()
+
+
+def normalize(name):
+    return ' '.join(name.split()).casefold()
+
+
+def parse(value):
+    """
+    Normalized names, first occurrence first, from a comma-separated
+    string or a list of names. Raises ValueError on anything else or on
+    names longer than a Tag allows.
+    """
+    if value in (None, ''):
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+    if not isinstance(value, (list, tuple)) or not all(isinstance(name, str) for name in value):
+        raise ValueError('tags must be a list of names or a comma-separated string')
+    names = list(dict.fromkeys(filter(None, map(normalize, value))))
+    if any(len(name) > MAX_LENGTH for name in names):
+        raise ValueError(f'tag names are limited to {MAX_LENGTH} characters')
+    return names
+
+
+def _cached(names):
+    global _version
+    version = caching.get_version(caching.TAGS)
+    with _lock:
+        if version != _version:
+            _ids.clear()
+            _version = version
+        return {name: _ids[name] for name in names if name in _ids}
+
+
+def _remember(found):
+    with _lock:
+        if len(_ids) + len(found) > CACHE_SIZE:
+            _ids.clear()
+        _ids.update(found)
+
+
+def resolve(names):
+    """{normalized name: tag id} for the given names, creating missing tags"""
+    names = set(filter(None, map(normalize, names)))
+    if not names:
+        return {}
+    ids = _cached(names)
+    missing = names - ids.keys()
+    if missing:
+        Tag.objects.bulk_create([Tag(name=name) for name in missing], ignore_conflicts=True)
+        found = dict(Tag.objects.filter(name__in=missing).values_list('name', 'id'))
+        # Only cache ids once the new tags are committed: a rollback would leave them dangling.
+        transaction.on_commit(lambda: (_remember(found), _index.add(found)))
+        ids.update(found)
+    return ids
+
+
+def set_mood_tags(mood, names, current=None):
+    """
+    Make names the mood's tags. `current` is the set of tag ids it has now
+    (pass an empty set for a new mood to skip reading them). Returns
+    whether anything changed.
+    """
+    wanted = set(resolve(names).values())
+    if current is None:
+        current = set(MoodTag.objects.filter(mood=mood).values_list('tag_id', flat=True))
+    added = wanted - current
+    removed = current - wanted
+    if removed:
+        MoodTag.objects.filter(mood=mood, tag_id__in=removed).delete()
+    if added:
+        MoodTag.objects.bulk_create([MoodTag(mood=mood, tag_id=tag_id) for tag_id in added])
+    if added or removed:
+        # The through-table writes bypass m2m_changed.
+        mood_tags_updated(mood)
+    return bool(added or removed)
+
+
+class TagIndex:
+    """Every tag name, sorted for bisect prefix lookups"""
+    def __init__(self):
+        self.names = []  # sorted; replaced, never mutated, so readers need no lock
+        self.names_by_id = {}
+        self.max_id = 0
+        self.version = None
+        self.checked = 0.0
+        self.lock = threading.Lock()
+    
+    def load(self, version):
+        rows = list(Tag.objects.order_by('name').values_list('name', 'id'))
+        with self.lock:
+            self.names = [name for name, tag_id in rows]
+            self.names_by_id = {tag_id: name for name, tag_id in rows}
+            self.max_id = max(self.names_by_id, default=0)
+            self.version = version
+            self.checked = time.monotonic()
+    
+    def add(self, found):
+        """Insert {name: id} pairs not indexed yet"""
+        if self.version is None:
+            return
+        with self.lock:
+            new = {name: tag_id for name, tag_id in found.items() if tag_id not in self.names_by_id}
+            if not new:
+                return
+            names = list(self.names)
+            for name in new:
+                insort(names, name)
+            self.names_by_id = {**self.names_by_id, **{tag_id: name for name, tag_id in new.items()}}
+            self.names = names
+            self.max_id = max(self.max_id, *new.values())
+    
+    def refresh(self):
+        version = caching.get_version(caching.TAGS)
+        if version != self.version:
+            self.load(version)
+        elif time.monotonic() - self.checked > REFRESH_INTERVAL:
+            self.checked = time.monotonic()
+            self.add(dict(Tag.objects.filter(id__gt=self.max_id).values_list('name', 'id')))
+    
+    def starting_with(self, prefix, limit):
+        names = self.names
+        matches = []
+        i = bisect_left(names, prefix)
+        while i < len(names) and len(matches) < limit and names[i].startswith(prefix):
+            matches.append(names[i])
+            i += 1
+        return matches
+
+
+_index = TagIndex()
+
+
+def user_tag_counts(user_id):
+    """{tag id: times the user used it}, cached per version of the user's moods"""
+    return caching.get_or_set(
+        caching.user_key('tag_counts', user_id),
+        lambda: dict(
+            MoodTag.objects.filter(mood__user_id=user_id).order_by().values('tag_id')
+            .annotate(n=Count('id')).values_list('tag_id', 'n')
+        ),
+    )
+
+
+def suggest(user_id, value, limit=SUGGESTIONS):
+    """
+    Completions for the last name in a comma-separated tag field: the
+    user's own tags first, most used first, then any other tag with the
+    prefix in alphabetical order. Names already in the field are skipped.
+    """
+    *entered, prefix = (value or '').split(',')
+    prefix = normalize(prefix)
+    taken = {normalize(name) for name in entered}
+    _index.refresh()
+    names_by_id = _index.names_by_id
+    own = sorted(
+        (-n, name)
+        for name, n in ((names_by_id.get(tag_id), n) for tag_id, n in user_tag_counts(user_id).items())
+        if name and name.startswith(prefix) and name not in taken
+    )
+    suggestions = [name for n, name in own[:limit]]
+    if prefix:
+        for name in _index.starting_with(prefix, limit + len(suggestions) + len(taken)):
+            if len(suggestions) >= limit:
+                break
+            if name not in taken and name not in suggestions:
+                suggestions.append(name)
+    return suggestions
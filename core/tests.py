@@ -1,3 +1,1297 @@
-from django.test import TestCase
+import random
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    archive, benchmarks, caching, community, correlations, exports, heatmap, ingest, jobs, recommender, rollups,
+    sampler, search, streaks, tags,
+)
+from .models import (
+    CommunityCell, DailyRollup, Feedback, HeatmapCell, Insight, Intervention, InterventionScore, Job, Mood, MoodArchive,
+    MoodTag, MoodTombstone, RecommenderCheckpoint, RecommenderStat, Tag,
+)
+from .timezones import get_user_timezone, set_user_timezone
+
+BASELINE = Path(__file__).resolve().parent.parent / 'benchmarks' / 'baseline.json'
+
+
+def create_sample_data(user, moods=60):
+    """A small but realistic history: tagged moods, interventions and feedback"""
+    work, home = Tag.objects.get_or_create(name='work')[0], Tag.objects.get_or_create(name='home')[0]
+    interventions = [
+        Intervention.objects.create(title=f'Intervention {i}', description='Breathe')
+        for i in range(3)
+    ]
+    now = timezone.now()
+    for i in range(moods):
+        mood = Mood.objects.create(
+            user=user,
+            emotion=['joy', 'anxiety', 'calm'][i % 3],
+            intensity=i % 10 + 1,
+            note=f'Entry {i}',
+            timestamp=now - timedelta(hours=7 * i),
+            suggested_intervention=interventions[i % 3],
+        )
+        mood.tags.add(work if i % 2 else home)
+        if i % 4 == 0:
+            Feedback.objects.create(
+                mood=mood, intervention=interventions[i % 3],
+                result=['helped', 'no_change', 'worse'][i % 3]
+            )
+    return interventions
+
+
+class QueryPlanTests(TestCase):
+    """
+    Runs EXPLAIN on every query a per-user view issues and fails if a
+    large per-user table is read with a full scan instead of an index.
+    """
+    # Tables that grow with the number of moods logged.
+    GUARDED_TABLES = {
+        'core_mood', 'core_mood_tags', 'core_feedback', 'core_dailyrollup', 'core_heatmapcell', 'core_moodtombstone',
+    }
+
+    VIEWS = [
+        ('dashboard', {}),
+        ('dashboard', {'emotion': 'joy', 'tag': 'work'}),
+        ('heatmap', {}),
+        ('correlations', {}),
+        ('export_moods', {}),
+        ('weekly_report', {}),
+        ('comparison', {}),
+        ('insights_dashboard', {}),
+        ('api_moods', {}),
+        ('api_deleted_moods', {'since': '2000-01-01T00:00:00'}),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('planner', password='not-a-real-password')
+        other = User.objects.create_user('other', password='not-a-real-password')
+        create_sample_data(cls.user)
+        create_sample_data(other, moods=20)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def capture(self, name, params):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse(name), params)
+            # Drain streaming responses so their queries are captured too.
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200, name)
+        return [q['sql'] for q in ctx.captured_queries if q['sql'].lstrip().upper().startswith('SELECT')]
+
+    def full_scans(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                details = [row[-1] for row in cursor.fetchall()]
+                return [
+                    d for d in details
+                    if d.startswith('SCAN ') and d.split()[1].strip('"') in self.GUARDED_TABLES
+                ]
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('EXPLAIN ' + sql)
+            details = [row[0] for row in cursor.fetchall()]
+            return [
+                d.strip() for d in details
+                if 'Seq Scan on' in d and d.split('Seq Scan on')[1].split()[0].strip('"') in self.GUARDED_TABLES
+            ]
+
+    def test_views_never_full_scan_per_user_tables(self):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            self.skipTest('query plans are only checked on SQLite and PostgreSQL')
+        for name, params in self.VIEWS:
+            for sql in self.capture(name, params):
+                with self.subTest(view=name, params=params, sql=sql[:120]):
+                    self.assertEqual(self.full_scans(sql), [])
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Drives every route in core.urls against synthetic data and fails if a
+    view issues more queries than benchmarks/baseline.json allows.
+    Latency and memory budgets are checked by `manage.py benchmark_views --check`,
+    since they depend on the machine.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = benchmarks.seed(300, users=3, interventions=10)[0]
+
+    def test_routes_within_query_budget(self):
+        self.client.force_login(self.user)
+        results = benchmarks.measure(self.client, self.user, repeat=1)
+        baseline = benchmarks.load_baseline(BASELINE)
+
+        self.assertEqual(set(results), set(baseline['views']), 'routes changed: regenerate the baseline')
+        for name, result in results.items():
+            self.assertLess(result['status'], 400, name)
+        self.assertEqual(benchmarks.compare(results, baseline, metrics=('queries',)), [])
+
+
+class DashboardQueryBudgetTests(TestCase):
+    """
+    The dashboard issues a fixed set of queries (see views.dashboard), so
+    its query count must not grow with the user's history or the number
+    of interventions, with or without filters.
+    """
+    # Cold cache, counting the session and user lookups.
+    MAX_QUERIES = 10
+    FILTERS = [{}, {'emotion': 'joy', 'tag': 'work'}, {'start_date': '2000-01-01'}]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('budget', password='not-a-real-password')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def query_counts(self):
+        counts = []
+        for params in self.FILTERS:
+            cache.clear()
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(reverse('dashboard'), params)
+            self.assertEqual(response.status_code, 200)
+            counts.append(len(ctx.captured_queries))
+        return counts
+
+    def test_query_count_is_fixed(self):
+        create_sample_data(self.user, moods=5)
+        small = self.query_counts()
+        create_sample_data(self.user, moods=150)
+        large = self.query_counts()
+
+        self.assertEqual(small, large)
+        for params, count in zip(self.FILTERS, large):
+            with self.subTest(params=params):
+                self.assertLessEqual(count, self.MAX_QUERIES)
+
+
+class InterventionScoreTests(TestCase):
+    """InterventionScore rows kept up to date by feedback writes match a rebuild from Feedback"""
+    FIELDS = ('intervention_id', 'helped', 'no_change', 'worse', 'total_votes', 'score')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('voter', password='not-a-real-password')
+        cls.interventions = create_sample_data(cls.user, moods=12)
+
+    def assertMatchesRebuild(self):
+        kept = list(InterventionScore.objects.order_by('pk').values_list(*self.FIELDS))
+        InterventionScore.rebuild()
+        self.assertEqual(kept, list(InterventionScore.objects.order_by('pk').values_list(*self.FIELDS)))
+
+    def test_create_edit_and_delete(self):
+        first, second, third = self.interventions
+        mood = Mood.objects.filter(user=self.user).first()
+        votes = [
+            Feedback.objects.create(mood=mood, intervention=first, result=result)
+            for result in ('helped', 'helped', 'worse', 'no_change')
+        ]
+        self.assertMatchesRebuild()
+
+        feedback = Feedback.objects.get(pk=votes[2].pk)
+        feedback.result = 'helped'
+        feedback.save()
+        self.assertMatchesRebuild()
+
+        feedback = Feedback.objects.get(pk=votes[0].pk)
+        feedback.intervention = second
+        feedback.result = 'worse'
+        feedback.save()
+        self.assertMatchesRebuild()
+
+        Feedback.objects.get(pk=votes[1].pk).delete()
+        Feedback.objects.filter(intervention=third).delete()
+        self.assertMatchesRebuild()
+        self.assertEqual(InterventionScore.objects.get(pk=third.pk).total_votes, 0)
+
+
+class RecommenderTests(TestCase):
+    """The bandit ranks by context, and checkpoint corrections agree with a full recount"""
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('bandit', password='not-a-real-password')
+        cls.interventions = create_sample_data(cls.user, moods=40)
+
+    def setUp(self):
+        recommender.invalidate()
+        self.addCleanup(recommender.invalidate)
+
+    def stats(self):
+        return sorted(RecommenderStat.objects.filter(trials__gt=0).values_list(
+            'context', 'intervention_id', 'reward', 'trials',
+        ))
+
+    def assertMatchesRebuild(self):
+        kept = self.stats()
+        recommender.checkpoint(rebuild=True)
+        self.assertEqual(kept, self.stats())
+
+    def test_ranks_by_context_with_fallback(self):
+        bandit = recommender.Recommender()
+        work = recommender.context_keys('anxiety', 9, tags=['work'], hour=9)
+        home = recommender.context_keys('anxiety', 9, tags=['home'], hour=9)
+        self.assertEqual(work[:3], ['*', 'anxiety', 'anxiety|high'])
+        self.assertEqual(work[3:], ['anxiety|high|#work', 'anxiety|high|@morning'])
+        for _ in range(10):
+            bandit.record(work, 1, 'helped')
+            bandit.record(work, 2, 'worse')
+            bandit.record(home, 1, 'worse')
+            bandit.record(home, 2, 'helped')
+
+        self.assertEqual(bandit.rank(work, [1, 2, 3], k=3), [1, 3, 2])
+        self.assertEqual(bandit.rank(home, [1, 2, 3], k=3), [2, 3, 1])
+        # A context never seen falls back on the emotion-wide estimates, where both are even.
+        calm = recommender.context_keys('calm', 2)
+        self.assertEqual(bandit.estimate(1, calm), bandit.estimate(2, calm))
+        draws = [bandit.rank(work, [1, 2, 3], k=1, rng=random.Random(seed)) for seed in range(20)]
+        self.assertEqual(draws, [bandit.rank(work, [1, 2, 3], k=1, rng=random.Random(seed)) for seed in range(20)])
+        self.assertGreater(draws.count([1]), draws.count([2]))
+
+        # Taking the votes back leaves the prior.
+        for keys, pk, result in [(work, 1, 'helped'), (work, 2, 'worse'), (home, 1, 'worse'), (home, 2, 'helped')]:
+            bandit.record(keys, pk, result, delta=-10)
+        self.assertEqual(bandit.estimate(1, work), recommender.Recommender().estimate(1, work))
+
+    def test_checkpoint_corrections_match_rebuild(self):
+        self.assertGreater(recommender.checkpoint(), 0)
+        last = RecommenderCheckpoint.objects.get().last_feedback_id
+        votes = list(Feedback.objects.order_by('pk'))
+
+        feedback = Feedback.objects.get(pk=votes[0].pk)
+        feedback.result = 'worse' if feedback.result != 'worse' else 'helped'
+        feedback.save()
+        # Saved without loading the vote first: it is read back, nothing is reset.
+        Feedback(
+            pk=votes[1].pk, mood_id=votes[1].mood_id, intervention=self.interventions[2], result='helped',
+            created_at=votes[1].created_at,
+        ).save()
+        feedback = Feedback.objects.only('pk').get(pk=votes[3].pk)
+        feedback.result = 'no_change' if votes[3].result != 'no_change' else 'worse'
+        feedback.save(update_fields=['result'])
+        votes[2].delete()
+        self.assertEqual(RecommenderCheckpoint.objects.get().last_feedback_id, last)
+        self.assertMatchesRebuild()
+        kept = list(InterventionScore.objects.order_by('pk').values_list('helped', 'no_change', 'worse'))
+        InterventionScore.rebuild()
+        self.assertEqual(kept, list(InterventionScore.objects.order_by('pk').values_list('helped', 'no_change', 'worse')))
+
+    def test_loads_never_checkpoint(self):
+        loaded = recommender.load()
+        self.assertFalse(RecommenderCheckpoint.objects.exists())
+        self.assertEqual(recommender.checkpoint_if_behind(threshold=Feedback.objects.count() + 1), 0)
+        self.assertEqual(recommender.checkpoint_if_behind(threshold=1), Feedback.objects.count())
+        self.assertEqual(recommender.load().stats, loaded.stats)
+
+    def test_replay_credits_the_better_policy(self):
+        keys = recommender.context_keys('anxiety', 8)
+        # Logged under uniform random suggestions: 1 always helps, 2 and 3 never do.
+        log = [(i, i % 3 + 1, 'helped' if i % 3 == 0 else 'worse', keys) for i in range(600)]
+        results = recommender.replay(log, ['random', 'contextual'], seed=1)
+        self.assertEqual(results, recommender.replay(log, ['random', 'contextual'], seed=1))
+        self.assertEqual(results['random']['events'], 600)
+        self.assertGreater(results['contextual']['mean_reward'], 0.9)
+        self.assertLess(results['random']['mean_reward'], 0.5)
+
+
+class SamplerTests(TestCase):
+    """The Fenwick trees agree with plain sums, and votes move the posteriors the sampler draws from"""
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('sampler', password='not-a-real-password')
+        cls.interventions = create_sample_data(cls.user, moods=12)
+        cls.mood = Mood.objects.filter(user=cls.user, emotion='anxiety').first()
+        # Enough votes for the first intervention to leave exploration.
+        for result in ['helped'] * 8 + ['worse'] * 4:
+            Feedback.objects.create(mood=cls.mood, intervention=cls.interventions[0], result=result)
+
+    def setUp(self):
+        sampler.invalidate()
+        self.addCleanup(sampler.invalidate)
+
+    @staticmethod
+    def reference_find(weights, value):
+        running = 0.0
+        for i, weight in enumerate(weights):
+            running += weight
+            if running > value:
+                return i
+        return len(weights) - 1
+
+    def assertPrefixSums(self, tree):
+        prefix = 0.0
+        for i, weight in enumerate(tree.weights, 1):
+            prefix += weight
+            # tree[i] covers the slots (i - lowbit(i), i].
+            self.assertAlmostEqual(tree.tree[i], sum(tree.weights[i - (i & -i):i]))
+        self.assertAlmostEqual(tree.total, prefix)
+
+    def test_updates_keep_prefix_sums(self):
+        rng = random.Random(7)
+        weights = [rng.choice([0.0, rng.random()]) for _ in range(37)]
+        tree = sampler.FenwickTree(weights)
+        self.assertPrefixSums(tree)
+        for _ in range(200):
+            tree.set(rng.randrange(len(weights)), rng.choice([0.0, rng.random()]))
+        self.assertPrefixSums(tree)
+        rebuilt = sampler.FenwickTree(tree.weights)
+        for kept, fresh in zip(tree.tree, rebuilt.tree):
+            self.assertAlmostEqual(kept, fresh)
+
+        for _ in range(500):
+            value = rng.random() * tree.total
+            self.assertEqual(tree.find(value), self.reference_find(tree.weights, value))
+
+    def test_draws_match_reference(self):
+        weights = [0.5, 0.0, 2.0, 1.0, 0.0, 0.5]
+        tree = sampler.FenwickTree(weights)
+        draws = [tree.sample(random.Random(seed)) for seed in range(2000)]
+        expected = [self.reference_find(weights, random.Random(seed).random() * sum(weights)) for seed in range(2000)]
+        self.assertEqual(draws, expected)
+        self.assertNotIn(1, draws)
+        self.assertNotIn(4, draws)
+        share = draws.count(2) / len(draws)
+        self.assertAlmostEqual(share, 0.5, delta=0.05)
+        self.assertIsNone(sampler.FenwickTree([0.0, 0.0]).sample(random.Random(0)))
+
+    def test_feedback_and_invalidate_update_posteriors(self):
+        first, second, _ = self.interventions
+        index = sampler.get_index()
+        self.assertIs(sampler.get_index(), index)
+        i, j = index.positions[first.pk], index.positions[second.pk]
+        helped, no_change, worse = InterventionScore.objects.filter(pk=first.pk).values_list(
+            'helped', 'no_change', 'worse').get()
+        self.assertEqual(index.params(i), (helped + no_change / 2 + 1, worse + no_change / 2 + 1))
+        # Still explored: kept out of the trees until EXPLORE_VOTES.
+        self.assertIn(j, index.new_positions)
+        self.assertEqual(index.trees[None].weights[j], 0.0)
+        self.assertGreater(index.trees[None].weights[i], 0.0)
+
+        alpha, beta = index.params(i)
+        anxious_alpha, anxious_beta = index.counts['anxiety'][i]
+        Feedback.objects.create(mood=self.mood, intervention=first, result='helped')
+        vote = Feedback.objects.create(mood=self.mood, intervention=first, result='no_change')
+        Feedback.objects.create(mood=self.mood, intervention=first, result='worse')
+        vote.delete()
+        self.assertEqual(index.params(i), (alpha + 1, beta + 1))
+        self.assertEqual(index.counts['anxiety'][i], [anxious_alpha + 1, anxious_beta + 1])
+        self.assertAlmostEqual(index.trees[None].weights[i], (alpha + 1) / (alpha + beta + 2))
+        self.assertPrefixSums(index.trees[None])
+        self.assertPrefixSums(index.trees['anxiety'])
+
+        sampler.invalidate()
+        self.assertFalse(sampler.is_loaded())
+        reloaded = sampler.get_index()
+        self.assertIsNot(reloaded, index)
+        self.assertEqual(reloaded.params(i), index.params(i))
+        self.assertEqual(reloaded.params(i, 'anxiety'), index.params(i, 'anxiety'))
+        self.assertEqual(reloaded.votes, index.votes)
+
+        draws = [reloaded.sample('anxiety', rng=random.Random(seed)) for seed in range(50)]
+        self.assertEqual(draws, [reloaded.sample('anxiety', rng=random.Random(seed)) for seed in range(50)])
+        self.assertLessEqual(set(draws), {pk for pk in reloaded.ids})
+
+
+class CachingTests(TestCase):
+    """Versioned keys retire on bumps, and concurrent misses compute once"""
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_bumps_retire_versioned_keys(self):
+        key, other = caching.user_key('trend', 1, 'today'), caching.user_key('trend', 2, 'today')
+        rankings = caching.make_key('rankings', scope=caching.INTERVENTIONS)
+        self.assertEqual(key, caching.user_key('trend', 1, 'today'))
+        self.assertNotEqual(key, other)
+
+        caching.bump_user(1)
+        self.assertNotEqual(caching.user_key('trend', 1, 'today'), key)
+        self.assertEqual(caching.user_key('trend', 2, 'today'), other)
+        self.assertEqual(caching.make_key('rankings', scope=caching.INTERVENTIONS), rankings)
+        caching.bump(caching.INTERVENTIONS)
+        self.assertNotEqual(caching.make_key('rankings', scope=caching.INTERVENTIONS), rankings)
+
+        # An evicted version starts over at a new one, never at an old key.
+        key = caching.user_key('trend', 2, 'today')
+        cache.delete(caching.version_key(caching.user_scope(2)))
+        self.assertNotIn(caching.user_key('trend', 2, 'today'), (key, other))
+
+    def test_concurrent_miss_waits_for_the_first(self):
+        compute = mock.Mock(return_value='fresh')
+        self.assertEqual(caching.get_or_set('value', compute), 'fresh')
+        self.assertEqual(caching.get_or_set('value', compute), 'fresh')
+        compute.assert_called_once()
+        self.assertIsNone(cache.get('value:lock'))
+
+        # Another request holds the lock and stores its result while this one waits.
+        self.assertTrue(cache.add('other:lock', 1))
+        with mock.patch('core.caching.time.sleep', side_effect=lambda _: cache.set('other', 'theirs')):
+            self.assertEqual(caching.get_or_set('other', compute), 'theirs')
+        compute.assert_called_once()
+
+        # The holder never finishes: compute after WAIT_TIMEOUT, leaving its lock alone.
+        self.assertTrue(cache.add('stuck:lock', 1))
+        with mock.patch('core.caching.time.sleep'), mock.patch.object(caching, 'WAIT_TIMEOUT', 0):
+            self.assertEqual(caching.get_or_set('stuck', compute), 'fresh')
+        self.assertEqual(cache.get('stuck:lock'), 1)
+
+        self.assertEqual(caching.get_or_set('skipped', compute, should_cache=lambda value: False), 'fresh')
+        self.assertIsNone(cache.get('skipped'))
+        self.assertIsNone(cache.get('skipped:lock'))
+
+    def test_mood_save_retires_dashboard_fragments(self):
+        user = User.objects.create_user('cached', password='not-a-real-password')
+        mood = Mood.objects.create(user=user, emotion='joy', intensity=3)
+        self.client.force_login(user)
+        self.assertContains(self.client.get(reverse('dashboard')), 'Intensity: 3/10')
+
+        # Without a signal the version stays, and the cached fragment is served.
+        Mood.objects.filter(pk=mood.pk).update(intensity=8)
+        self.assertContains(self.client.get(reverse('dashboard')), 'Intensity: 3/10')
+
+        mood.intensity = 9
+        mood.save()
+        response = self.client.get(reverse('dashboard'))
+        self.assertContains(response, 'Intensity: 9/10')
+        self.assertNotContains(response, 'Intensity: 3/10')
+
+        Mood.objects.create(user=user, emotion='anger', intensity=4)
+        response = self.client.get(reverse('dashboard'), headers={'HX-Request': 'true', 'HX-Target': 'recent-moods'})
+        self.assertContains(response, 'Intensity: 4/10')
+
+
+class HeatmapCubeTests(TestCase):
+    """A heatmap cube kept up to date by mood writes matches rebuild_cube()"""
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('cube', password='not-a-real-password')
+        set_user_timezone(cls.user, 'Asia/Tokyo')
+        create_sample_data(cls.user, moods=30)
+
+    def cells(self):
+        return sorted(HeatmapCell.objects.filter(user=self.user, count__gt=0).values_list(
+            'weekday', 'hour', 'emotion', 'count', 'intensity_sum',
+        ))
+
+    def assertMatchesRebuild(self):
+        kept, grid = self.cells(), heatmap.heatmap_grid(self.user.pk)
+        heatmap.rebuild_cube(self.user.pk)
+        self.assertEqual(kept, self.cells())
+        self.assertEqual(grid, heatmap.heatmap_grid(self.user.pk))
+
+    def test_create_edit_and_delete(self):
+        self.assertMatchesRebuild()
+        moods = list(Mood.objects.filter(user=self.user).order_by('pk')[:3])
+
+        moods[0].intensity = 10
+        moods[0].emotion = 'fear'
+        moods[0].save()
+        moods[1].timestamp -= timedelta(hours=13)
+        moods[1].save()
+        self.assertMatchesRebuild()
+
+        moods[2].delete()
+        Mood.objects.create(user=self.user, emotion='calm', intensity=2, timestamp=moods[1].timestamp)
+        self.assertMatchesRebuild()
+
+    def test_timezone_change_rebuckets_in_a_job(self):
+        kept = self.cells()
+        self.client.force_login(self.user)
+        self.client.cookies['tz'] = 'America/Los_Angeles'
+        self.client.get(reverse('insights_dashboard'))
+        self.assertEqual(get_user_timezone(self.user.pk).key, 'America/Los_Angeles')
+        # The request only queued the rebuild.
+        self.assertEqual(self.cells(), kept)
+        job = Job.objects.get(kind='rebucket', user=self.user)
+        self.assertLessEqual(job.run_after, timezone.now())
+
+        self.assertTrue(jobs.run(job))
+        self.assertNotEqual(self.cells(), kept)
+        self.assertMatchesRebuild()
+        self.assertEqual(rollups.check_user(self.user.pk), [])
+
+
+class DailyRollupTests(TestCase):
+    """Daily rollups kept up to date by mood writes match rebuild_user()"""
+    FIELDS = ['date', *rollups.UPDATE_FIELDS]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('rollup', password='not-a-real-password')
+        set_user_timezone(cls.user, 'America/New_York')
+        create_sample_data(cls.user, moods=30)
+
+    def rows(self):
+        return list(DailyRollup.objects.filter(user=self.user).order_by('date').values_list(*self.FIELDS))
+
+    def assertMatchesRebuild(self):
+        self.assertEqual(rollups.check_user(self.user.pk), [])
+        kept = self.rows()
+        rollups.rebuild_user(self.user.pk)
+        self.assertEqual(kept, self.rows())
+
+    def test_create_edit_and_delete(self):
+        self.assertMatchesRebuild()
+        moods = list(Mood.objects.filter(user=self.user).order_by('pk')[:3])
+
+        moods[0].intensity = 1
+        moods[0].emotion = 'anger'
+        moods[0].save()
+        # Onto another local day, leaving its old one with one mood fewer.
+        moods[1].timestamp -= timedelta(days=2, hours=5)
+        moods[1].save()
+        self.assertMatchesRebuild()
+
+        # A day of its own, moved to another day and then deleted, must leave no rollup behind.
+        lone = Mood.objects.create(
+            user=self.user, emotion='calm', intensity=9, timestamp=timezone.now() - timedelta(days=90),
+        )
+        self.assertMatchesRebuild()
+        lone.timestamp -= timedelta(days=1)
+        lone.save()
+        self.assertMatchesRebuild()
+
+        lone.delete()
+        moods[2].delete()
+        Mood.objects.create(user=self.user, emotion='calm', intensity=9, timestamp=moods[2].timestamp)
+        self.assertMatchesRebuild()
+
+    def test_moving_a_mood_reads_only_its_days(self):
+        zone = get_user_timezone(self.user.pk)
+        last_year = timezone.now() - timedelta(days=365)
+        mood = Mood.objects.create(user=self.user, emotion='calm', intensity=2, timestamp=last_year)
+        read = []
+        build = rollups.build_rollups
+
+        def counting(user_id, moods, zone):
+            moods = list(moods)
+            read.extend(moods)
+            return build(user_id, moods, zone)
+
+        with mock.patch.object(rollups, 'build_rollups', counting):
+            mood.timestamp = timezone.now()
+            mood.save()
+        days = {rollups.local_date(last_year, zone), rollups.local_date(mood.timestamp, zone)}
+        on_those_days = [
+            timestamp for timestamp in Mood.objects.filter(user=self.user).values_list('timestamp', flat=True)
+            if rollups.local_date(timestamp, zone) in days
+        ]
+        self.assertEqual(len(read), len(on_those_days))
+        self.assertLess(len(read), Mood.objects.filter(user=self.user).count())
+        self.assertMatchesRebuild()
+
+
+class StreakTests(TestCase):
+    """Streaks, gaps and cadence follow local days and every mood write"""
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('streaker', password='not-a-real-password')
+        set_user_timezone(cls.user, 'Pacific/Auckland')
+
+    def setUp(self):
+        self.addCleanup(cache.clear)
+        self.zone = get_user_timezone(self.user.pk)
+        self.today = rollups.local_today(self.zone)
+
+    def at(self, days_ago, hour, minute=0):
+        return rollups.day_bounds(self.today - timedelta(days=days_ago), self.zone)[0] + timedelta(hours=hour, minutes=minute)
+
+    def log(self, timestamp):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Mood.objects.create(user=self.user, emotion='calm', intensity=5, timestamp=timestamp)
+
+    def test_islands_and_summary(self):
+        day = self.today
+        runs = streaks.islands([day - timedelta(days=n) for n in (9, 8, 7, 4, 1, 0)])
+        self.assertEqual(runs, [
+            (day - timedelta(days=9), day - timedelta(days=7)),
+            (day - timedelta(days=4), day - timedelta(days=4)),
+            (day - timedelta(days=1), day),
+        ])
+        summary = streaks.summarize(runs, day)
+        self.assertEqual(summary['current_streak'], 2)
+        self.assertEqual((summary['longest_streak'], summary['longest_streak_start']), (3, day - timedelta(days=9)))
+        self.assertEqual(summary['missed_days'], 4)
+        self.assertEqual(summary['recent_gaps'], [
+            (day - timedelta(days=3), day - timedelta(days=2), 2),
+            (day - timedelta(days=6), day - timedelta(days=5), 2),
+        ])
+        self.assertEqual(summary['cadence'], 6 / 10)
+        # A streak lasts through the day after its last log, then the missed days open a gap.
+        self.assertEqual(streaks.summarize(runs, day + timedelta(days=1))['current_streak'], 2)
+        later = streaks.summarize(runs, day + timedelta(days=3))
+        self.assertEqual(later['current_streak'], 0)
+        self.assertEqual(later['recent_gaps'][0], (day + timedelta(days=1), day + timedelta(days=2), 2))
+        self.assertEqual(streaks.summarize([], day)['current_streak'], 0)
+
+    def test_streak_follows_local_days_and_deletes(self):
+        self.log(self.at(6, 12))
+        lone = self.log(self.at(5, 12))
+        self.log(self.at(1, 23, 30))
+        late = self.log(self.at(0, 0, 30))  # an hour later, but the next local day
+        summary = streaks.get_streaks(self.user.pk)
+        self.assertEqual(summary['current_streak'], 2)
+        self.assertEqual(summary['days_logged'], 4)
+        self.assertEqual(summary['cadence'], 4 / 7)
+        self.assertEqual(summary['missed_days'], 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            lone.delete()
+        summary = streaks.get_streaks(self.user.pk)
+        self.assertEqual(summary['days_logged'], 3)
+        self.assertEqual(summary['cadence'], 3 / 7)
+        self.assertEqual(summary['recent_gaps'], [(self.today - timedelta(days=5), self.today - timedelta(days=2), 4)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            late.timestamp -= timedelta(hours=1)
+            late.save()
+        self.assertEqual(streaks.get_streaks(self.user.pk)['current_streak'], 1)
+
+    def test_cache_is_dropped_after_the_commit(self):
+        self.log(self.at(1, 9))
+        stale = streaks.get_islands(self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            Mood.objects.create(user=self.user, emotion='joy', intensity=5, timestamp=self.at(0, 9))
+            # A dashboard read racing the write caches the days from before it.
+            cache.set(streaks.cache_key(self.user.pk), stale)
+        self.assertEqual(streaks.get_streaks(self.user.pk)['current_streak'], 2)
+
+
+class JobTests(TestCase):
+    """Workers share the queue fairly, retry failures with backoff and keep insights current"""
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(f'queued{i}', password='not-a-real-password') for i in range(4)]
+
+    def setUp(self):
+        self.addCleanup(cache.clear)
+        # Mood writes queue insights; start from an empty queue.
+        Job.objects.all().delete()
+
+    def queue(self, kind, user, seconds_ago=60):
+        return Job.objects.create(kind=kind, user=user, run_after=timezone.now() - timedelta(seconds=seconds_ago))
+
+    def test_claim_skips_busy_users_and_respects_the_limit(self):
+        busy = self.users[0]
+        Job.objects.create(kind='insights', user=busy, status=Job.RUNNING, started_at=timezone.now(), worker='w0')
+        # Oldest first, and all of them the busy user's: they must not starve the others.
+        for i in range(12):
+            self.queue(f'kind{i}', busy, seconds_ago=600 - i)
+        for user in self.users[1:]:
+            self.queue('insights', user)
+
+        first = jobs.claim('w1', limit=3)
+        second = jobs.claim('w2', limit=3)
+        self.assertEqual(len(first), 2)
+        self.assertEqual(second, [])
+        self.assertEqual(len({job.user_id for job in first}), 2)
+        self.assertNotIn(busy.pk, {job.user_id for job in first})
+        self.assertEqual(Job.objects.filter(status=Job.RUNNING).count(), 3)
+
+        Job.objects.filter(worker='w0').delete()
+        claimed = jobs.claim('w2', limit=4)
+        self.assertEqual({job.user_id for job in claimed}, {busy.pk, self.users[3].pk})
+
+    def test_failures_are_retried_then_kept_then_purged(self):
+        job = self.queue('boom', self.users[0])
+        with mock.patch.object(jobs, 'handlers', return_value={'boom': mock.Mock(side_effect=RuntimeError('down'))}):
+            for attempt in range(1, jobs.MAX_ATTEMPTS + 1):
+                Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+                [claimed] = jobs.claim('w1')
+                with self.assertLogs('core.jobs', 'ERROR'):
+                    self.assertFalse(jobs.run(claimed))
+                job.refresh_from_db()
+                self.assertEqual((job.attempts, job.error), (attempt, 'RuntimeError: down'))
+                if attempt < jobs.MAX_ATTEMPTS:
+                    self.assertEqual(job.status, Job.PENDING)
+                    delay = timedelta(seconds=jobs.RETRY_DELAY * 2 ** (attempt - 1))
+                    self.assertGreater(job.run_after, timezone.now() + delay - timedelta(seconds=5))
+                    self.assertEqual(jobs.claim('w1'), [])
+        self.assertEqual(job.status, Job.FAILED)
+
+        self.assertEqual(jobs.purge_failed(), 0)
+        self.assertEqual(jobs.purge_failed(now=timezone.now() + timedelta(seconds=jobs.FAILED_KEEP + 1)), 1)
+
+    def test_stale_jobs_are_recovered(self):
+        self.queue('insights', self.users[0])
+        [job] = jobs.claim('w1')
+        self.assertEqual(jobs.recover_stale(), 0)
+        self.assertEqual(jobs.recover_stale(now=timezone.now() + timedelta(seconds=jobs.STALE_AFTER + 1)), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.PENDING, 1))
+
+        # With a fresh run already queued, that run stands in for the retry.
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        self.assertEqual(jobs.claim('w1'), [job])
+        jobs.enqueue('insights', self.users[0].pk, delay=0)
+        jobs.recover_stale(now=timezone.now() + timedelta(seconds=jobs.RETRY_DELAY * 4 + jobs.STALE_AFTER))
+        self.assertEqual(list(Job.objects.values_list('status', 'attempts')), [(Job.PENDING, 0)])
+
+    def test_insights_job_feeds_the_insights_page(self):
+        user = self.users[1]
+        self.client.force_login(user)
+        response = self.client.get(reverse('insights_dashboard'))
+        self.assertTrue(response.context['pending'])
+        self.assertTrue(Job.objects.filter(kind='insights', user=user, run_after__lte=timezone.now()).exists())
+
+        create_sample_data(user, moods=30)
+        Job.objects.update(run_after=timezone.now())
+        self.assertTrue(all(jobs.run(job) for job in jobs.claim('w1', limit=10)))
+        self.assertFalse(Job.objects.exists())
+
+        response = self.client.get(reverse('insights_dashboard'))
+        self.assertFalse(response.context['pending'])
+        insight = Insight.objects.get(user=user)
+        self.assertEqual(response.context['insights'], insight.items)
+        self.assertIn('weekday', [item['kind'] for item in insight.items])
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('exporter', password='not-a-real-password')
+        create_sample_data(cls.user, moods=3)
+
+    def test_malformed_filters_are_rejected(self):
+        self.client.force_login(self.user)
+        for params in [{'start_date': '2024-13-45'}, {'format': 'ndjson', 'start_date': 'bad'}, {'end_date': 'bad'}]:
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(reverse('export_moods'), params).status_code, 400)
+
+    async def test_asgi_export_streams_chunk_by_chunk(self):
+        await Mood.objects.abulk_create(
+            Mood(user=self.user, emotion='calm', intensity=i % 10 + 1) for i in range(exports.CHUNK_SIZE + 7)
+        )
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('export_moods'))
+        # A sync iterator here would have been collected into a list before sending.
+        self.assertTrue(response.is_async)
+        rows = [chunk.decode().count('\n') async for chunk in response.streaming_content]
+        self.assertEqual(rows, [1, exports.CHUNK_SIZE, 10])
+
+
+class IngestTests(TestCase):
+    """Bulk ingest stores valid batches with their tags and aggregates, and rejects bad records by index"""
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('importer', password='not-a-real-password')
+        cls.other = User.objects.create_user('bystander', password='not-a-real-password')
+        set_user_timezone(cls.user, 'Europe/Berlin')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.addCleanup(cache.clear)
+
+    def post(self, payload):
+        return self.client.post(reverse('api_moods'), payload, content_type='application/json')
+
+    def cube(self):
+        return sorted(HeatmapCell.objects.filter(user=self.user, count__gt=0).values_list(
+            'weekday', 'hour', 'emotion', 'count', 'intensity_sum',
+        ))
+
+    def test_api_stores_moods_tags_and_aggregates(self):
+        response = self.post({'moods': [
+            {'emotion': 'joy', 'intensity': 7, 'timestamp': '2026-03-01T23:30:00Z', 'tags': [' Work ', 'work']},
+            {'emotion': 'anxiety', 'intensity': '4', 'tags': 'work, Late  Night', 'note': 'deadline kayak'},
+            {'emotion': 'calm', 'intensity': 2, 'timestamp': '2026-03-02T08:00:00', 'user_id': self.user.pk},
+        ]})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {'created': 3})
+
+        moods = list(Mood.objects.filter(user=self.user).order_by('pk'))
+        self.assertEqual([mood.intensity for mood in moods], [7, 4, 2])
+        self.assertEqual([sorted(mood.tags.values_list('name', flat=True)) for mood in moods], [
+            ['work'], ['late night', 'work'], [],
+        ])
+        self.assertEqual(Tag.objects.filter(name='work').count(), 1)
+
+        self.assertEqual(rollups.check_user(self.user.pk), [])
+        cube = self.cube()
+        heatmap.rebuild_cube(self.user.pk)
+        self.assertEqual(cube, self.cube())
+        print('AVAIL', search.is_available(), search.__file__)
+        if search.is_available():
+            self.assertEqual([mood.pk for mood in search.search(self.user.pk, 'kayak')[0]], [moods[1].pk])
+
+    def test_api_rejects_bad_requests(self):
+        self.assertEqual(self.post('not json').status_code, 400)
+        self.assertEqual(self.post({'moods': 'joy'}).status_code, 400)
+        too_many = [{'emotion': 'joy', 'intensity': 5}] * (ingest.MAX_REQUEST_MOODS + 1)
+        self.assertEqual(self.post(too_many).status_code, 413)
+
+        response = self.post([
+            {'emotion': 'joy', 'intensity': 5},
+            {'emotion': 'glee', 'intensity': 5},
+            {'emotion': 'joy', 'intensity': 11},
+            {'emotion': 'joy', 'intensity': True},
+            {'emotion': 'joy', 'intensity': 5, 'note': 'x' * (ingest.NOTE_MAX_LENGTH + 1)},
+            {'emotion': 'joy', 'intensity': 5, 'timestamp': 'yesterday'},
+            {'emotion': 'joy', 'intensity': 5, 'tags': {'work': True}},
+            {'emotion': 'joy', 'intensity': 5, 'user_id': self.other.pk},
+            'joy',
+        ])
+        self.assertEqual(response.status_code, 400)
+        errors = {error['index']: error['error'] for error in response.json()['errors']}
+        self.assertEqual(sorted(errors), [1, 2, 3, 4, 5, 6, 7, 8])
+        self.assertIn('emotion', errors[1])
+        self.assertIn('intensity', errors[2])
+        self.assertIn('500 characters', errors[4])
+        self.assertIn('timestamp', errors[5])
+        self.assertIn('tags', errors[6])
+        self.assertIn('user_id', errors[7])
+        # All or nothing: the valid record was not stored either.
+        self.assertFalse(Mood.objects.exists())
+
+    def test_batches_skip_invalid_records(self):
+        records = [
+            {'user_id': self.user.pk, 'emotion': 'joy', 'intensity': 5, 'tags': ['gym']},
+            {'user_id': self.other.pk, 'emotion': 'calm', 'intensity': 3},
+            {'user_id': 999999, 'emotion': 'calm', 'intensity': 3},
+            {'user_id': self.user.pk, 'emotion': 'sadness', 'intensity': 8},
+            {'emotion': 'joy', 'intensity': 5},
+        ]
+        with self.assertRaises(ingest.IngestError) as raised:
+            ingest.ingest(records)
+        self.assertEqual([index for index, message in raised.exception.errors], [2, 4])
+
+        result = ingest.ingest(records, skip_invalid=True, batch_size=2)
+        self.assertEqual(result['created'], 3)
+        self.assertEqual([index for index, message in result['errors']], [2, 4])
+        self.assertEqual(Mood.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(Mood.objects.filter(user=self.other).count(), 1)
+        for user in (self.user, self.other):
+            self.assertEqual(rollups.check_user(user.pk), [])
+
+
+class SyncTests(TestCase):
+    """A client syncing with `since` learns about created, edited and deleted moods"""
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('syncer', password='not-a-real-password')
+        create_sample_data(cls.user, moods=6)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def sync(self, name, key, since, **params):
+        """Ids from every page of a sync endpoint"""
+        ids, params = [], {'since': since.isoformat(), 'limit': 2, **params}
+        while True:
+            response = self.client.get(reverse(name), params)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            ids += [item['id'] for item in data[key]]
+            if not data['next_cursor']:
+                return ids
+            params['cursor'] = data['next_cursor']
+
+    def test_deletes_are_synced(self):
+        since = timezone.now()
+        moods = list(Mood.objects.filter(user=self.user).order_by('pk'))
+        deleted = [mood.pk for mood in moods[1:4]]
+        moods[0].intensity = 1
+        moods[0].save()
+        Mood.objects.filter(pk__in=deleted[:2]).delete()
+        moods[3].delete()
+
+        self.assertEqual(self.sync('api_moods', 'moods', since, fields='id'), [moods[0].pk])
+        self.assertEqual(sorted(self.sync('api_deleted_moods', 'deleted', since)), deleted)
+        self.assertEqual(self.sync('api_deleted_moods', 'deleted', timezone.now()), [])
+
+    def test_deleting_the_user_removes_its_tombstones(self):
+        Mood.objects.filter(user=self.user).first().delete()
+        self.user.delete()
+        self.assertFalse(MoodTombstone.objects.exists())
+
+
+class MoodTagTests(TestCase):
+    """set_mood_tags() and the m2m receivers keep tag-derived state in step"""
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('tagger', password='not-a-real-password')
+        cls.mood = Mood.objects.create(user=cls.user, emotion='joy', intensity=5)
+
+    def setUp(self):
+        # Tag ids cached by core.tags would outlive the rolled-back tags.
+        self.addCleanup(cache.clear)
+
+    def names(self):
+        return sorted(MoodTag.objects.filter(mood=self.mood).values_list('tag__name', flat=True))
+
+    def assertCountsMatchRebuild(self):
+        kept = tags.user_tag_counts(self.user.pk)
+        cache.clear()
+        self.assertEqual(kept, tags.user_tag_counts(self.user.pk))
+
+    def mood_updates(self, change):
+        with CaptureQueriesContext(connection) as ctx:
+            change()
+        return [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE "core_mood" ')]
+
+    def test_names_are_normalized(self):
+        self.assertEqual(tags.parse(' Deep  Work, deep work,HOME,, '), ['deep work', 'home'])
+        self.assertEqual(tags.parse(['Gym', 'gym ']), ['gym'])
+        with self.assertRaises(ValueError):
+            tags.parse(['x' * (tags.MAX_LENGTH + 1)])
+
+    def test_only_the_difference_is_written(self):
+        # Committing caches the new tags' ids, so resolving them again needs no writes.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(tags.set_mood_tags(self.mood, ['Work', ' work', 'HOME']))
+        self.assertEqual(self.names(), ['home', 'work'])
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertFalse(tags.set_mood_tags(self.mood, ['home', 'WORK']))
+        self.assertEqual([q['sql'] for q in ctx.captured_queries if not q['sql'].startswith('SELECT')], [])
+        self.assertCountsMatchRebuild()
+
+        self.assertTrue(tags.set_mood_tags(self.mood, ['work', 'gym']))
+        self.assertEqual(self.names(), ['gym', 'work'])
+        self.assertEqual(Tag.objects.filter(name__iexact='work').count(), 1)
+        self.assertCountsMatchRebuild()
+
+    def test_clearing_marks_the_mood_changed_once(self):
+        tags.set_mood_tags(self.mood, ['work', 'home'])
+        self.assertEqual(len(self.mood_updates(self.mood.tags.clear)), 1)
+        tags.set_mood_tags(self.mood, ['work'])
+        self.assertEqual(len(self.mood_updates(Tag.objects.get(name='work').mood_set.clear)), 1)
+        self.assertEqual(self.names(), [])
+        self.assertCountsMatchRebuild()
+
+
+class TagAutocompleteTests(TestCase):
+    """suggest() completes the last name in the field from a process-local TagIndex"""
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('typist', password='not-a-real-password')
+        cls.other = User.objects.create_user('bystander', password='not-a-real-password')
+        for name in ['work', 'workout', 'walk', 'home', 'Straße', 'worship']:
+            Tag.objects.create(name=tags.normalize(name))
+        mood = Mood.objects.create(user=cls.user, emotion='joy', intensity=5)
+        tags.set_mood_tags(mood, ['worship', 'walk'])
+        mood = Mood.objects.create(user=cls.user, emotion='calm', intensity=4)
+        tags.set_mood_tags(mood, ['worship'])
+
+    def setUp(self):
+        self.addCleanup(cache.clear)
+        patcher = mock.patch.object(tags, '_index', tags.TagIndex())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_prefix_matching_and_normalization(self):
+        self.assertEqual(tags.suggest(self.other.pk, 'wo'), ['work', 'workout', 'worship'])
+        self.assertEqual(tags.suggest(self.other.pk, '  WO'), ['work', 'workout', 'worship'])
+        self.assertEqual(tags.suggest(self.other.pk, 'STRASS'), ['strasse'])
+        self.assertEqual(tags.suggest(self.other.pk, 'x'), [])
+        # Names already in the field are skipped; only the last one is completed.
+        self.assertEqual(tags.suggest(self.other.pk, 'Work, home, wo'), ['workout', 'worship'])
+        # The user's own tags come first, most used first, even with an empty prefix.
+        self.assertEqual(tags.suggest(self.user.pk, 'w'), ['worship', 'walk', 'work', 'workout'])
+        self.assertEqual(tags.suggest(self.user.pk, ''), ['worship', 'walk'])
+
+    def test_limit(self):
+        Tag.objects.bulk_create([Tag(name=f'walk {i:02}') for i in range(tags.SUGGESTIONS + 4)])
+        suggestions = tags.suggest(self.user.pk, 'wa')
+        self.assertEqual(suggestions, ['walk'] + [f'walk {i:02}' for i in range(tags.SUGGESTIONS - 1)])
+        self.assertEqual(tags.suggest(self.other.pk, 'walk, wa', limit=2), ['walk 00', 'walk 01'])
+        self.assertEqual(tags._index.starting_with('walk ', 3), ['walk 00', 'walk 01', 'walk 02'])
+
+    def test_index_picks_up_new_and_renamed_tags(self):
+        self.assertEqual(tags.suggest(self.other.pk, 'gy'), [])
+        # Committed through resolve() in this process: indexed at once.
+        with self.captureOnCommitCallbacks(execute=True):
+            tags.resolve(['Gym'])
+        self.assertEqual(tags.suggest(self.other.pk, 'gy'), ['gym'])
+
+        # Created by another process: found by id after REFRESH_INTERVAL.
+        Tag.objects.bulk_create([Tag(name='gymnastics')])
+        self.assertEqual(tags.suggest(self.other.pk, 'gy'), ['gym'])
+        with mock.patch('core.tags.time.monotonic', return_value=time.monotonic() + tags.REFRESH_INTERVAL + 1):
+            self.assertEqual(tags.suggest(self.other.pk, 'gy'), ['gym', 'gymnastics'])
+
+        tag = Tag.objects.get(name='gymnastics')
+        tag.name = 'yoga'
+        tag.save()
+        self.assertEqual(tags.suggest(self.other.pk, 'gy'), ['gym'])
+        self.assertEqual(tags.suggest(self.other.pk, 'yo'), ['yoga'])
+
+    def test_view(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('tag_autocomplete'), {'tags': 'home, WO'})
+        content = response.content.decode()
+        positions = [content.find(f'data-tag="{name}"') for name in ['worship', 'work', 'workout']]
+        self.assertNotIn(-1, positions)
+        self.assertEqual(positions, sorted(positions))
+        self.assertNotContains(response, 'data-tag="home"')
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('tag_autocomplete'), {'tags': 'wo'}).status_code, 302)
+
+
+@override_settings(MOOD_HOT_MONTHS=1)
+class ArchiveTests(TestCase):
+    """Aggregates stay consistent once a month of moods is archived"""
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('archivist', password='not-a-real-password')
+        set_user_timezone(cls.user, 'America/New_York')
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.cutoff = MoodArchive.hot_cutoff()
+        Mood.objects.create(user=self.user, emotion='sadness', intensity=3, timestamp=self.cutoff - timedelta(hours=6))
+        archive.archive_month(MoodArchive.month_start(self.cutoff.date(), -1), directory)
+        self.zone = rollups.get_user_timezone(self.user.pk)
+        self.day = rollups.local_date(self.cutoff, self.zone)
+
+    def rollup(self):
+        return DailyRollup.objects.get(user=self.user, date=self.day)
+
+    def test_hot_write_on_the_cutoff_day_keeps_archived_moods(self):
+        # 2h past the UTC cutoff is still the archived mood's local day in New York.
+        mood = Mood.objects.create(
+            user=self.user, emotion='joy', intensity=7, timestamp=self.cutoff + timedelta(hours=2),
+        )
+        self.assertEqual(rollups.local_date(mood.timestamp, self.zone), self.day)
+        self.assertEqual((self.rollup().count, self.rollup().emotion_counts), (2, {'sadness': 1, 'joy': 1}))
+
+        mood.delete()
+        self.assertEqual((self.rollup().count, self.rollup().emotion_counts), (1, {'sadness': 1}))
+        rollups.rebuild_user(self.user.pk)
+        self.assertEqual(self.rollup().count, 1)
+        self.assertEqual(rollups.check_user(self.user.pk), [])
+
+    def test_correlations_compare_live_moods_only(self):
+        work = Tag.objects.create(name='work')
+        for tagged, intensity in [(True, 8), (True, 8), (False, 4), (False, 5)]:
+            mood = Mood.objects.create(user=self.user, emotion='joy', intensity=intensity)
+            if tagged:
+                mood.tags.add(work)
+        # The archived mood's tags are gone, so it must not count on the "without" side either.
+        row, = correlations.compute_correlations(self.user.pk)
+        self.assertEqual((row['tag'], row['mood_count'], row['without_avg']), ('work', 2, 4.5))
+
+
+class NoteSearchTests(TestCase):
+    """The note index follows every write to Mood, and cursors page through each match once"""
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('searcher', password='not-a-real-password')
+        other = User.objects.create_user('neighbour', password='not-a-real-password')
+        for i in range(12):
+            Mood.objects.create(user=cls.user, emotion='calm', intensity=5, note='walk ' * (i % 4 + 1) + f'entry {i}')
+        Mood.objects.create(user=other, emotion='calm', intensity=5, note='walk in the rain')
+
+    def setUp(self):
+        if not search.is_available():
+            self.skipTest('the database has no full-text index')
+
+    def ids(self, query):
+        return sorted(mood.pk for mood in search.search(self.user.pk, query, limit=100)[0])
+
+    def assertMatchesRebuild(self, *queries):
+        kept = [self.ids(query) for query in queries]
+        search.rebuild(optimize=False)
+        self.assertEqual(kept, [self.ids(query) for query in queries])
+
+    def test_index_follows_edits_and_deletes(self):
+        moods = list(Mood.objects.filter(user=self.user).order_by('pk'))
+        moods[0].note = 'quiet evening with a book'
+        moods[0].save()
+        moods[1].delete()
+        Mood.objects.filter(pk=moods[2].pk).update(note='kayak trip')
+        Mood.objects.create(user=self.user, emotion='joy', intensity=7, note='Walking to the kayak club')
+
+        self.assertEqual(len(self.ids('walk')), 10)  # nine left, plus "Walking" by its stem
+        self.assertEqual(self.ids('kayak'), self.ids('kay*'))
+        self.assertEqual(len(self.ids('kayak')), 2)
+        self.assertEqual(self.ids('evening book'), [moods[0].pk])
+        self.assertMatchesRebuild('walk', 'walk*', 'kayak', 'evening', 'entry')
+
+    def test_cursor_pages_cover_every_match_once(self):
+        seen, scores, cursor = [], [], None
+        while True:
+            page, cursor = search.search(self.user.pk, 'walk', cursor=cursor, limit=5)
+            seen += [mood.pk for mood in page]
+            scores += [mood.score for mood in page]
+            if not cursor:
+                break
+        self.assertEqual(sorted(seen), self.ids('walk'))
+        self.assertEqual(len(seen), 12)
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+
+@override_settings(COMMUNITY_MIN_USERS=5)
+class CommunityTests(TestCase):
+    """Merged cubes match rebuild(), and hidden cells can't be worked out from shown ones"""
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(f'member{i}', password='not-a-real-password') for i in range(6)]
+        cls.slot = timezone.now().replace(hour=9, minute=30) - timedelta(days=7)
+
+    def setUp(self):
+        self.addCleanup(cache.clear)
+
+    def log(self, user, emotion, intensity, **kwargs):
+        return Mood.objects.create(user=user, emotion=emotion, intensity=intensity, timestamp=self.slot, **kwargs)
+
+    def cells(self):
+        return sorted(
+            (tag_id or 0, weekday, hour, emotion, count, total, sorted(contributors))
+            for tag_id, weekday, hour, emotion, count, total, contributors in CommunityCell.objects.values_list(
+                'tag_id', 'weekday', 'hour', 'emotion', 'count', 'intensity_sum', 'contributors',
+            )
+        )
+
+    def test_hidden_emotion_is_left_out_of_shares_and_averages(self):
+        for user in self.users[:5]:
+            self.log(user, 'joy', 4)
+        self.log(self.users[5], 'anger', 10)
+        community.merge()
+
+        weekday, hour = heatmap.bucket(self.slot, timezone.get_default_timezone())
+        overall = community.summary()
+        self.assertEqual(overall['hourly']['joy'][hour], 100.0)
+        self.assertIsNone(overall['hourly']['anger'][hour])
+        self.assertEqual(overall['heatmap'], community.summary(emotion='joy')['heatmap'])
+        self.assertEqual(overall['heatmap'][weekday]['data'][hour], 4.0)
+        self.assertEqual(community.summary(emotion='anger')['suppressed'], 1)
+        self.assertEqual(overall['moods'], 6)
+
+    def test_merges_match_rebuild(self):
+        work = Tag.objects.create(name='work')
+        for i, user in enumerate(self.users):
+            self.log(user, ['joy', 'calm'][i % 2], i + 1).tags.add(work)
+        self.assertEqual(community.merge(), 6)
+        self.assertEqual(community.merge(), 0)
+
+        for user in self.users[:3]:
+            self.log(user, 'fear', 7)
+        self.log(self.users[0], 'joy', 2).tags.add(work)
+        self.assertEqual(community.merge(max_batches=1, batch_size=2), 2)
+        self.assertEqual(community.merge(batch_size=2), 2)
+        merged, shown = self.cells(), community.summary(tag_id=work.pk)
+
+        self.assertEqual(community.rebuild(), 10)
+        self.assertEqual(merged, self.cells())
+        self.assertEqual(shown, community.summary(tag_id=work.pk))
+
+    def test_late_commits_are_merged(self):
+        for user in self.users:
+            self.log(user, 'joy', 4)
+        self.assertEqual(community.merge(), 6)
+        # Stamped long before the last merge, committed after it.
+        mood = self.log(self.users[0], 'joy', 8)
+        Mood.objects.filter(pk=mood.pk).update(created_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(community.merge(), 1)
+        self.assertEqual(community.summary()['moods'], 7)
+        self.assertIsNotNone(community.last_merged())
+        # Bulk ingest queues its moods too.
+        ingest.insert_batch([(self.users[1].pk, self.slot, 'calm', 5, '', [])])
+        self.assertEqual(community.merge(), 1)
+
+    @override_settings(COMMUNITY_MIN_USERS=6)  # every user's hash is kept
+    def test_deleted_users_are_taken_out(self):
+        work = Tag.objects.create(name='work')
+        for user in self.users:
+            self.log(user, 'joy', 4).tags.add(work)
+            self.log(user, 'calm', 6)
+        community.merge()
+        leaving = self.users[0]
+        self.log(leaving, 'joy', 9)  # still queued when the user goes
+        who = community.contributor(leaving.pk)
+        self.assertTrue(any(who in seen for seen in CommunityCell.objects.values_list('contributors', flat=True)))
+
+        leaving.delete()
+        self.assertEqual(community.merge(), 0)
+        self.assertFalse(any(who in seen for seen in CommunityCell.objects.values_list('contributors', flat=True)))
+        self.assertEqual(community.summary()['moods'], 10)
+        self.assertEqual(community.summary(tag_id=work.pk)['moods'], 5)
+        counts = [cell[:6] for cell in self.cells()]
+        community.rebuild()
+        self.assertEqual(counts, [cell[:6] for cell in self.cells()])
+
+
+class AdminTests(TestCase):
+    """Bulk actions on the large changelists, and the totals shown after them"""
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', password='not-a-real-password')
+        cls.interventions = create_sample_data(cls.admin, moods=12)
+        cls.spare = [Intervention.objects.create(title=f'Spare {i}', description='Stretch') for i in range(2)]
+
+    def setUp(self):
+        self.addCleanup(cache.clear)
+        self.client.force_login(self.admin)
+
+    def changelist(self, model, **params):
+        response = self.client.get(reverse(f'admin:core_{model}_changelist'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.context['cl']
+
+    def act(self, action, objects, **data):
+        return self.client.post(reverse('admin:core_intervention_changelist'), {
+            'action': action, '_selected_action': [obj.pk for obj in objects], **data,
+        }, follow=True)
+
+    def test_bulk_delete_retires_cached_count(self):
+        self.assertEqual(self.changelist('intervention').result_count, 5)
+        # Written outside the admin: the cached total may lag for COUNT_TIMEOUT.
+        Intervention.objects.create(title='Walk', description='Outside')
+        self.assertEqual(self.changelist('intervention').result_count, 5)
+
+        self.act('delete_selected', self.spare, post='yes')
+        self.assertFalse(Intervention.objects.filter(pk__in=[obj.pk for obj in self.spare]).exists())
+        self.assertEqual(self.changelist('intervention').result_count, 4)
+        self.assertEqual(self.changelist('intervention', is_active__exact=1).result_count, 4)
+
+    def test_activate_and_deactivate(self):
+        self.assertEqual(self.changelist('intervention', is_active__exact=1).result_count, 5)
+        rankings = caching.make_key('rankings', scope=caching.INTERVENTIONS)
+        response = self.act('deactivate', self.interventions[:2])
+        self.assertContains(response, 'Deactivated 2 interventions.')
+        self.assertEqual(Intervention.objects.filter(is_active=False).count(), 2)
+        self.assertNotEqual(caching.make_key('rankings', scope=caching.INTERVENTIONS), rankings)
+        self.assertEqual(self.changelist('intervention', is_active__exact=1).result_count, 3)
+
+        response = self.act('activate', self.interventions)
+        self.assertContains(response, 'Activated 3 interventions.')
+        self.assertFalse(Intervention.objects.filter(is_active=False).exists())
+
+    def test_recompute_scores(self):
+        fields = ('intervention_id', 'helped', 'no_change', 'worse', 'total_votes', 'score')
+        kept = list(InterventionScore.objects.order_by('pk').values_list(*fields))
+        InterventionScore.objects.update(helped=0, no_change=0, worse=0, total_votes=0, score=0.0)
+        first, second, third = self.interventions
+
+        response = self.act('recompute_scores', [first, second])
+        self.assertContains(response, 'Recomputed scores for 2 interventions.')
+        scores = list(InterventionScore.objects.order_by('pk').values_list(*fields))
+        self.assertEqual([row for row in scores if row[0] != third.pk], [row for row in kept if row[0] != third.pk])
+        self.assertEqual(InterventionScore.objects.get(pk=third.pk).total_votes, 0)
+
+    def test_search_goes_through_the_note_index(self):
+        kayak = Mood.objects.create(user=self.admin, emotion='joy', intensity=7, note='Kayak trip at dawn')
+        self.assertEqual(self.changelist('mood', q='   ').result_count, Mood.objects.count())
+        with mock.patch.object(search, 'matching', wraps=search.matching) as matching:
+            cl = self.changelist('mood', q='kayak')
+        matching.assert_called_once()
+        self.assertEqual(matching.call_args.args[1], 'kayak')
+        self.assertEqual([mood.pk for mood in cl.result_list], [kayak.pk])
+        self.assertEqual(self.changelist('mood', q='entry').result_count, 12)
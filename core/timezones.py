@@ -0,0 +1,76 @@
+"""
+Per-user timezone lookup.
+
+Derived per-user aggregates (heatmap cubes, daily rollups) bucket moods
+by the user's local time, so changing a user's timezone rebuilds them:
+from a background job when the change comes in with a request (see
+core.middleware), since the rebuild reads the user's whole history.
+"""
+import zoneinfo
+
+from django.conf import settings
+
+from .models import Profile
+
+
+def get_zone(tzname):
+    """Return a ZoneInfo for tzname, or None if it is not a valid IANA name"""
+    if not tzname:
+        return None
+    try:
+        return zoneinfo.ZoneInfo(tzname)
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+        return None
+
+
+def get_user_timezone(user_id):
+    """Timezone the user's aggregates are bucketed in"""
+    tzname = Profile.objects.filter(user_id=user_id).values_list('timezone', flat=True).first()
+    return get_zone(tzname) or zoneinfo.ZoneInfo(settings.TIME_ZONE)
+
+
+def get_user_timezones(user_ids):
+    """{user id: timezone} for many users with one query"""
+    names = dict(Profile.objects.filter(user_id__in=user_ids).values_list('user_id', 'timezone'))
+    default = zoneinfo.ZoneInfo(settings.TIME_ZONE)
+    return {user_id: get_zone(names.get(user_id)) or default for user_id in user_ids}
+
+
+async def aget_user_timezone(user_id):
+    """get_user_timezone() for async views"""
+    tzname = await Profile.objects.filter(user_id=user_id).values_list('timezone', flat=True).afirst()
+    return get_zone(tzname) or zoneinfo.ZoneInfo(settings.TIME_ZONE)
+
+
+def set_user_timezone(user, tzname, defer=False):
+    """
+    Store a new timezone and rebucket the user's aggregates if it changed;
+    with defer, the rebucketing is queued for `run_jobs` instead.
+    """
+    from . import jobs
+
+    if get_zone(tzname) is None:
+        return False
+    profile, created = Profile.objects.get_or_create(user=user, defaults={'timezone': tzname})
+    if not created and profile.timezone == tzname:
+        return False
+    if not created:
+        profile.timezone = tzname
+        profile.save(update_fields=['timezone'])
+    if defer:
+        jobs.enqueue('rebucket', user.pk, delay=0)
+    else:
+        rebucket_user(user.pk)
+    return True
+
+
+def rebucket_user(user_id):
+    """Rebuild a user's aggregates in their current timezone"""
+    from . import caching, heatmap, jobs, rollups
+    from .signals import publish_refresh
+
+    heatmap.rebuild_cube(user_id)
+    rollups.rebuild_user(user_id)
+    caching.bump_user(user_id)
+    publish_refresh(user_id)
+    jobs.enqueue('insights', user_id)
@@ -18,18 +18,26 @@ urlpatterns = [
     
     # CRUD operations
     path('mood/edit/<int:mood_id>/', views.edit_mood, name='edit_mood'),
+    path('tags/autocomplete/', views.tag_autocomplete, name='tag_autocomplete'),
     path('mood/delete/<int:mood_id>/', views.delete_mood, name='delete_mood'),
     
     # features
-    path('export/', views.export_moods_csv, name='export_moods'),
+    path('export/', views.export_moods, name='export_moods'),
     path('weekly-report/', views.weekly_report, name='weekly_report'),
     path('comparison/', views.comparison_view, name='comparison'),
     path('insights/', views.insights_dashboard, name='insights_dashboard'),
+    path('events/', views.events_stream, name='events'),
+    path('search/', views.search_view, name='search'),
     
     # API
     path('api/moods/', views.api_moods, name='api_moods'),
+    path('api/moods/deleted/', views.api_deleted_moods, name='api_deleted_moods'),
+    path('api/search/', views.api_search, name='api_search'),
     
     # Public intervention pages
     path('interventions/', views.interventions_list, name='interventions_list'),
     path('interventions/submit/', views.submit_intervention, name='submit_intervention'),
+    
+    # Public community aggregates
+    path('community/', views.community_view, name='community'),
 ]
\ No newline at end of file
@@ -1,20 +1,30 @@
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
-from django.db.models import Avg, Count, Q
+from django.core.exceptions import ValidationError
+from django.db.models import Count, F
 from django.utils import timezone
-from datetime import timedelta
-import random
+from django.utils.dateparse import parse_date
+from datetime import datetime, time, timedelta
+import hashlib
 import json
-import csv
-from django.http import HttpResponse
-from django.http import JsonResponse
-
-from .models import Mood, Intervention, Feedback, Tag
+from urllib.parse import urlencode
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import require_http_methods
+
+from .models import Mood, MoodTombstone, Intervention, InterventionScore, Insight
 from .forms import MoodForm, FeedbackForm, InterventionForm
+from . import correlations as tag_correlations
+from . import api, caching, community, events, exports, heatmap, ingest, jobs, recommender, rollups, search, streaks, tags
+from .timezones import aget_user_timezone, get_user_timezone
 
 
+@caching.cache_public_page()
 def home(request):
     """Landing page"""
     return render(request, 'home.html')
@@ -63,83 +73,150 @@ def logout_view(request):
     return redirect('home')
 
 
+async def arender(request, template_name, context=None):
+    """
+    render() for async views. Templates may touch lazy request attributes
+    (request.user, messages) that query the database, so rendering runs
+    in a worker thread.
+    """
+    # Hand the templates the user auser() already loaded instead of loading it again.
+    request.user = await request.auser()
+    return await sync_to_async(render)(request, template_name, context)
 
-    
-@login_required
-def dashboard(request):
+
+FILTER_PARAMS = ('emotion', 'start_date', 'end_date', 'tag')
+
+
+def _parse_day(value):
+    """Local midnight starting the YYYY-MM-DD date in value, or None if it is not a date"""
+    try:
+        day = parse_date(value)
+    except ValueError:
+        raise ValidationError(f'Invalid date: {value}')
+    if day is None:
+        return None
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def filter_moods(moods, params):
     """
-    Main dashboard showing ONLY current user's data
+    Apply the emotion, start_date/end_date and tag filters the dashboard
+    accepts (GET params) to a Mood queryset
     """
-    moods = Mood.objects.filter(user=request.user)
-    
     # Filter by emotion
-    emotion_filter = request.GET.get('emotion')
+    emotion_filter = params.get('emotion')
     if emotion_filter:
         moods = moods.filter(emotion=emotion_filter)
     
-    # Filter by date range
-    start_date = request.GET.get('start_date')
-    end_date = request.GET.get('end_date')
+    # Filter by date range; plain dates are whole days in the current timezone
+    start_date = params.get('start_date')
+    end_date = params.get('end_date')
     if start_date:
-        moods = moods.filter(timestamp__gte=start_date)
+        start_day = _parse_day(start_date)
+        moods = moods.filter(timestamp__gte=start_day or start_date)
     if end_date:
-        moods = moods.filter(timestamp__lte=end_date)
+        end_day = _parse_day(end_date)
+        if end_day:
+            moods = moods.filter(timestamp__lt=end_day + timedelta(days=1))
+        else:
+            moods = moods.filter(timestamp__lte=end_date)
     
     # Filter by tag
-    tag_filter = request.GET.get('tag')
+    tag_filter = params.get('tag')
     if tag_filter:
-        moods = moods.filter(tags__name=tag_filter)
-
-    thirty_days_ago = timezone.now() - timedelta(days=30)
-    recent_moods = Mood.objects.filter(
-        user=request.user,
-        timestamp__gte=thirty_days_ago
-    ).order_by('-timestamp')[:10]
-    
-    # Mood trend for current user only
-    seven_days_ago = timezone.now() - timedelta(days=7)
-    mood_trend = Mood.objects.filter(
-        user=request.user,
-        timestamp__gte=seven_days_ago
-    ).values('timestamp__date').annotate(
-        avg_intensity=Avg('intensity')
-    ).order_by('timestamp__date')
-    
-    # Convert to lists for JSON
-    trend_labels = []
-    trend_data = []
-    for entry in mood_trend:
-        trend_labels.append(str(entry['timestamp__date']))
-        if entry['avg_intensity']:
-            trend_data.append(float(entry['avg_intensity']))
-        else:
-            trend_data.append(0)
+        moods = moods.filter(tags__name=tags.normalize(tag_filter))
     
-    # Top interventions (community-wide)
-    top_interventions = sorted(
-        Intervention.objects.filter(is_active=True),
-        key=lambda x: (x.get_success_score(), x.get_total_votes()),
-        reverse=True
-    )[:5]
+    return moods
+
+
+@login_required
+def dashboard(request):
+    """
+    Main dashboard showing ONLY current user's data, narrowed by the
+    filter_moods() GET params.
+    
+    Query plan on a cold cache, independent of how many moods there are:
+    profile timezone, one aggregate for the mood and feedback counts,
+    the active intervention count, recent moods joined to their suggested
+    intervention, their tags (prefetched), the 7-day rollups, the top
+    interventions with their scores annotated, and the streak islands.
+    Only the first two run when the blocks are cached (core.caching).
+    """
+    filters = {name: request.GET[name] for name in FILTER_PARAMS if request.GET.get(name)}
+    try:
+        moods = filter_moods(Mood.objects.filter(user=request.user), filters)
+    except ValidationError:
+        filters = {}
+        moods = Mood.objects.filter(user=request.user)
+    filter_key = hashlib.md5(urlencode(sorted(filters.items())).encode()).hexdigest()
+    
+    zone = get_user_timezone(request.user.id)
+    today = rollups.local_today(zone)
+    tzname = timezone.get_current_timezone_name()
+    
+    def recent_moods():
+        recent = moods
+        if not ('start_date' in filters or 'end_date' in filters):
+            recent = recent.filter(timestamp__gte=timezone.now() - timedelta(days=30))
+        return {
+            'recent_moods': recent.select_related('suggested_intervention').prefetch_related(
+                'tags'
+            ).order_by('-timestamp')[:10],
+            'filtered': bool(filters),
+        }
+    
+    def mood_trend():
+        # Mood trend for current user only, from the daily rollups
+        mood_trend = rollups.get_rollups(request.user.id, start=today - timedelta(days=6))
+        return {
+            'trend_labels': json.dumps([str(entry.date) for entry in mood_trend]),
+            'trend_data': json.dumps([float(entry.avg_intensity or 0) for entry in mood_trend]),
+        }
     
-    # User's stats
-    total_logs = Mood.objects.filter(user=request.user).count()
-    total_interventions = Intervention.objects.filter(is_active=True).count()
-    total_feedback = Feedback.objects.filter(mood__user=request.user).count()
+    def top_interventions():
+        # Top interventions (community-wide)
+        return {'top_interventions': InterventionScore.top_interventions(limit=5), 'limit': 5}
+    
+    # The blocks are rendered once per version of the user's moods, or of
+    # the community rankings, and then served from the cache (core.caching).
+    blocks = {
+        'recent-moods': lambda: caching.fragment(
+            caching.user_key('dashboard_recent_moods', request.user.id, tzname, filter_key),
+            'fragments/dashboard_recent_moods.html', recent_moods,
+        ),
+        'chart-data': lambda: caching.fragment(
+            caching.user_key('dashboard_trend', request.user.id, today),
+            'fragments/dashboard_trend.html', mood_trend,
+        ),
+        'top-interventions': lambda: caching.fragment(
+            caching.make_key('dashboard_top_interventions', scope=caching.INTERVENTIONS),
+            'fragments/dashboard_top_interventions.html', top_interventions,
+        ),
+    }
+    if request.htmx and request.htmx.target in blocks:
+        # Live updates (static/js/dashboard.js) reload one block at a time.
+        return HttpResponse(blocks[request.htmx.target]())
+    
+    # User's stats, for the moods matching the filters
+    counts = moods.aggregate(total_logs=Count('id', distinct=True), total_feedback=Count('feedback'))
+    total_interventions = caching.get_or_set(
+        caching.make_key('active_interventions', scope=caching.INTERVENTIONS),
+        Intervention.objects.filter(is_active=True).count,
+    )
     
     context = {
-        'recent_moods': recent_moods,
-        'trend_labels': json.dumps(trend_labels),
-        'trend_data': json.dumps(trend_data),
-        'top_interventions': top_interventions,
-        'total_logs': total_logs,
+        'recent_moods': blocks['recent-moods'](),
+        'trend': blocks['chart-data'](),
+        'top_interventions': blocks['top-interventions'](),
+        'total_logs': counts['total_logs'],
         'total_interventions': total_interventions,
-        'total_feedback': total_feedback,
+        'total_feedback': counts['total_feedback'],
+        'streaks': streaks.get_streaks(request.user.id, zone),
+        'filters': filters,
+        'filter_query': urlencode(filters),
+        'emotion_choices': Mood.EMOTION_CHOICES,
     }
     
-    
-    
-    
     return render(request, 'dashboard.html', context)
 
     
@@ -151,15 +228,14 @@ def log_mood(request):
         if form.is_valid():
             mood = form.save(commit=False)
             mood.user = request.user  # Assign to current user
+            # Suggest intervention for this emotion, intensity, tags and time of day
+            mood.suggested_intervention_id = recommender.suggest(
+                mood.emotion, mood.intensity, form.cleaned_data['tags'], timezone.localtime(mood.timestamp).hour
+            )
             mood.save()
             form.save_m2m()  # Save tags
             
-            # Suggest intervention
-            interventions = list(Intervention.objects.filter(is_active=True))
-            if interventions:
-                suggested = random.choice(interventions)
-                mood.suggested_intervention = suggested
-                mood.save()
+            if mood.suggested_intervention_id:
                 return redirect('intervention_suggestion', mood_id=mood.id)
             else:
                 return redirect('dashboard')
@@ -169,6 +245,39 @@ def log_mood(request):
     return render(request, 'log_mood.html', {'form': form})
 
 
+@login_required
+def tag_autocomplete(request):
+    """Suggestions for the mood form's tag field, fetched by htmx as the user types"""
+    suggestions = tags.suggest(request.user.id, request.GET.get('tags', ''))
+    return render(request, 'fragments/tag_suggestions.html', {'suggestions': suggestions})
+
+
+@login_required
+def search_view(request):
+    """
+    Search the user's mood notes (core.search), best match first,
+    narrowed by the dashboard filters. `cursor` pages through the results.
+    """
+    query = request.GET.get('q', '').strip()
+    filters = {name: request.GET[name] for name in FILTER_PARAMS if request.GET.get(name)}
+    results, next_cursor, error = [], None, None
+    if query:
+        try:
+            moods = filter_moods(Mood.objects.filter(user=request.user), filters) if filters else None
+            results, next_cursor = search.search(request.user.id, query, moods, request.GET.get('cursor'))
+        except (api.APIError, ValidationError) as e:
+            error = ' '.join(getattr(e, 'messages', [str(e)]))
+    
+    return render(request, 'search.html', {
+        'query': query,
+        'results': results,
+        'next_query': urlencode({'q': query, **filters, 'cursor': next_cursor}) if next_cursor else None,
+        'error': error,
+        'filters': filters,
+        'emotion_choices': Mood.EMOTION_CHOICES,
+    })
+
+
 @login_required
 def intervention_suggestion(request, mood_id):
     """Show suggested intervention"""
@@ -196,77 +305,80 @@ def intervention_suggestion(request, mood_id):
 
 
 @login_required
-def heatmap_view(request):
+async def heatmap_view(request):
     """Heatmap for current user only"""
-    moods = Mood.objects.filter(user=request.user)
-    
-    heatmap_data = []
-    days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-    
-    for day_idx in range(7):
-        day_data = []
-        for hour in range(24):
-            avg_intensity = moods.filter(
-                timestamp__week_day=day_idx + 2,
-                timestamp__hour=hour
-            ).aggregate(Avg('intensity'))['intensity__avg']
-            
-            day_data.append(round(avg_intensity, 1) if avg_intensity else 0)
-        
-        heatmap_data.append({
-            'day': days[day_idx],
-            'data': day_data
-        })
+    user = await request.auser()
+    emotion_filter = request.GET.get('emotion')
+    heatmap_data = await heatmap.aheatmap_grid(user.pk, emotion=emotion_filter)
     
     context = {
         'heatmap_data': json.dumps(heatmap_data),
         'hours': list(range(24)),
+        'emotion_choices': Mood.EMOTION_CHOICES,
+        'emotion_filter': emotion_filter,
     }
     
-    return render(request, 'heatmap.html', context)
+    return await arender(request, 'heatmap.html', context)
 
 
 @login_required
-def correlations_view(request):
+async def correlations_view(request):
     """Correlations for current user only"""
-    tags = Tag.objects.filter(
-        mood__user=request.user
-    ).annotate(mood_count=Count('mood')).filter(mood_count__gt=0).distinct()
-    
-    correlations = []
-    for tag in tags:
-        avg_intensity = Mood.objects.filter(
-            user=request.user,
-            tags=tag
-        ).aggregate(Avg('intensity'))['intensity__avg']
-        
-        emotion_counts = Mood.objects.filter(
-            user=request.user,
-            tags=tag
-        ).values('emotion').annotate(
-            count=Count('emotion')
-        ).order_by('-count').first()
-        
-        if emotion_counts:
-            correlations.append({
-                'tag': tag.name,
-                'avg_intensity': round(avg_intensity, 1) if avg_intensity else 0,
-                'top_emotion': emotion_counts['emotion'],
-                'mood_count': Mood.objects.filter(user=request.user, tags=tag).count(),
-            })
-    
+    user = await request.auser()
+    correlations = list(await tag_correlations.aget_correlations(user.pk))
     correlations.sort(key=lambda x: x['avg_intensity'], reverse=True)
     
     context = {
         'correlations': correlations,
     }
     
-    return render(request, 'correlations.html', context)
+    return await arender(request, 'correlations.html', context)
 
 
-def interventions_list(request):
-    """List all interventions - public view"""
-    interventions = Intervention.objects.filter(is_active=True)
+@caching.cache_public_page(scope=caching.COMMUNITY)
+def community_view(request):
+    """
+    Anonymized community heatmap and hourly emotion mix, for everyone or
+    one popular tag, read from the materialized cubes (core.community)
+    """
+    popular = community.popular_tags()
+    tag = tags.normalize(request.GET.get('tag', ''))
+    tag_id = next((pk for pk, name in popular if name == tag), None)
+    emotion = request.GET.get('emotion')
+    if emotion not in community.EMOTIONS:
+        emotion = None
+    data = community.summary(tag_id, emotion)
+    
+    context = {
+        'heatmap_data': json.dumps(data['heatmap']),
+        'hourly_data': json.dumps({
+            'labels': [f'{hour}:00' for hour in range(24)],
+            'series': [
+                {'label': label, 'data': data['hourly'][value]}
+                for value, label in Mood.EMOTION_CHOICES
+                if not emotion or value == emotion
+            ],
+        }),
+        'moods': data['moods'],
+        'suppressed': data['suppressed'],
+        'min_users': settings.COMMUNITY_MIN_USERS,
+        'updated': community.last_merged(),
+        'popular_tags': [name for pk, name in popular],
+        'tag_filter': tag if tag_id else '',
+        'emotion_filter': emotion,
+        'emotion_choices': Mood.EMOTION_CHOICES,
+    }
+    
+    return render(request, 'community.html', context)
+
+
+def ranked_interventions():
+    interventions = Intervention.objects.filter(is_active=True).select_related(
+        'score_summary'
+    ).order_by(
+        F('score_summary__score').desc(nulls_last=True),
+        F('score_summary__total_votes').desc(nulls_last=True),
+    )
     
     interventions_with_scores = [
         {
@@ -276,11 +388,18 @@ def interventions_list(request):
         }
         for i in interventions
     ]
-    
-    interventions_with_scores.sort(key=lambda x: (x['score'], x['votes']), reverse=True)
-    
+    return {'interventions': interventions_with_scores}
+
+
+@caching.cache_public_page(scope=caching.INTERVENTIONS)
+def interventions_list(request):
+    """List all interventions - public view"""
+    # The ranking is the same for every visitor, so it is rendered once per scores version.
     context = {
-        'interventions': interventions_with_scores,
+        'interventions': caching.fragment(
+            caching.make_key('interventions_list', timezone.get_current_timezone_name(), scope=caching.INTERVENTIONS),
+            'fragments/interventions_list.html', ranked_interventions,
+        ),
     }
     
     return render(request, 'interventions_list.html', context)
@@ -322,85 +441,85 @@ def edit_mood(request, mood_id):
     
 
 @login_required
-def export_moods_csv(request):
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="my_moods.csv"'
-    
-    writer = csv.writer(response)
-    writer.writerow(['Date', 'Time', 'Emotion', 'Intensity', 'Tags', 'Note'])
-    
-    moods = Mood.objects.filter(user=request.user).order_by('-timestamp')
-    for mood in moods:
-        tags = ', '.join([tag.name for tag in mood.tags.all()])
-        writer.writerow([
-            mood.timestamp.date(),
-            mood.timestamp.time().strftime('%H:%M'),
-            mood.get_emotion_display(),
-            mood.intensity,
-            tags,
-            mood.note or ''
-        ])
-    
+def export_moods(request):
+    """
+    Stream the user's moods, honoring the dashboard filters.
+    ?format= csv (default), ndjson, arrow or parquet
+    """
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in exports.FORMATS:
+        return HttpResponse(f'Unknown export format: {fmt}', status=400)
+    if not exports.is_available(fmt):
+        return HttpResponse(f'{fmt} export requires pyarrow to be installed', status=501)
+    
+    try:
+        moods = filter_moods(Mood.objects.filter(user=request.user), request.GET).order_by('-timestamp')
+    except ValidationError as e:
+        return HttpResponse(' '.join(e.messages), status=400)
+    content_type, extension = exports.FORMATS[fmt]
+    
+    # Under ASGI a sync generator would be read to the end before the first byte goes out.
+    stream = exports.aexport_stream if isinstance(request, ASGIRequest) else exports.export_stream
+    response = StreamingHttpResponse(
+        stream(fmt, moods, timezone.get_current_timezone()),
+        content_type=content_type
+    )
+    response['Content-Disposition'] = f'attachment; filename="my_moods.{extension}"'
     return response
 
 @login_required
-def weekly_report(request):
-    week_ago = timezone.now() - timedelta(days=7)
-    moods = Mood.objects.filter(user=request.user, timestamp__gte=week_ago)
+async def weekly_report(request):
+    user = await request.auser()
+    today = rollups.local_today(await aget_user_timezone(user.pk))
+    days = [d async for d in rollups.get_rollups(user.pk, start=today - timedelta(days=6), end=today)]
+    summary = rollups.summarize(days)
+    
+    emotion_labels = dict(Mood.EMOTION_CHOICES)
+    top_emotion = summary['top_emotion']
+    peak_weekday = max(summary['weekday_avg'], key=summary['weekday_avg'].get) if days else None
     
     report = {
-        'total_logs': moods.count(),
-        'avg_intensity': moods.aggregate(Avg('intensity'))['intensity__avg'],
-        'most_common_emotion': moods.values('emotion').annotate(
-            count=Count('emotion')
-        ).order_by('-count').first(),
-        'peak_day': moods.values('timestamp__week_day').annotate(
-            avg_intensity=Avg('intensity')
-        ).order_by('-avg_intensity').first(),
-        'best_day': moods.order_by('intensity').first(),
-        'worst_day': moods.order_by('-intensity').first(),
+        'start_date': today - timedelta(days=6),
+        'end_date': today,
+        'total_logs': summary['count'],
+        'avg_intensity': summary['avg_intensity'],
+        'most_common_emotion': {
+            'emotion': emotion_labels.get(top_emotion, top_emotion),
+            'count': summary['emotion_counts'][top_emotion],
+        } if top_emotion else None,
+        'emotion_breakdown': [
+            {
+                'emotion': emotion_labels.get(emotion, emotion),
+                'count': count,
+                'percent': round(count / summary['count'] * 100),
+            }
+            for emotion, count in sorted(summary['emotion_counts'].items(), key=lambda x: -x[1])
+        ],
+        'peak_day': {
+            'day': heatmap.DAYS[peak_weekday],
+            'avg_intensity': summary['weekday_avg'][peak_weekday],
+        } if peak_weekday is not None else None,
+        'best_day': min(days, key=lambda d: d.avg_intensity) if days else None,
+        'worst_day': max(days, key=lambda d: d.avg_intensity) if days else None,
     }
     
-    return render(request, 'weekly_report.html', {'report': report})
+    return await arender(request, 'weekly_report.html', {'report': report})
 
 @login_required
-def get_streak(user):
-    moods = Mood.objects.filter(user=user).order_by('-timestamp')
-    if not moods:
-        return 0
-    
-    streak = 1
-    current_date = moods[0].timestamp.date()
-    
-    for mood in moods[1:]:
-        mood_date = mood.timestamp.date()
-        if (current_date - mood_date).days == 1:
-            streak += 1
-            current_date = mood_date
-        elif (current_date - mood_date).days > 1:
-            break
+async def comparison_view(request):
+    user = await request.auser()
+    today = rollups.local_today(await aget_user_timezone(user.pk))
+    week_start = today - timedelta(days=6)
     
-    return streak
-
-
-@login_required
-def comparison_view(request):
-    now = timezone.now()
-    week_ago = now - timedelta(days=7)
-    two_weeks_ago = now - timedelta(days=14)
-    
-    this_week = Mood.objects.filter(user=request.user, timestamp__gte=week_ago)
-    last_week = Mood.objects.filter(
-        user=request.user, 
-        timestamp__gte=two_weeks_ago,
-        timestamp__lt=week_ago
-    )
+    days = [d async for d in rollups.get_rollups(user.pk, start=today - timedelta(days=13), end=today)]
+    this_week = rollups.summarize(d for d in days if d.date >= week_start)
+    last_week = rollups.summarize(d for d in days if d.date < week_start)
     
     comparison = {
-        'this_week_avg': this_week.aggregate(Avg('intensity'))['intensity__avg'] or 0,
-        'last_week_avg': last_week.aggregate(Avg('intensity'))['intensity__avg'] or 0,
-        'this_week_count': this_week.count(),
-        'last_week_count': last_week.count(),
+        'this_week_avg': this_week['avg_intensity'] or 0,
+        'last_week_avg': last_week['avg_intensity'] or 0,
+        'this_week_count': this_week['count'],
+        'last_week_count': last_week['count'],
     }
     
     # Calculate percentage change
@@ -410,71 +529,163 @@ def comparison_view(request):
             / comparison['last_week_avg'] * 100
         )
     
-    return render(request, 'comparison.html', {'comparison': comparison})
+    return await arender(request, 'comparison.html', {'comparison': comparison})
 
 @login_required
 def insights_dashboard(request):
-    moods = Mood.objects.filter(user=request.user)
-    
-    insights = []
-    
-    # Insight 1: Day of week pattern
-    day_stats = {}
-    for day in range(7):
-        day_moods = moods.filter(timestamp__week_day=day+2)
-        if day_moods.exists():
-            day_stats[day] = day_moods.aggregate(Avg('intensity'))['intensity__avg']
-    
-    if day_stats:
-        worst_day = max(day_stats, key=day_stats.get)
-        best_day = min(day_stats, key=day_stats.get)
-        days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-        insights.append({
-            'icon': '📅',
-            'text': f"Your mood is typically better on {days[best_day]}s and harder on {days[worst_day]}s"
-        })
+    """Insights precomputed by the background worker (see core.insights)"""
+    insight = Insight.objects.filter(user=request.user).first()
+    if insight is None:
+        # Never computed yet, e.g. moods logged before insights were precomputed.
+        jobs.enqueue('insights', request.user.id, delay=0)
     
-    # Insight 2: Time of day
-    morning = moods.filter(timestamp__hour__range=(6, 12)).aggregate(Avg('intensity'))
-    evening = moods.filter(timestamp__hour__range=(18, 23)).aggregate(Avg('intensity'))
-    
-    if morning['intensity__avg'] and evening['intensity__avg']:
-        if evening['intensity__avg'] < morning['intensity__avg']:
-            insights.append({
-                'icon': '🌙',
-                'text': f"You're {((morning['intensity__avg'] - evening['intensity__avg']) / morning['intensity__avg'] * 100):.0f}% calmer in the evenings"
-            })
-    
-    # Insight 3: Tag correlations
-    tags = Tag.objects.filter(mood__user=request.user).distinct()
-    tag_insights = []
-    
-    for tag in tags:
-        with_tag = moods.filter(tags=tag).aggregate(Avg('intensity'))['intensity__avg']
-        without_tag = moods.exclude(tags=tag).aggregate(Avg('intensity'))['intensity__avg']
-        
-        if with_tag and without_tag:
-            diff = ((with_tag - without_tag) / without_tag * 100)
-            if abs(diff) > 15:  # Only show significant correlations
-                tag_insights.append({
-                    'icon': '🏷️',
-                    'text': f"#{tag.name} is associated with {abs(diff):.0f}% {'higher' if diff > 0 else 'lower'} intensity"
-                })
-    
-    insights.extend(tag_insights[:3])  # Top 3 tag insights
-    
-    return render(request, 'insights_dashboard.html', {'insights': insights})
+    return render(request, 'insights_dashboard.html', {
+        'insights': insight.items if insight else [],
+        'computed_at': insight.computed_at if insight else None,
+        'pending': insight is None,
+    })
 
 
 
 
 @login_required
-def api_moods(request):
-    moods = Mood.objects.filter(user=request.user).order_by('-timestamp')[:10]
-    data = [{
-        'emotion': mood.emotion,
-        'intensity': mood.intensity,
-        'timestamp': mood.timestamp.isoformat(),
-        'tags': [tag.name for tag in mood.tags.all()]
-    } for mood in moods]
-    return JsonResponse({'moods': data})
\ No newline at end of file
+async def events_stream(request):
+    """
+    Server-sent events patching the user's open dashboard (see core.events).
+    Only served over ASGI, where an idle stream costs no thread.
+    """
+    if not isinstance(request, ASGIRequest):
+        # Under WSGI each stream would pin a worker thread; 204 tells EventSource not to reconnect.
+        return HttpResponse(status=204)
+    user = await request.auser()
+    response = StreamingHttpResponse(events.stream(user.pk), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # don't let nginx buffer the stream
+    return response
+
+
+@login_required
+@require_http_methods(['GET', 'HEAD', 'POST'])
+@cache_control(private=True, no_cache=True)
+@api.moods_condition
+async def api_moods(request):
+    """
+    GET: the user's moods, newest first, `limit` per page (see core.api).
+    Accepts the dashboard filters, `fields=` to pick keys, and `cursor=`
+    from the previous page's next_cursor. With `since=<ISO datetime>`
+    returns moods created or edited after it, oldest change first, for
+    incremental sync; api_deleted_moods() has the ones deleted since.
+    Unchanged responses are answered with 304.
+    
+    POST: bulk ingest, see api_ingest_moods().
+    """
+    if request.method == 'POST':
+        return await sync_to_async(api_ingest_moods)(request)
+    
+    user = await request.auser()
+    try:
+        limit = api.parse_limit(request.GET.get('limit'))
+        fields = api.parse_fields(request.GET.get('fields'))
+        since = api.parse_since(request.GET.get('since'))
+        moods = filter_moods(Mood.objects.filter(user=user), request.GET)
+        if since is not None:
+            moods = moods.filter(updated_at__gt=since)
+        key = 'updated_at' if since is not None else 'timestamp'
+        rows, next_cursor = await api.apaginate(moods, key, request.GET.get('cursor'), limit)
+    except (api.APIError, ValidationError) as e:
+        return JsonResponse({'error': ' '.join(getattr(e, 'messages', [str(e)]))}, status=400)
+    
+    return JsonResponse({
+        'moods': await api.aserialize(rows, fields),
+        'next_cursor': next_cursor,
+    })
+
+
+@login_required
+@require_http_methods(['GET', 'HEAD'])
+@cache_control(private=True, no_cache=True)
+@api.moods_condition
+async def api_deleted_moods(request):
+    """
+    Ids of the user's moods deleted after `since=<ISO datetime>` (or ever),
+    oldest deletion first, `limit` per page with `cursor=`, so a client
+    syncing with api_moods()'s `since` can drop them too.
+    """
+    user = await request.auser()
+    try:
+        limit = api.parse_limit(request.GET.get('limit'))
+        since = api.parse_since(request.GET.get('since'))
+        tombstones = MoodTombstone.objects.filter(user=user)
+        if since is not None:
+            tombstones = tombstones.filter(deleted_at__gt=since)
+        rows, next_cursor = await api.apaginate(
+            tombstones, 'deleted_at', request.GET.get('cursor'), limit, values=('id', 'mood_id', 'deleted_at'),
+        )
+    except api.APIError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    return JsonResponse({
+        'deleted': [{'id': row['mood_id'], 'deleted_at': row['deleted_at'].isoformat()} for row in rows],
+        'next_cursor': next_cursor,
+    })
+
+
+@login_required
+@require_http_methods(['GET', 'HEAD'])
+@cache_control(private=True, no_cache=True)
+def api_search(request):
+    """
+    The user's moods whose notes match `q`, best first, `limit` per page,
+    with the dashboard filters and `cursor=` from the previous page's
+    next_cursor. Snippets are HTML with the matched words in <mark>.
+    """
+    try:
+        limit = api.parse_limit(request.GET.get('limit') or str(search.PAGE_SIZE))
+        filters = {name: request.GET[name] for name in FILTER_PARAMS if request.GET.get(name)}
+        moods = filter_moods(Mood.objects.filter(user=request.user), filters) if filters else None
+        results, next_cursor = search.search(
+            request.user.id, request.GET.get('q', ''), moods, request.GET.get('cursor'), limit,
+        )
+    except (api.APIError, ValidationError) as e:
+        return JsonResponse({'error': ' '.join(getattr(e, 'messages', [str(e)]))}, status=400)
+    
+    return JsonResponse({
+        'results': [{
+            'id': mood.pk,
+            'timestamp': mood.timestamp.isoformat(),
+            'emotion': mood.emotion,
+            'intensity': mood.intensity,
+            'tags': sorted(tag.name for tag in mood.tags.all()),
+            'snippet': mood.snippet,
+            'score': mood.score,
+        } for mood in results],
+        'next_cursor': next_cursor,
+    })
+
+
+def api_ingest_moods(request):
+    """
+    Store up to ingest.MAX_REQUEST_MOODS moods for the current user from a
+    JSON body, either a list of moods or {"moods": [...]}. All-or-nothing:
+    any invalid mood rejects the request with per-index errors.
+    """
+    try:
+        payload = json.loads(request.body)
+    except (ValueError, UnicodeDecodeError):
+        return JsonResponse({'error': 'body must be JSON'}, status=400)
+    records = payload.get('moods') if isinstance(payload, dict) else payload
+    if not isinstance(records, list):
+        return JsonResponse({'error': 'expected a list of moods'}, status=400)
+    if len(records) > ingest.MAX_REQUEST_MOODS:
+        return JsonResponse(
+            {'error': f'at most {ingest.MAX_REQUEST_MOODS} moods per request'}, status=413
+        )
+    
+    try:
+        result = ingest.ingest(records, user_id=request.user.pk)
+    except ingest.IngestError as e:
+        return JsonResponse({
+            'error': str(e),
+            'errors': [{'index': index, 'error': message} for index, message in e.errors],
+        }, status=400)
+    return JsonResponse({'created': result['created']}, status=201)
\ No newline at end of file
@@ -10,11 +10,21 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import importlib.util
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Environment overrides may also come from a .env file (needs python-dotenv).
+if importlib.util.find_spec('dotenv') is not None:
+    from dotenv import load_dotenv
+
+    load_dotenv(BASE_DIR / '.env')
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/6.0/howto/deployment/checklist/
@@ -47,6 +57,8 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.TimezoneMiddleware',
+    'django_htmx.middleware.HtmxMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -74,14 +86,124 @@ WSGI_APPLICATION = 'emotion_map.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
-DATABASES = {
+# DB_ENGINE: sqlite (default) or postgres.
+# SQLite is tuned on every new connection: WAL lets reads run alongside a
+# write, synchronous=NORMAL is safe under WAL, and IMMEDIATE transactions
+# take the write lock up front, so concurrent writers queue for up to
+# DB_TIMEOUT seconds instead of failing with "database is locked".
+# PostgreSQL reads DB_NAME, DB_USER, DB_PASSWORD, DB_HOST and DB_PORT, and
+# keeps connections open for DB_CONN_MAX_AGE seconds (checked before reuse).
+# DB_POOL=1 uses a connection pool instead (needs psycopg 3 with
+# psycopg_pool, i.e. psycopg[binary,pool]; refuses to start without them).
+# DB_STATEMENT_TIMEOUT (ms) cancels runaway queries.
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+if DB_ENGINE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'emotion_map'),
+            'USER': os.environ.get('DB_USER', 'emotion_map'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', '127.0.0.1'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'options': f"-c statement_timeout={os.environ.get('DB_STATEMENT_TIMEOUT', 5000)}",
+            },
+        }
+    }
+    if os.environ.get('DB_POOL', '0') != '0':
+        if importlib.util.find_spec('psycopg') is None or importlib.util.find_spec('psycopg_pool') is None:
+            raise ImproperlyConfigured('DB_POOL needs psycopg 3 and its pool: pip install "psycopg[binary,pool]"')
+        # Pooled connections are returned after each request rather than kept open.
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': 2,
+            'max_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+            'timeout': 10,
+        }
+elif DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME') or BASE_DIR / 'db.sqlite3',
+            'OPTIONS': {
+                'timeout': int(os.environ.get('DB_TIMEOUT', 20)),
+                'transaction_mode': 'IMMEDIATE',
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    'PRAGMA mmap_size=134217728;'
+                    'PRAGMA cache_size=-20000;'
+                    'PRAGMA temp_store=MEMORY;'
+                ),
+            },
+        }
+    }
+else:
+    raise ImproperlyConfigured(f'Unknown DB_ENGINE {DB_ENGINE!r}: use sqlite or postgres')
+
+
+# Cache
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+# CACHE_BACKEND: locmem (default, per process), file (shared by the
+# processes of one host) or redis (shared by every host; needs the redis
+# package, otherwise falls back to locmem). CACHE_LOCATION overrides the
+# directory or redis:// URL.
+# Cached dashboard fragments are retired by bumping a version key in this
+# cache (core.caching.bump_user), so with locmem a write only retires the
+# copies of the process that handled it: other workers keep serving stale
+# fragments until FRAGMENT_TIMEOUT. Use file or redis with more than one
+# worker process.
+
+CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'emotion-map'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', str(BASE_DIR / '.cache')),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://127.0.0.1:6379/1'),
+}
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+if CACHE_BACKEND == 'redis' and importlib.util.find_spec('redis') is None:
+    CACHE_BACKEND = 'locmem'
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND][0],
+        'LOCATION': os.environ.get('CACHE_LOCATION') or CACHE_BACKENDS[CACHE_BACKEND][1],
+        'KEY_PREFIX': os.environ.get('CACHE_KEY_PREFIX', 'emotion-map'),
+        'OPTIONS': {'MAX_ENTRIES': 10000} if CACHE_BACKEND != 'redis' else {},
     }
 }
 
 
+# Live dashboard updates (core.events)
+# EVENTS_BACKEND: core.events.LocalBroker (default) reaches the streams of
+# one process; use core.events.RedisBroker when running several ASGI workers.
+
+EVENTS_BACKEND = os.environ.get('EVENTS_BACKEND', 'core.events.LocalBroker')
+EVENTS_REDIS_URL = os.environ.get('EVENTS_REDIS_URL', 'redis://127.0.0.1:6379/2')
+
+
+# Mood archival (core.archive)
+# `manage.py archive_moods` moves whole UTC months older than
+# MOOD_HOT_MONTHS out of the Mood table into gzipped NDJSON files in
+# MOOD_ARCHIVE_DIR. Once months are archived, MOOD_HOT_MONTHS may be
+# lowered but not raised: writes inside the hot window skip the archive
+# lookup.
+
+MOOD_HOT_MONTHS = int(os.environ.get('MOOD_HOT_MONTHS', 24))
+MOOD_ARCHIVE_DIR = Path(os.environ.get('MOOD_ARCHIVE_DIR') or BASE_DIR / 'archive')
+
+
+# Community aggregates (core.community)
+# `manage.py refresh_community` (from cron) merges new moods into the
+# anonymized community cubes. A cell is only shown once at least
+# COMMUNITY_MIN_USERS different users contributed to it.
+
+COMMUNITY_MIN_USERS = int(os.environ.get('COMMUNITY_MIN_USERS', 5))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -0,0 +1,54 @@
+// Community page: share of each emotion per hour of day
+document.addEventListener('DOMContentLoaded', function() {
+    const dataElement = document.getElementById('hourly-data');
+    const canvas = document.getElementById('hourlyChart');
+    if (!dataElement || !canvas) {
+        return;
+    }
+
+    let hourly;
+    try {
+        hourly = JSON.parse(dataElement.textContent);
+    } catch (error) {
+        console.error('Error parsing hourly data:', error);
+        return;
+    }
+
+    const colors = ['#9333ea', '#3b82f6', '#f59e0b', '#ef4444', '#6b7280', '#10b981', '#ec4899', '#14b8a6', '#f97316', '#6366f1'];
+
+    new Chart(canvas.getContext('2d'), {
+        type: 'line',
+        data: {
+            labels: hourly.labels,
+            datasets: hourly.series.map((series, i) => ({
+                label: series.label,
+                data: series.data,  // null where too few people logged: drawn as a gap
+                borderColor: colors[i % colors.length],
+                backgroundColor: colors[i % colors.length],
+                tension: 0.3,
+                spanGaps: false
+            }))
+        },
+        options: {
+            responsive: true,
+            plugins: {
+                tooltip: {
+                    callbacks: {
+                        label: function(context) {
+                            return context.dataset.label + ': ' + context.parsed.y + '%';
+                        }
+                    }
+                }
+            },
+            scales: {
+                y: {
+                    min: 0,
+                    title: {
+                        display: true,
+                        text: '% of moods logged in the hour'
+                    }
+                }
+            }
+        }
+    });
+});
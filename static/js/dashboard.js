@@ -111,4 +111,189 @@ document.addEventListener('DOMContentLoaded', function() {
     });
     
     console.log('Dashboard chart initialized successfully');
-});
\ No newline at end of file
+    
+    connectLiveUpdates(chart);
+});
+
+// Live updates: the server pushes small deltas over /events/ (core/events.py)
+function connectLiveUpdates(chart) {
+    if (!window.EventSource) {
+        return;
+    }
+    
+    const source = new EventSource('/events/');
+    source.onmessage = function(message) {
+        let event;
+        try {
+            event = JSON.parse(message.data);
+        } catch (error) {
+            console.error('Error parsing live update:', error);
+            return;
+        }
+        if (event.type === 'mood') {
+            applyMood(event, chart);
+        } else if (event.type === 'score') {
+            applyScore(event);
+        } else if (event.type === 'refresh') {
+            reloadBlock('recent-moods');
+            reloadBlock('top-interventions');
+            reloadChart(chart);
+        }
+    };
+}
+
+// Re-render one dashboard block on the server and swap it in
+function reloadBlock(id) {
+    if (document.getElementById(id)) {
+        htmx.ajax('GET', window.location.href, {target: '#' + id, swap: 'outerHTML'});
+    }
+}
+
+function reloadChart(chart) {
+    fetch(window.location.href, {headers: {'HX-Request': 'true', 'HX-Target': 'chart-data'}})
+        .then(response => response.text())
+        .then(html => {
+            const template = document.createElement('template');
+            template.innerHTML = html;
+            const chartData = JSON.parse(template.content.getElementById('chart-data').textContent);
+            chart.data.labels = chartData.labels;
+            chart.data.datasets[0].data = chartData.data;
+            chart.update();
+        })
+        .catch(error => console.error('Error reloading chart data:', error));
+}
+
+function applyMood(event, chart) {
+    // Trend points are daily averages; a null average means the day emptied.
+    event.trend.forEach(point => {
+        const index = chart.data.labels.indexOf(point.date);
+        if (point.avg === null) {
+            if (index !== -1) {
+                chart.data.labels.splice(index, 1);
+                chart.data.datasets[0].data.splice(index, 1);
+            }
+        } else if (index !== -1) {
+            chart.data.datasets[0].data[index] = point.avg;
+        } else {
+            let at = chart.data.labels.findIndex(label => label > point.date);
+            if (at === -1) {
+                at = chart.data.labels.length;
+            }
+            chart.data.labels.splice(at, 0, point.date);
+            chart.data.datasets[0].data.splice(at, 0, point.avg);
+        }
+    });
+    if (event.trend.length) {
+        chart.update();
+    }
+    
+    const block = document.getElementById('recent-moods');
+    const list = block && block.querySelector('.mood-list');
+    if (!block || !list || block.hasAttribute('data-filtered') || event.action === 'deleted') {
+        // Whether a mood matches the filters, or which one moves up to
+        // replace a deleted one, is the server's call.
+        reloadBlock('recent-moods');
+    } else {
+        upsertMood(block, list, event.action, event.mood);
+    }
+    
+    const totalLogs = document.getElementById('stat-total-logs');
+    if (totalLogs && event.action !== 'updated' && !(block && block.hasAttribute('data-filtered'))) {
+        const delta = event.action === 'created' ? 1 : -1;
+        totalLogs.textContent = Math.max(0, parseInt(totalLogs.textContent, 10) + delta);
+    }
+}
+
+function upsertMood(block, list, action, mood) {
+    const existing = list.querySelector('[data-mood-id="' + mood.id + '"]');
+    if (action === 'updated' && !existing) {
+        return;
+    }
+    const item = existing || list.firstElementChild.cloneNode(true);
+    item.dataset.moodId = mood.id;
+    item.querySelector('.mood-emotion').textContent = mood.emotion_label;
+    item.querySelector('.mood-intensity').textContent = 'Intensity: ' + mood.intensity + '/10';
+    item.querySelector('.mood-timestamp').textContent = new Date(mood.timestamp).toLocaleString(
+        undefined, {month: 'short', day: '2-digit', hour: '2-digit', minute: '2-digit', hour12: false}
+    );
+    const links = item.querySelectorAll('.mood-header a');
+    links[0].href = block.dataset.editUrl.replace('/0/', '/' + mood.id + '/');
+    links[1].href = block.dataset.deleteUrl.replace('/0/', '/' + mood.id + '/');
+    
+    let tags = item.querySelector('.mood-tags');
+    if (tags) {
+        tags.remove();
+    }
+    if (mood.tags.length) {
+        tags = document.createElement('div');
+        tags.className = 'mood-tags';
+        mood.tags.forEach(name => {
+            const tag = document.createElement('span');
+            tag.className = 'tag';
+            tag.textContent = name;
+            tags.appendChild(tag);
+        });
+        item.querySelector('.mood-header').after(tags);
+    }
+    
+    if (!existing) {
+        // A new mood has no suggestion yet; drop the one copied from the template item.
+        item.querySelectorAll(':scope > a').forEach(link => link.remove());
+        list.prepend(item);
+        while (list.children.length > 10) {
+            list.lastElementChild.remove();
+        }
+    }
+}
+
+// Votes go out to every open dashboard, so a reload they cause waits a
+// randomized delay and covers every vote that arrives in the meantime.
+const RANKING_RELOAD_DELAY = 3000;
+let rankingReload = null;
+
+function scheduleRankingReload() {
+    if (rankingReload === null) {
+        rankingReload = setTimeout(() => {
+            rankingReload = null;
+            reloadBlock('top-interventions');
+        }, RANKING_RELOAD_DELAY * (0.5 + Math.random()));
+    }
+}
+
+// Whether an intervention not shown now ranks above the last one shown
+function entersRanking(block, event) {
+    const cards = block.querySelectorAll('[data-intervention-id]');
+    if (cards.length < parseInt(block.dataset.limit, 10)) {
+        return true;
+    }
+    const last = cards[cards.length - 1];
+    const score = parseFloat(last.querySelector('.intervention-score').textContent);
+    const votes = parseInt(last.querySelector('.intervention-vote-count').textContent, 10);
+    return event.score > score || (event.score === score && event.votes > votes);
+}
+
+function applyScore(event) {
+    const block = document.getElementById('top-interventions');
+    if (!block) {
+        return;
+    }
+    const card = block.querySelector('[data-intervention-id="' + event.intervention + '"]');
+    if (!card) {
+        if (entersRanking(block, event)) {
+            scheduleRankingReload();
+        }
+        return;
+    }
+    const score = card.querySelector('.intervention-score');
+    score.textContent = event.score.toFixed(2);
+    score.classList.remove('score-positive', 'score-negative', 'score-neutral');
+    score.classList.add(event.score > 0.5 ? 'score-positive' : event.score < 0 ? 'score-negative' : 'score-neutral');
+    card.querySelector('.intervention-vote-count').textContent = event.votes;
+    
+    // Keep the cards ordered by score
+    const list = card.parentElement;
+    Array.from(list.children)
+        .sort((a, b) => parseFloat(b.querySelector('.intervention-score').textContent) -
+                        parseFloat(a.querySelector('.intervention-score').textContent))
+        .forEach(child => list.appendChild(child));
+}
\ No newline at end of file
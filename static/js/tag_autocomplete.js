@@ -0,0 +1,22 @@
+// Tag autocomplete: htmx fills #tag-suggestions as the user types (see core.tags.suggest);
+// picking a suggestion replaces the name being typed.
+document.addEventListener('click', function(event) {
+    const suggestion = event.target.closest('.tag-suggestion');
+    if (!suggestion) {
+        return;
+    }
+    const box = suggestion.closest('.tag-suggestions');
+    const input = document.getElementById(box.dataset.for);
+    if (!input) {
+        return;
+    }
+    
+    const names = input.value.split(',').map(name => name.trim()).filter(name => name);
+    if (!input.value.trim().endsWith(',')) {
+        names.pop();  // the partial name being completed
+    }
+    names.push(suggestion.dataset.tag);
+    input.value = names.join(', ') + ', ';
+    input.focus();
+    box.innerHTML = '';
+});
@@ -0,0 +1,11 @@
+// Send the browser's timezone so dates and heatmap buckets use local time
+(function() {
+    try {
+        const tz = Intl.DateTimeFormat().resolvedOptions().timeZone;
+        if (tz && !document.cookie.split('; ').includes('tz=' + tz)) {
+            document.cookie = 'tz=' + tz + '; path=/; max-age=31536000; SameSite=Lax';
+        }
+    } catch (error) {
+        console.error('Could not detect timezone:', error);
+    }
+})();